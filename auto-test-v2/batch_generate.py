@@ -0,0 +1,92 @@
+"""
+Offline batch regeneration of the whole test suite
+离线批量生成：通过 Batch API 重新生成 input/ 下的所有测试脚本
+
+使用方法:
+    python batch_generate.py                      # input/*.csv → output/test_<id>.ps1
+    python batch_generate.py "input/case2*.csv" --no-evaluate
+    python batch_generate.py --local              # 不走 Batch API，逐条调用模型（调试用）
+"""
+import argparse
+import glob
+import os
+import sys
+from pathlib import Path
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.batch_runner import BatchRunner, AzureBatchBackend, LocalBatchBackend
+from core.client_pool import get_model_client
+from core.concurrency import concurrency_snapshot, format_concurrency
+from core.priority import LANES, BACKGROUND, priority_lane
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Regenerate test scripts for many cases through the Azure OpenAI Batch API'
+    )
+    parser.add_argument('inputs', nargs='*', default=['input/*.csv'], help='CSV/JSON files or glob patterns (default: input/*.csv)')
+    parser.add_argument('--deployment', default=os.getenv('AZURE_OPENAI_BATCH_DEPLOYMENT') or os.getenv('AZURE_OPENAI_DEPLOYMENT', 'gpt-4.1'),
+                        help='Batch (global-batch) deployment name (default: AZURE_OPENAI_BATCH_DEPLOYMENT)')
+    parser.add_argument('--no-refine', action='store_true', help='Skip the correction job for scripts that fail validation')
+    parser.add_argument('--no-evaluate', action='store_true', help='Skip quality evaluation job')
+    parser.add_argument('--poll-interval', type=float, default=60.0, help='Seconds between batch status polls (default 60)')
+    parser.add_argument('--force', action='store_true', help='Regenerate cases whose outputs are up to date')
+    parser.add_argument('--output-dir', default='output', help='Directory for generated scripts (default: output)')
+    parser.add_argument('--local', action='store_true', help='Run each request through the interactive endpoint instead of the Batch API')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('MODEL_MAX_CONCURRENCY', '8')),
+                        help='Parallel requests for --local; the adaptive concurrency window limits them further (default: MODEL_MAX_CONCURRENCY or 8)')
+    parser.add_argument('--lane', choices=LANES, default=BACKGROUND,
+                        help='Priority lane for model requests (default: background, so interactive GUI requests go first)')
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.inputs for p in glob.glob(pattern)})
+    if not paths:
+        print(f"❌ No input files match: {' '.join(args.inputs)}")
+        sys.exit(1)
+
+    print(f"\n{'='*70}")
+    print(f"  Auto-Test V2 - Batch Script Generation ({len(paths)} cases)")
+    print(f"{'='*70}\n")
+
+    client = get_model_client()
+    if args.local:
+        backend = LocalBatchBackend(lambda body: client.generate_with_context(
+            messages=body['messages'],
+            temperature=body['temperature'],
+            max_tokens=body['max_tokens']
+        ), max_workers=args.workers)
+    else:
+        backend = AzureBatchBackend(client)
+
+    runner = BatchRunner(
+        backend,
+        deployment=args.deployment,
+        output_dir=args.output_dir,
+        job_dir=str(Path(args.output_dir) / 'batch_jobs'),
+        poll_interval=args.poll_interval
+    )
+    with priority_lane(args.lane):
+        summary = runner.run(paths, refine=not args.no_refine, evaluate=not args.no_evaluate,
+                             force=args.force)
+
+    failed = [cid for cid, result in summary.items() if result['error']]
+    skipped = [cid for cid, result in summary.items() if result['skipped']]
+    print(f"\n📊 {len(summary) - len(failed) - len(skipped)}/{len(summary)} scripts generated, {len(skipped)} up to date")
+    for cid, result in summary.items():
+        evaluation = result['evaluation']
+        score = f"{evaluation['overall_score']}/100 ({evaluation['grade']})" if evaluation else '-'
+        if result['skipped']:
+            status = f"⏭️  up to date: {result['output_path']}"
+        else:
+            status = f"❌ {result['error']}" if result['error'] else f"✅ {result['output_path']}"
+        print(f"   {cid:<24} {score:<14} {status}")
+    if concurrency_snapshot():
+        print(format_concurrency())
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
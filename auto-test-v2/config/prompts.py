@@ -86,16 +86,8 @@ ERROR HANDLING:
 - 1605 = product not installed (for uninstall)
 """
 
-TEST_GENERATION_PROMPT = """Given the following TEST SCENARIO and human operation steps as BACKGROUND CONTEXT, generate a goal-oriented PowerShell test script.
-
-TEST SCENARIO: {test_scenario}
-
-BACKGROUND CONTEXT (Human Steps):
-{steps_context}
-
-TEST CASE ID: {test_case_id}
-
- CRITICAL BUG TO AVOID - Service.Status is ENUM, NOT STRING 
+# Rules shared by whole-script and body-only generation (TEST_GENERATION_PROMPT / SCRIPT_BODY_PROMPT)
+COMMAND_RULES = """ CRITICAL BUG TO AVOID - Service.Status is ENUM, NOT STRING 
 Get-Service returns Status as an ENUM type (ServiceControllerStatus).
 -  NEVER WRITE: $svc.Status.Trim() → This will cause runtime error!
 -  NEVER WRITE: ($svc.Status.Trim() -eq "Running") → Crashes script!
@@ -105,8 +97,8 @@ This is the #1 most common error. Check EVERY line that uses Get-Service!
 
 CRITICAL - PRESERVE COMMANDS FROM TEST DOCUMENT:
 **When you see PowerShell commands in the "Action" column, those are THE CORRECT COMMANDS to use.**
-- If Action shows: swmi -Namespace "X" -Class "Y" -Arguments @{{...}}
-  → USE: Set-WmiInstance -Namespace "X" -Class "Y" -Arguments @{{...}} (swmi is the alias)
+- If Action shows: swmi -Namespace "X" -Class "Y" -Arguments @{...}
+  → USE: Set-WmiInstance -Namespace "X" -Class "Y" -Arguments @{...} (swmi is the alias)
   → DO NOT change to: Invoke-WmiMethod or New-CimInstance
 - If Action shows: Get-ItemProperty -Path "..." | Select PropertyName
   → USE: Get-ItemProperty exactly as shown
@@ -124,15 +116,9 @@ CRITICAL - PRESERVE COMMANDS FROM TEST DOCUMENT:
 -  DO NOT replace with "modern" alternatives
 -  DO NOT add unnecessary parameters not in the original
 
-CRITICAL - CODE LENGTH LIMIT:
-- Target script length: 250-300 lines maximum
-- If the test has many steps, use loops and helper functions to consolidate repetitive code
-- Combine similar verification steps into single foreach loops
-- Use concise, clear code - avoid verbose comments
-- MUST complete the entire script including the closing sequence (Summary + Stop-Transcript + Pause)
-- If approaching length limit, prioritize completing the script structure over adding verbose logging
+"""
 
-YOUR TASK:
+TASK_RULES = """YOUR TASK:
 Analyze the TEST SCENARIO and human steps to understand:
 1. **Overall Test Objective** (from TEST SCENARIO): What is the main purpose of this test?
 2. **Software Under Test**: What software is being tested? (e.g., cmdextension.msi)
@@ -202,12 +188,12 @@ CRITICAL - MSI PROPERTY READING (ProductVersion, ProductCode, etc.):
 When you need to read MSI properties WITHOUT installing, you MUST use this EXACT function:
 
 ```powershell
-function Get-MSIProperty {{
+function Get-MSIProperty {
     param(
         [string]$msiPath,
         [string]$property
     )
-    try {{
+    try {
         $installer = New-Object -ComObject WindowsInstaller.Installer
         $database = $installer.GetType().InvokeMember("OpenDatabase", 'InvokeMethod', $null, $installer, @($msiPath, 0))
         $query = "SELECT Value FROM Property WHERE Property = '$property'"
@@ -217,9 +203,9 @@ function Get-MSIProperty {{
         $record = $view.GetType().InvokeMember("Fetch", 'InvokeMethod', $null, $view, $null)
         
         $value = $null
-        if ($record -ne $null) {{
+        if ($record -ne $null) {
             $value = $record.GetType().InvokeMember("StringData", 'GetProperty', $null, $record, 1)
-        }}
+        }
         
         # ALWAYS release COM objects to avoid memory leaks
         # Use $null = assignment to suppress output (not | Out-Null which is slower)
@@ -228,15 +214,15 @@ function Get-MSIProperty {{
         $null = [System.Runtime.InteropServices.Marshal]::ReleaseComObject($installer)
         
         # Return trimmed value or null
-        if ([string]::IsNullOrWhiteSpace($value)) {{
+        if ([string]::IsNullOrWhiteSpace($value)) {
             return $null
-        }}
+        }
         return $value.Trim()  # Trim inside function, not after calling!
-    }} catch {{
+    } catch {
         Write-Host "[DEBUG] Get-MSIProperty failed for property '$property': $_" -ForegroundColor Yellow
         return $null
-    }}
-}}
+    }
+}
 ```
 
 CRITICAL RULES FOR MSI PROPERTY READING:
@@ -271,12 +257,12 @@ Get-Service returns Status as ServiceControllerStatus ENUM. Enums do NOT have .T
 **Standard pattern for strings (Check null → Trim → Compare)**:
 ```powershell
 $actualValue = Get-ItemProperty -Path "HKLM:\\..." -Name "Property" | Select -ExpandProperty Property
-if ([string]::IsNullOrWhiteSpace($actualValue)) {{
+if ([string]::IsNullOrWhiteSpace($actualValue)) {
     Write-Result -Msg "Property is null" -Success $false
-}} else {{
+} else {
     $actualValue = $actualValue.Trim()
     Write-Result -Msg "Property = ExpectedValue" -Success ($actualValue -eq "ExpectedValue")
-}}
+}
 ```
 
 **Applies to**: Registry, files, WMI string properties, environment vars, command output, MSI properties
@@ -332,45 +318,35 @@ CODE STYLE - KEEP IT CONCISE:
 - Example (GOOD - concise):
   ```powershell
   $logsToCheck = @("HeartbeatPlugin.log", "PluginManagementPlugin.log", "UpdateCheckerPlugin.log")
-  foreach ($logName in $logsToCheck) {{
+  foreach ($logName in $logsToCheck) {
       $logPath = Join-Path $logFolder $logName
       Write-Result -Msg "$logName exists" -Success (Test-Path $logPath)
-  }}
+  }
   ```
 - Example (BAD - verbose):
   ```powershell
-  if (Test-Path (Join-Path $logFolder "HeartbeatPlugin.log")) {{
+  if (Test-Path (Join-Path $logFolder "HeartbeatPlugin.log")) {
       Write-Result -Msg "HeartbeatPlugin.log exists" -Success $true
-  }} else {{
+  } else {
       Write-Result -Msg "HeartbeatPlugin.log missing" -Success $false
-  }}
+  }
   # ... repeat 10 more times for other logs ...
   ```
 
-OUTPUT FORMAT:
-Generate a complete, executable PowerShell script with:
-- Clear phase separators
-- Colored output (Write-Host with -ForegroundColor)
-- **ASCII-only characters** (NO emoji, NO Unicode symbols)
-- Use [PASS] and [FAIL] instead of emoji checkmarks
-- **English-only messages** (NO Chinese or other non-ASCII text)
-- Error handling (try/catch)
-- Exit code validation
-- Summary at the end (Success/Failed counts)
-- **Target 250-300 lines total** - use concise code to stay within limit
+"""
 
-CRITICAL - AVOID SYNTAX ERRORS IN STRINGS:
+STRING_RULES = """CRITICAL - AVOID SYNTAX ERRORS IN STRINGS:
 **NEVER put colon (:) immediately after a variable in strings - this causes SYNTAX ERROR!**
 
  WRONG patterns (cause script crash):
 - "Error $name: details" → $name: treated as drive reference (BREAKS!)
 - "Exception checking $serviceName: $($_.Message)" → STILL BREAKS!
-- catch {{{{ Write-Host "Error: $_" }}}} → BREAKS!
+- catch {{ Write-Host "Error: $_" }} → BREAKS!
 
  CORRECT patterns (use dash - instead):
 - "Error $name - details"
 - "Exception checking $serviceName - $($_.Exception.Message)"
-- catch {{{{ Write-Host "Error - $($_.Exception.Message)" }}}}
+- catch {{ Write-Host "Error - $($_.Exception.Message)" }}
 
 CRITICAL - ALWAYS PRINT ACTUAL VALUES ON FAILURE:
 When verification fails, ALWAYS print what the actual value was (essential for debugging).
@@ -381,12 +357,44 @@ $actualValue = Get-SomeValue
 $expectedValue = "ExpectedValue"
 $isMatch = ($actualValue -eq $expectedValue)
 Write-Result -Msg "Property is $expectedValue" -Success $isMatch
-if (-not $isMatch) {{{{
+if (-not $isMatch) {{
     Write-Host "[DEBUG] Expected: '$expectedValue', Actual: '$actualValue'" -ForegroundColor Yellow
-}}}}
+}}
 ```
 
-CRITICAL - SCRIPT ENDING:
+"""
+
+SILENT_RULES = """IMPORTANT:
+- Do NOT generate step-by-step human operation simulations
+- Do NOT use explorer.exe, services.msc, taskmgr.exe, control.exe
+- Do NOT create new PowerShell windows
+- Focus on achieving the test objective through direct PowerShell commands
+- All operations must be completely silent
+"""
+
+TEST_GENERATION_PROMPT = """Generate a goal-oriented PowerShell test script for the TEST SCENARIO and human operation steps (BACKGROUND CONTEXT) given in the next message.
+
+""" + COMMAND_RULES + """CRITICAL - CODE LENGTH LIMIT:
+- Target script length: 250-300 lines maximum
+- If the test has many steps, use loops and helper functions to consolidate repetitive code
+- Combine similar verification steps into single foreach loops
+- Use concise, clear code - avoid verbose comments
+- MUST complete the entire script including the closing sequence (Summary + Stop-Transcript + Pause)
+- If approaching length limit, prioritize completing the script structure over adding verbose logging
+
+""" + TASK_RULES + """OUTPUT FORMAT:
+Generate a complete, executable PowerShell script with:
+- Clear phase separators
+- Colored output (Write-Host with -ForegroundColor)
+- **ASCII-only characters** (NO emoji, NO Unicode symbols)
+- Use [PASS] and [FAIL] instead of emoji checkmarks
+- **English-only messages** (NO Chinese or other non-ASCII text)
+- Error handling (try/catch)
+- Exit code validation
+- Summary at the end (Success/Failed counts)
+- **Target 250-300 lines total** - use concise code to stay within limit
+
+""" + STRING_RULES + """CRITICAL - SCRIPT ENDING:
 The script MUST end with this EXACT closing sequence (do not modify or truncate):
 ```powershell
 Write-Host ""
@@ -413,10 +421,10 @@ SCRIPT STYLE:
 # ============================================================
 $timestamp = Get-Date -Format "yyyyMMdd_HHmmss"
 $logDir = "$PSScriptRoot\\..\\output\\logs"
-if (-not (Test-Path $logDir)) {{
+if (-not (Test-Path $logDir)) {
     New-Item -ItemType Directory -Path $logDir -Force | Out-Null
-}}
-$logFile = Join-Path $logDir "test_{{test_case_id}}_$timestamp.log"
+}
+$logFile = Join-Path $logDir "test_{test_case_id}_$timestamp.log"
 
 # Start transcript to capture all output
 Start-Transcript -Path $logFile -Append
@@ -436,16 +444,16 @@ Write-Host "Checking prerequisites..." -ForegroundColor Cyan
 $script:SuccessCount = 0
 $script:FailCount = 0
 
-function Write-Result {{
+function Write-Result {
     param([string]$Msg, [bool]$Success)
-    if ($Success -eq $true) {{
+    if ($Success -eq $true) {
         Write-Host "[PASS] $Msg" -ForegroundColor Green
         $script:SuccessCount++
-    }} else {{
+    } else {
         Write-Host "[FAIL] $Msg" -ForegroundColor Red
         $script:FailCount++
-    }}
-}}
+    }
+}
 
 # Example usage with NAMED parameters (important!):
 # Write-Result -Msg "Service is running" -Success $true
@@ -457,10 +465,10 @@ function Write-Result {{
 # - Use simple ASCII symbols like ==== for separators
 
 # Check admin privileges
-if (-not ([Security.Principal.WindowsPrincipal][Security.Principal.WindowsIdentity]::GetCurrent()).IsInRole([Security.Principal.WindowsBuiltInRole]::Administrator)) {{
+if (-not ([Security.Principal.WindowsPrincipal][Security.Principal.WindowsIdentity]::GetCurrent()).IsInRole([Security.Principal.WindowsBuiltInRole]::Administrator)) {
     Write-Host " ERROR: Must run as Administrator" -ForegroundColor Red
     exit 1
-}}
+}
 
 # Define MSI path and product name
 $msiPath = "C:\\VMShare\\cmdextension.msi"
@@ -469,15 +477,51 @@ $productName = "Microsoft Cloud Managed Desktop Extension"
 # ... rest of the script
 ```
 
-IMPORTANT:
-- Do NOT generate step-by-step human operation simulations
-- Do NOT use explorer.exe, services.msc, taskmgr.exe, control.exe
-- Do NOT create new PowerShell windows
-- Focus on achieving the test objective through direct PowerShell commands
-- All operations must be completely silent
+""" + SILENT_RULES
+
+# Body-only generation: core.script_skeleton writes the boilerplate around the returned phases
+SCRIPT_BODY_PROMPT = """Write the test phases of a goal-oriented PowerShell test script for the TEST SCENARIO and human operation steps (BACKGROUND CONTEXT) given in the next message.
+
+The rest of the script is a fixed skeleton that is added around your code. ALREADY IN THE SKELETON - do NOT write any of it:
+- The admin check (the script exits unless it runs as Administrator)
+- Logging setup: $timestamp, $logDir, $logFile and Start-Transcript
+- $script:SuccessCount / $script:FailCount and the Write-Result helper; call it with NAMED parameters:
+  Write-Result -Msg "Service is running" -Success $true
+  Write-Result -Msg "File exists" -Success (Test-Path $path)
+- The TEST EXECUTION SUMMARY, Stop-Transcript and the ReadKey pause at the end
+
+""" + COMMAND_RULES + """CRITICAL - CODE LENGTH LIMIT:
+- Target length: 200-250 lines for all phases together
+- If the test has many steps, use loops and helper functions to consolidate repetitive code
+- Combine similar verification steps into single foreach loops
+- Use concise, clear code - avoid verbose comments
+- MUST finish the last phase completely (every block closed); the skeleton appends the closing sequence
+
+""" + TASK_RULES + """OUTPUT FORMAT:
+Return ONLY the phases in a ```powershell code block:
+- Variables and helper functions used by several phases (MSI path, product and service names) first
+- Then each phase under a separator:
+  # ============================================================
+  # PHASE 1: PRE-CHECK
+  # ============================================================
+- Colored output (Write-Host with -ForegroundColor)
+- **ASCII-only characters** (NO emoji, NO Unicode symbols)
+- **English-only messages** (NO Chinese or other non-ASCII text)
+- Error handling (try/catch)
+- Exit code validation
+- Every check recorded with Write-Result so it is counted in the summary
+
+""" + STRING_RULES + SILENT_RULES
+
+TEST_CASE_PROMPT ="""TEST SCENARIO: {test_scenario}
+
+BACKGROUND CONTEXT (Human Steps):
+{steps_context}
+
+TEST CASE ID: {test_case_id}
 """
 
-REFINEMENT_PROMPT = """Review the generated PowerShell script and ensure:
+REFINEMENT_PROMPT = """Review the generated PowerShell script in the next message and ensure:
 
 SYNTAX VALIDATION:
 - [ ] All quotes are properly closed (no unclosed strings)
@@ -536,6 +580,13 @@ COMMON ERRORS TO FIX:
 If any issues found, provide corrections.
 """
 
+VALIDATION_FIX_PROMPT = """The script above failed these automated checks:
+{issues}
+
+Fix exactly these problems (and anything else on the checklist you notice in the lines you change).
+Keep every other line exactly as it is, and return the corrected complete PowerShell script in a ```powershell code block.
+"""
+
 SCRIPT_EVALUATION_PROMPT = """You are an expert PowerShell code reviewer and test automation specialist.
 
 Your task is to evaluate the quality of auto-generated PowerShell test scripts.
@@ -609,3 +660,99 @@ Analyze PowerShell test execution logs and provide:
 
 Be concise and actionable. Use bullet points. Respond in English."""
 
+
+SIMILAR_SCRIPT_DRAFT_PROMPT = """
+
+DRAFT FROM A SIMILAR TEST CASE:
+A script was already generated for a very similar test case ({source_id}, similarity {similarity:.2f}).
+Use it as a starting draft: keep what still applies, change whatever the scenario and steps above require,
+and use {test_case_id} wherever the draft uses {source_id}. Return your complete answer in the format asked for above.
+
+```powershell
+{script}
+```
+"""
+
+
+PHASE_PLAN_PROMPT = """Plan a goal-oriented PowerShell test script for the TEST SCENARIO and human operation steps given in the next message.
+The script is written in parts: you write the shared setup now, and each phase body is generated separately
+(in parallel) from your plan. The admin check, logging and Start-Transcript, the counters and Write-Result helper,
+the TEST EXECUTION SUMMARY, Stop-Transcript and the ReadKey pause come from a fixed skeleton; do not write them.
+
+Return ONLY a JSON object, no markdown, in exactly this shape:
+{
+  "setup": "<PowerShell: EVERY variable/helper function more than one phase needs (paths, product and service names, MSI path)>",
+  "phases": [
+    {"name": "PRE-CHECK", "goal": "<what this phase must establish>", "steps": [<step numbers it covers>]},
+    {"name": "INSTALL", "goal": "...", "steps": [...]},
+    {"name": "VERIFY", "goal": "...", "steps": [...]},
+    {"name": "CLEANUP", "goal": "...", "steps": [...]}
+  ]
+}
+
+PLANNING RULES:
+- Use the phases the test needs, in execution order (typically PRE-CHECK, INSTALL, VERIFY, CLEANUP); 2 to 6 phases
+- Every step number appears in exactly one phase
+- Phases run one after another in ONE script, so later phases may rely on state created by earlier ones
+- Anything two phases both use belongs in "setup"; phase bodies must not redefine it
+- Escape the PowerShell code as JSON strings (\\n for newlines, \\" for quotes)
+"""
+
+# Phase plan without the script skeleton (MODEL_SCRIPT_SKELETON=0): the planner also writes the boilerplate
+PHASE_PLAN_FULL_PROMPT = """Plan a goal-oriented PowerShell test script for the TEST SCENARIO and human operation steps given in the next message.
+The script is written in parts: you write the shared setup and teardown now, and each phase body is generated
+separately (in parallel) from your plan. Follow every rule and the SCRIPT STYLE of a normal generation.
+
+Return ONLY a JSON object, no markdown, in exactly this shape:
+{
+  "setup": "<PowerShell: logging setup and Start-Transcript, $script:SuccessCount/$script:FailCount, the Write-Result helper, the admin check, and EVERY variable/helper function more than one phase needs (paths, product and service names, MSI path)>",
+  "phases": [
+    {"name": "PRE-CHECK", "goal": "<what this phase must establish>", "steps": [<step numbers it covers>]},
+    {"name": "INSTALL", "goal": "...", "steps": [...]},
+    {"name": "VERIFY", "goal": "...", "steps": [...]},
+    {"name": "CLEANUP", "goal": "...", "steps": [...]}
+  ],
+  "teardown": "<PowerShell: the exact TEST EXECUTION SUMMARY closing sequence, Stop-Transcript and the single ReadKey pause>"
+}
+
+PLANNING RULES:
+- Use the phases the test needs, in execution order (typically PRE-CHECK, INSTALL, VERIFY, CLEANUP); 2 to 6 phases
+- Every step number appears in exactly one phase
+- Phases run one after another in ONE script, so later phases may rely on state created by earlier ones
+- Anything two phases both use belongs in "setup"; phase bodies must not redefine it
+- Escape the PowerShell code as JSON strings (\\n for newlines, \\" for quotes)
+"""
+
+PHASE_BODY_PROMPT = """Write the body of ONE phase of a goal-oriented PowerShell test script. The TEST SCENARIO, the human steps,
+the shared setup code and the phase to write are given in the next message.
+
+The phase body is inserted between the other phases of the script, under a phase separator that is added for you:
+- Do NOT repeat the setup: no Start-Transcript, no logging setup, no admin check, no counters, no Write-Result definition,
+  and do not redefine variables or functions the setup already defines
+- Do NOT write the summary, Stop-Transcript or the ReadKey pause
+- Do NOT write a phase separator header
+- Record every check with Write-Result -Msg "..." -Success <bool>
+- Wrap each operation in try/catch; keep braces and try/catch blocks balanced within this phase
+- Cover only the steps assigned to this phase; follow every rule of a normal generation
+- Keep the phase concise (loops and helper functions for repetitive checks)
+
+Return only the PowerShell code of the phase body in a ```powershell code block.
+"""
+
+PHASE_CASE_PROMPT = """SHARED SETUP (already at the top of the script):
+```powershell
+{setup}
+```
+
+PHASES OF THIS SCRIPT:
+{phase_list}
+
+WRITE PHASE {index}/{total}: {name}
+GOAL: {goal}
+STEPS COVERED: {steps}
+"""
+
+BODY_FIX_PROMPT = """The code above failed validation at its seam with the rest of the script:
+{issues}
+
+Return the corrected code only, in a ```powershell code block."""
@@ -0,0 +1,340 @@
+"""
+Offline Batch Generation
+离线批量生成：将所有 prompt 打包为 Batch API 的 JSONL 任务，提交、轮询并回填结果
+"""
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .csv_parser import parse_csv_to_json
+from .model_client import _continuation_messages
+from .prompt_budget import count_tokens
+from .priority import current_lane, priority_lane
+from .test_generator import TestScriptGenerator
+from .token_predictor import get_token_predictor
+from .script_evaluator import ScriptEvaluator
+from config.prompts import SCRIPT_EVALUATION_PROMPT
+
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Model stage of each job, for max_tokens prediction and continuation calls
+PHASE_STAGES = {"generate": "generate", "correct": "refine", "evaluate": "evaluate"}
+
+
+def build_batch_line(custom_id: str, deployment: str, messages: List[Dict], temperature: float,
+                     max_tokens: int, url: str = "/chat/completions") -> Dict:
+    """One request line in the Azure/OpenAI batch JSONL format"""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": url,
+        "body": {
+            "model": deployment,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+    }
+
+
+def parse_batch_output(text: str) -> Dict[str, Dict]:
+    """
+    Parse batch output JSONL into {custom_id: {"content": str|None, "error": str|None, "finish_reason": str|None}}
+    """
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if record.get("error") or response.get("status_code", 200) >= 400 or not body.get("choices"):
+            error = record.get("error") or body.get("error") or f"HTTP {response.get('status_code')}"
+            results[custom_id] = {"content": None, "error": json.dumps(error) if isinstance(error, dict) else str(error)}
+        else:
+            choice = body["choices"][0]
+            content = choice["message"]["content"] or ""
+            results[custom_id] = {"content": content.strip(), "error": None, "usage": body.get("usage"),
+                                  "finish_reason": choice.get("finish_reason")}
+    return results
+
+
+class AzureBatchBackend:
+    """Submit JSONL jobs to the Azure OpenAI Batch API"""
+
+    def __init__(self, model_client, endpoint: str = "/chat/completions"):
+        """
+        Args:
+            model_client: ModelClient whose underlying AzureOpenAI client is used
+            endpoint: Batch endpoint / per-line url (Azure: /chat/completions)
+        """
+        self._client = model_client._client
+        self.endpoint = endpoint
+
+    def submit(self, jsonl: str, name: str) -> str:
+        """Upload the job file and create a batch; returns the batch id"""
+        uploaded = self._client.files.create(
+            file=(name, io.BytesIO(jsonl.encode("utf-8"))),
+            purpose="batch"
+        )
+        batch = self._client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=self.endpoint,
+            completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self._client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> str:
+        """Raw output JSONL (successful lines followed by error lines)"""
+        batch = self._client.batches.retrieve(batch_id)
+        text = ""
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text += self._client.files.content(file_id).text + "\n"
+        return text
+
+
+class LocalBatchBackend:
+    """In-process stand-in for the Batch API (tests and offline dry runs)
+
+    Each request body is handed to `complete(body) -> str` when the job is
+    submitted, on up to `max_workers` threads (the model client's adaptive
+    concurrency window decides how many actually run at once); status is
+    reported as completed immediately.
+    """
+
+    def __init__(self, complete: Callable[[Dict], str], max_workers: int = 1):
+        self.complete = complete
+        self.max_workers = max(1, max_workers)
+        self._jobs: Dict[str, str] = {}
+
+    def _run(self, request: Dict, lane: str) -> Dict:
+        try:
+            with priority_lane(lane):
+                content = self.complete(request["body"])
+        except Exception as e:
+            return {"custom_id": request["custom_id"], "response": None, "error": str(e)}
+        response = {
+            "status_code": 200,
+            "body": {"choices": [{"message": {"role": "assistant", "content": content}}]}
+        }
+        return {"custom_id": request["custom_id"], "response": response, "error": None}
+
+    def submit(self, jsonl: str, name: str) -> str:
+        requests = [json.loads(line) for line in jsonl.splitlines()]
+        # Worker threads start with a fresh context, so hand them the submitter's lane
+        lane = current_lane()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            lines = list(pool.map(lambda request: self._run(request, lane), requests))
+        batch_id = f"local-{len(self._jobs) + 1}"
+        self._jobs[batch_id] = "\n".join(json.dumps(l, ensure_ascii=False) for l in lines)
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        return "completed"
+
+    def results(self, batch_id: str) -> str:
+        return self._jobs[batch_id]
+
+
+class BatchRunner:
+    """Regenerate a whole suite of test cases through batch jobs
+
+    The pipeline has data dependencies (refinement needs the generated script,
+    evaluation needs the final one), so it runs as up to three jobs: generate,
+    correct (only for scripts ScriptValidator finds problems in) and evaluate.
+    Each job holds every case's prompt for that phase in one JSONL file.
+    """
+
+    def __init__(self, backend, deployment: str, output_dir: str = "output", job_dir: str = "output/batch_jobs",
+                 poll_interval: float = 30.0, timeout: float = 24 * 3600):
+        """
+        Args:
+            backend: AzureBatchBackend or LocalBatchBackend
+            deployment: Batch deployment name written into each request
+            output_dir: Directory receiving test_<id>.ps1 files
+            job_dir: Directory for JSONL job/result files and the evaluation summary
+            poll_interval: Seconds between status polls
+            timeout: Give up waiting for a job after this many seconds
+        """
+        self.backend = backend
+        self.deployment = deployment
+        self.output_dir = Path(output_dir)
+        self.job_dir = Path(job_dir)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.generator = TestScriptGenerator()
+        self.evaluator = ScriptEvaluator()
+        self.predictor = get_token_predictor()
+        self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    def load_cases(self, paths: List[str]) -> Dict[str, Dict]:
+        """Parse CSV/JSON inputs into {test_case_id: test_case}"""
+        cases = {}
+        for path in paths:
+            if path.lower().endswith(".csv"):
+                test_case = parse_csv_to_json(path)
+            else:
+                test_case = self.generator.load_test_case(path)
+            cases[test_case["test_case_id"]] = test_case
+        return cases
+
+    def run_job(self, phase: str, lines: List[Dict]) -> Dict[str, Dict]:
+        """Write, submit and wait for one JSONL job; returns parsed results by custom_id"""
+        if not lines:
+            return {}
+
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        jsonl = "\n".join(json.dumps(line, ensure_ascii=False) for line in lines)
+        job_name = f"{self.run_id}_{phase}.jsonl"
+        (self.job_dir / job_name).write_text(jsonl, encoding="utf-8")
+
+        batch_id = self.backend.submit(jsonl, job_name)
+        print(f"📦 Submitted {phase} job: {len(lines)} requests (batch {batch_id})")
+
+        started = time.time()
+        status = self.backend.status(batch_id)
+        while status not in TERMINAL_STATUSES:
+            if time.time() - started > self.timeout:
+                raise TimeoutError(f"Batch {batch_id} ({phase}) did not finish within {self.timeout:.0f}s")
+            time.sleep(self.poll_interval)
+            status = self.backend.status(batch_id)
+            print(f"   ⏳ {phase}: {status} ({time.time() - started:.0f}s)")
+
+        if status != "completed":
+            raise RuntimeError(f"Batch {batch_id} ({phase}) ended with status '{status}'")
+
+        output = self.backend.results(batch_id)
+        (self.job_dir / f"{self.run_id}_{phase}.results.jsonl").write_text(output, encoding="utf-8")
+        results = parse_batch_output(output)
+        failed = [cid for cid, r in results.items() if r["error"]]
+        print(f"✅ {phase} job finished: {len(results) - len(failed)} ok, {len(failed)} failed")
+        self._finish_truncated(phase, lines, results)
+        return results
+
+    def _finish_truncated(self, phase: str, lines: List[Dict], results: Dict[str, Dict]):
+        """Complete replies cut off at the predicted max_tokens with interactive continuation calls"""
+        for line in lines:
+            result = results.get(line["custom_id"])
+            if not result or result["error"] or result.get("finish_reason") != "length":
+                continue
+            body = line["body"]
+            print(f"✂️  {line['custom_id']} hit max_tokens={body['max_tokens']}, requesting a continuation")
+            try:
+                rest = self.generator.client.generate_with_context(
+                    messages=_continuation_messages(body["messages"], result["content"]),
+                    temperature=body["temperature"],
+                    max_tokens=body["max_tokens"],
+                    use_cache=False,
+                    stage=PHASE_STAGES.get(phase, phase)
+                )
+            except Exception as e:
+                result.update(content=None, error=f"continuation failed: {type(e).__name__}: {e}")
+                continue
+            result.update(content=result["content"] + rest, finish_reason="stop")
+
+    def _max_tokens(self, phase: str, size_hint: Optional[float] = None) -> int:
+        """Predicted max_tokens for a job line, as ModelClient predicts it for interactive calls"""
+        if self.predictor is None:
+            return 16000
+        return self.predictor.predict(PHASE_STAGES.get(phase, phase), size_hint)
+
+    def _line(self, custom_id: str, messages: List[Dict], temperature: float, max_tokens: int) -> Dict:
+        return build_batch_line(custom_id, self.deployment, messages, temperature, max_tokens,
+                                url=getattr(self.backend, "endpoint", "/chat/completions"))
+
+    def run(self, paths: List[str], refine: bool = True, evaluate: bool = True, force: bool = False) -> Dict[str, Dict]:
+        """
+        Run the batch pipeline over input files
+
+        Args:
+            paths: CSV/JSON test case files
+            refine: Run the correction phase for scripts that fail validation
+            evaluate: Run the quality evaluation phase
+            force: Also regenerate cases whose outputs the build manifest reports as up to date
+
+        Returns:
+            {test_case_id: {"output_path": str|None, "error": str|None, "evaluation": dict|None, "skipped": bool}}
+        """
+        cases = self.load_cases(paths)
+        summary = {cid: {"output_path": None, "error": None, "evaluation": None, "skipped": False} for cid in cases}
+
+        # Up-to-date outputs are left alone (and not re-evaluated)
+        manifest = self.generator.manifest
+        fingerprints = {}
+        if manifest is not None:
+            fingerprints = {cid: self.generator.build_fingerprint(case, refine, [self.deployment])
+                            for cid, case in cases.items()}
+            for cid in list(cases):
+                output_path = str(self.output_dir / f"test_{cid}.ps1")
+                if not force and manifest.is_up_to_date(output_path, fingerprints[cid]):
+                    summary[cid].update(output_path=output_path, skipped=True)
+                    del cases[cid]
+
+        # Phase 1: generation
+        generated = self.run_job("generate", [
+            self._line(f"generate:{cid}", self.generator.build_generation_messages(case), 0.2,
+                       self._max_tokens("generate", len(case.get("steps", []))))
+            for cid, case in cases.items()
+        ])
+        scripts = {}
+        for cid in cases:
+            result = generated.get(f"generate:{cid}")
+            if not result or result["error"]:
+                summary[cid]["error"] = (result or {}).get("error") or "missing from batch output"
+            else:
+                scripts[cid] = self.generator.assemble_script(cases[cid], result["content"])
+
+        # Phase 2: correction, only for scripts the validator finds problems in
+        if refine and scripts:
+            needs_fix = {cid: self.generator.review_findings(script) for cid, script in scripts.items()}
+            needs_fix = {cid: findings for cid, findings in needs_fix.items() if findings}
+            print(f"🔍 {len(scripts) - len(needs_fix)} script(s) passed validation, {len(needs_fix)} need correction")
+            corrected = self.run_job("correct", [
+                self._line(f"correct:{cid}", self.generator.build_correction_messages(scripts[cid], findings), 0.1,
+                           self._max_tokens("correct", count_tokens(scripts[cid])))
+                for cid, findings in needs_fix.items()
+            ])
+            for cid in needs_fix:
+                result = corrected.get(f"correct:{cid}")
+                if result and not result["error"]:
+                    scripts[cid] = self.generator.apply_correction(scripts[cid], result["content"])
+
+        # Fan results back into output/test_<id>.ps1
+        for cid, script in scripts.items():
+            output_path = self.output_dir / f"test_{cid}.ps1"
+            self.generator.save_script(script, str(output_path))
+            summary[cid]["output_path"] = str(output_path)
+            if cid in fingerprints:
+                manifest.record(str(output_path), fingerprints[cid], test_case_id=cid)
+
+        # Phase 3: evaluation
+        if evaluate and scripts:
+            evaluations = self.run_job("evaluate", [
+                self._line(f"evaluate:{cid}", [
+                    {"role": "system", "content": SCRIPT_EVALUATION_PROMPT},
+                    {"role": "user", "content": self.evaluator.build_evaluation_prompt(
+                        script, cid, cases[cid].get("test_scenario", ""), len(cases[cid].get("steps", []))
+                    )}
+                ], 0.3, self._max_tokens("evaluate"))
+                for cid, script in scripts.items()
+            ])
+            for cid in scripts:
+                result = evaluations.get(f"evaluate:{cid}")
+                if result and not result["error"]:
+                    summary[cid]["evaluation"] = self.evaluator.parse_evaluation(result["content"])
+
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        summary_path = self.job_dir / f"{self.run_id}_summary.json"
+        summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"📄 Batch summary: {summary_path}")
+        return summary
@@ -0,0 +1,105 @@
+"""
+Incremental Build Manifest
+增量生成清单：记录每个输出脚本的输入指纹（用例内容、提示词模板、部署、生成参数），输入未变化时跳过重新生成
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+DEFAULT_MANIFEST_FILE = Path(__file__).parent.parent / ".cache" / "build_manifest.json"
+
+# Bump when generation changes in a way the recorded inputs do not capture
+MANIFEST_VERSION = 1
+
+
+def fingerprint(inputs: Dict) -> str:
+    """SHA-256 of the canonical JSON form of everything an output depends on"""
+    canonical = json.dumps({"version": MANIFEST_VERSION, **inputs}, sort_keys=True, ensure_ascii=False,
+                           separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _file_hash(path: Path) -> Optional[str]:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+class BuildManifest:
+    """Output path → fingerprint of its inputs, like a build system's dependency database
+
+    An output is up to date when its recorded fingerprint matches the current
+    inputs and the file on disk is still the one that was written (a deleted
+    or hand-edited script is rebuilt).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: Manifest JSON file (default: auto-test-v2/.cache/build_manifest.json)
+        """
+        self.path = Path(path) if path else DEFAULT_MANIFEST_FILE
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._mtime: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["BuildManifest"]:
+        """
+        On by default; MODEL_BUILD_MANIFEST=0 always regenerates
+
+        MODEL_BUILD_MANIFEST_FILE overrides the manifest location.
+        """
+        if os.getenv("MODEL_BUILD_MANIFEST", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(os.getenv("MODEL_BUILD_MANIFEST_FILE") or None)
+
+    @staticmethod
+    def key(output_path: str) -> str:
+        return str(Path(output_path).resolve())
+
+    def _load(self) -> Dict[str, Dict]:
+        """Entries, re-read when another process has rewritten the manifest"""
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if self._entries is None or mtime != self._mtime:
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf-8"))["outputs"]
+            except (OSError, ValueError, KeyError):
+                self._entries = {}
+            self._mtime = mtime
+        return self._entries
+
+    def is_up_to_date(self, output_path: str, inputs_fingerprint: str) -> bool:
+        """Whether output_path was built from these exact inputs and is unchanged since"""
+        with self._lock:
+            entry = self._load().get(self.key(output_path))
+        if entry is None or entry["fingerprint"] != inputs_fingerprint:
+            return False
+        return _file_hash(Path(output_path)) == entry["output_sha256"]
+
+    def record(self, output_path: str, inputs_fingerprint: str, **info):
+        """Remember the inputs of a freshly written output (extra info is stored for inspection)"""
+        entry = {
+            "fingerprint": inputs_fingerprint,
+            "output_sha256": _file_hash(Path(output_path)),
+            "built_at": time.time(),
+            **info
+        }
+        with self._lock:
+            entries = self._load()
+            entries[self.key(output_path)] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps({"version": MANIFEST_VERSION, "outputs": entries}, indent=1, ensure_ascii=False),
+                           encoding="utf-8")
+            os.replace(tmp, self.path)
+            self._mtime = self.path.stat().st_mtime
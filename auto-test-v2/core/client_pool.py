@@ -0,0 +1,141 @@
+"""
+Process-wide Client Pool
+进程级共享的凭据、HTTP 连接池与 ModelClient 注册表
+"""
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:  # model_client imports this module
+    from .model_client import ModelClient
+
+
+TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+class TokenRefresher:
+    """Bearer token provider that refreshes in the background before expiry
+
+    Works as an ``azure_ad_token_provider`` callable. The first call fetches a
+    token synchronously; after that a daemon thread renews it `refresh_margin`
+    seconds before it expires, so requests never wait on the credential chain.
+    """
+
+    def __init__(self, credential, scope: str = TOKEN_SCOPE, refresh_margin: float = 300.0):
+        """
+        Args:
+            credential: azure.identity credential (e.g. DefaultAzureCredential)
+            scope: Token scope
+            refresh_margin: Seconds before expiry at which the token is renewed
+        """
+        self.credential = credential
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expires_on: float = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _fetch(self):
+        access_token = self.credential.get_token(self.scope)
+        self._token = access_token.token
+        self._expires_on = float(access_token.expires_on)
+
+    def __call__(self) -> str:
+        with self._lock:
+            # Fall back to a synchronous fetch if the background refresh fell behind
+            if self._token is None or self._expires_on - time.time() < 60:
+                self._fetch()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True)
+                self._thread.start()
+            return self._token
+
+    def _refresh_loop(self):
+        while True:
+            delay = self._expires_on - self.refresh_margin - time.time()
+            time.sleep(max(delay, 5.0))
+            try:
+                with self._lock:
+                    if self._expires_on - time.time() <= self.refresh_margin:
+                        self._fetch()
+            except Exception as e:
+                # Keep the current token; try again shortly
+                print(f"⚠️ Background token refresh failed: {e}")
+                time.sleep(30)
+
+
+_lock = threading.Lock()
+_token_provider: Optional[TokenRefresher] = None
+_http_client = None
+_clients: Dict[str, "ModelClient"] = {}
+
+
+def is_local_endpoint(endpoint: Optional[str]) -> bool:
+    """True for endpoints on this machine (e.g. core.mock_server)"""
+    return bool(endpoint) and urlparse(endpoint).hostname in LOCAL_HOSTS
+
+
+def get_token_provider(endpoint: Optional[str] = None):
+    """
+    Shared token provider backed by one DefaultAzureCredential
+
+    Local endpoints (the mock server) get a placeholder token instead, so load
+    tests need no Azure login and real tokens never leave for localhost.
+    """
+    global _token_provider
+    if is_local_endpoint(endpoint):
+        return lambda: "local-mock-token"
+    with _lock:
+        if _token_provider is None:
+            from azure.identity import DefaultAzureCredential  # heavy; only needed for real endpoints
+            _token_provider = TokenRefresher(DefaultAzureCredential())
+        return _token_provider
+
+
+def get_http_client():
+    """Shared keep-alive HTTP client so TLS connections are reused across ModelClients"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            from openai import DefaultHttpxClient
+            _http_client = DefaultHttpxClient()
+        return _http_client
+
+
+def get_model_client(deployment: Optional[str] = None) -> "ModelClient":
+    """
+    Get the process-wide ModelClient for a deployment
+
+    Args:
+        deployment: Deployment name (default: AZURE_OPENAI_DEPLOYMENT)
+
+    Returns:
+        Shared ModelClient instance
+    """
+    from .model_client import ModelClient
+
+    key = deployment or ""
+    with _lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+
+    client = ModelClient(deployment=deployment)
+    with _lock:
+        return _clients.setdefault(key, client)
+
+
+def reset_clients():
+    """Drop shared clients (e.g. after changing environment variables)"""
+    global _http_client
+    from .router import set_router
+    set_router(None)
+    with _lock:
+        _clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
@@ -0,0 +1,231 @@
+"""
+AIMD Adaptive Concurrency
+自适应并发窗口：成功时加性增加，遇到 429 / 超时时乘性减小（每个部署一个控制器）
+"""
+import asyncio
+import os
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+from .priority import aging_seconds, current_lane, lane_rank
+from .retry import status_code_of
+
+
+TIMEOUT_ERRORS = {"APITimeoutError", "TimeoutError", "TimeoutException", "ReadTimeout", "ConnectTimeout"}
+
+
+def classify_outcome(exc: Optional[BaseException]) -> str:
+    """"success", "throttled" (429), "timeout" or "error" for a finished request"""
+    if exc is None:
+        return "success"
+    if status_code_of(exc) == 429:
+        return "throttled"
+    if any(cls.__name__ in TIMEOUT_ERRORS for cls in type(exc).__mro__):
+        return "timeout"
+    return "error"
+
+
+class AIMDController:
+    """Concurrency window that tracks available capacity
+
+    Each successful request grows the window by `increase / window` (about
+    +`increase` per window's worth of successes, TCP-style); a 429 or timeout
+    multiplies it by `decrease`. Cuts are applied at most once per `cooldown`
+    seconds so a burst of 429s from one overloaded moment counts once. Other
+    errors leave the window unchanged.
+
+    Callers waiting for a slot form a priority queue by lane (interactive,
+    normal, background). Every `aging` seconds of waiting promote a request
+    by one lane, so background work keeps moving under interactive load.
+    """
+
+    def __init__(self, max_limit: int = 8, min_limit: int = 1, initial: Optional[float] = None,
+                 increase: float = 1.0, decrease: float = 0.5, cooldown: float = 2.0, aging: float = 10.0):
+        """
+        Args:
+            max_limit: Upper bound for the window
+            min_limit: Lower bound for the window
+            initial: Starting window (default: half of max_limit)
+            increase: Additive increase per window of successes
+            decrease: Multiplicative factor applied on throttling/timeouts
+            cooldown: Minimum seconds between two cuts
+            aging: Seconds of waiting that promote a queued request by one lane
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial if initial is not None else max(min_limit, max_limit // 2))
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.aging = aging
+        self.in_flight = 0
+        self.cuts = 0
+        self.history: Deque[Tuple[float, int]] = deque([(time.time(), self.window)], maxlen=500)
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        self._waiting: Dict[int, Tuple[int, float]] = {}  # ticket -> (lane rank, queued at)
+
+    @classmethod
+    def from_env(cls) -> "AIMDController":
+        """MODEL_MAX_CONCURRENCY (ceiling, default 8) and MODEL_MIN_CONCURRENCY (floor, default 1)"""
+        return cls(
+            max_limit=int(os.getenv("MODEL_MAX_CONCURRENCY", "8")),
+            min_limit=int(os.getenv("MODEL_MIN_CONCURRENCY", "1")),
+            aging=aging_seconds()
+        )
+
+    @property
+    def window(self) -> int:
+        """Requests currently allowed in flight"""
+        return max(self.min_limit, int(self.limit))
+
+    # ------------------------------------------------------------ dispatch queue
+
+    def _enqueue(self, lane: Optional[str]) -> int:
+        ticket = next(self._tickets)
+        self._waiting[ticket] = (lane_rank(lane or current_lane()), time.monotonic())
+        return ticket
+
+    def _grant(self, ticket: int) -> bool:
+        """Take a slot for `ticket` if the window has room and it is first in line (lock held)"""
+        if self.in_flight >= self.window:
+            return False
+        now = time.monotonic()
+        aging = self.aging or float("inf")
+        first = min(self._waiting, key=lambda t: (self._waiting[t][0] - (now - self._waiting[t][1]) / aging, t))
+        if first != ticket:
+            return False
+        del self._waiting[ticket]
+        self.in_flight += 1
+        return True
+
+    def _dequeue(self, ticket: int):
+        if self._waiting.pop(ticket, None) is not None:
+            self._cond.notify_all()
+
+    def try_acquire(self, lane: Optional[str] = None) -> bool:
+        """Take a slot now if one is free and nobody with higher priority is waiting"""
+        with self._cond:
+            ticket = self._enqueue(lane)
+            if self._grant(ticket):
+                return True
+            self._dequeue(ticket)
+            return False
+
+    def acquire(self, lane: Optional[str] = None):
+        """Block until the window has room and this request is first in line
+
+        Args:
+            lane: Priority lane (default: the caller's current lane)
+        """
+        with self._cond:
+            ticket = self._enqueue(lane)
+            try:
+                # Re-check periodically: aging can reorder the queue without a release
+                while not self._grant(ticket):
+                    self._cond.wait(timeout=1.0)
+            except BaseException:
+                self._dequeue(ticket)
+                raise
+
+    async def acquire_async(self, lane: Optional[str] = None, poll: float = 0.05):
+        """Async acquire that yields to the event loop while waiting in line"""
+        with self._cond:
+            ticket = self._enqueue(lane)
+        try:
+            while True:
+                with self._cond:
+                    if self._grant(ticket):
+                        return
+                await asyncio.sleep(poll)
+        except BaseException:
+            with self._cond:
+                self._dequeue(ticket)
+            raise
+
+    def release(self, exc: Optional[BaseException] = None):
+        """Free a slot and adjust the window from the request's outcome"""
+        outcome = classify_outcome(exc)
+        with self._cond:
+            self.in_flight -= 1
+            before = self.window
+            if outcome == "success":
+                self.limit = min(self.max_limit, self.limit + self.increase / max(self.limit, 1.0))
+            elif outcome in ("throttled", "timeout"):
+                now = time.monotonic()
+                if now - self._last_cut >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_cut = now
+                    self.cuts += 1
+            if self.window != before:
+                self.history.append((time.time(), self.window))
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane: Optional[str] = None):
+        """Hold one slot for the duration of a request; its outcome adjusts the window"""
+        self.acquire(lane)
+        try:
+            yield
+        except BaseException as e:
+            self.release(e)
+            raise
+        self.release()
+
+    @asynccontextmanager
+    async def slot_async(self, lane: Optional[str] = None):
+        """Async counterpart of slot()"""
+        await self.acquire_async(lane)
+        try:
+            yield
+        except BaseException as e:
+            self.release(e)
+            raise
+        self.release()
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                "window": self.window,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queued": len(self._waiting),
+                "max": self.max_limit,
+                "cuts": self.cuts
+            }
+
+
+_controllers: Dict[str, AIMDController] = {}
+_controllers_lock = threading.Lock()
+
+
+def adaptive_concurrency_enabled() -> bool:
+    """On by default; MODEL_ADAPTIVE_CONCURRENCY=0 turns the AIMD window off"""
+    return os.getenv("MODEL_ADAPTIVE_CONCURRENCY", "1").lower() not in ("0", "false", "no")
+
+
+def get_concurrency_controller(key: str) -> AIMDController:
+    """Shared controller per deployment key (quota and throttling are per deployment)"""
+    with _controllers_lock:
+        if key not in _controllers:
+            _controllers[key] = AIMDController.from_env()
+        return _controllers[key]
+
+
+def concurrency_snapshot() -> Dict[str, Dict[str, float]]:
+    """Current window per deployment, e.g. for end-of-run summaries"""
+    with _controllers_lock:
+        items = list(_controllers.items())
+    return {key: controller.snapshot() for key, controller in items}
+
+
+def format_concurrency() -> str:
+    lines = ["⚙️  Adaptive concurrency:"]
+    for key, s in sorted(concurrency_snapshot().items()):
+        lines.append(f"   {key:<32} window {s['window']:>3} / {s['max']:<3} cuts {s['cuts']}")
+    return "\n".join(lines)
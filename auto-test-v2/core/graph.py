@@ -11,6 +11,7 @@ from .nodes.execute import execute_test_node
 from .nodes.wait import wait_for_completion_node
 from .nodes.analyze import analyze_logs_node
 from .nodes.report import generate_report_node
+from .telemetry import get_telemetry
 
 
 def should_continue_after_parse(state: AutoTestState) -> str:
@@ -166,13 +167,21 @@ def get_workflow():
     return _auto_test_workflow
 
 
-def run_auto_test(csv_path: str, test_case_id: str = "") -> AutoTestState:
+def _run_config(output_queue) -> dict:
+    """Build LangGraph run config carrying the optional GUI output queue"""
+    if output_queue is None:
+        return None
+    return {"configurable": {"output_queue": output_queue}}
+
+
+def run_auto_test(csv_path: str, test_case_id: str = "", output_queue=None) -> AutoTestState:
     """
     Run the complete auto-test workflow
     
     Args:
         csv_path: Path to CSV input file
         test_case_id: Optional test case ID
+        output_queue: Optional GUI queue receiving streamed script lines
     
     Returns:
         Final workflow state
@@ -186,18 +195,21 @@ def run_auto_test(csv_path: str, test_case_id: str = "") -> AutoTestState:
     workflow = get_workflow()
     
     # Run workflow
-    final_state = workflow.invoke(initial_state)
+    mark = get_telemetry().mark()
+    final_state = workflow.invoke(initial_state, config=_run_config(output_queue))
+    print(get_telemetry().format_summary(since=mark))
     
     return final_state
 
 
-def stream_auto_test(csv_path: str, test_case_id: str = ""):
+def stream_auto_test(csv_path: str, test_case_id: str = "", output_queue=None):
     """
     Run auto-test workflow with streaming updates
     
     Args:
         csv_path: Path to CSV input file
         test_case_id: Optional test case ID
+        output_queue: Optional GUI queue receiving streamed script lines
     
     Yields:
         State updates at each step
@@ -211,5 +223,7 @@ def stream_auto_test(csv_path: str, test_case_id: str = ""):
     workflow = get_workflow()
     
     # Stream workflow execution
-    for state in workflow.stream(initial_state):
+    mark = get_telemetry().mark()
+    for state in workflow.stream(initial_state, config=_run_config(output_queue)):
         yield state
+    print(get_telemetry().format_summary(since=mark))
@@ -0,0 +1,144 @@
+"""
+Hedged Requests
+尾延迟控制：请求超过近期延迟分位数仍未返回时发送备份请求，先完成者胜出，其余取消
+"""
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from .router import LatencyStats
+
+T = TypeVar('T')
+
+
+class HedgeCancelled(Exception):
+    """Raised inside a request that lost the race and was cancelled"""
+
+
+class HedgeToken:
+    """Cancellation handle passed to each racing request
+
+    Requests register closers (e.g. ``stream.close``) with ``on_cancel``; cancelling
+    the token runs them, which aborts a blocked read from another thread.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._closers: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def on_cancel(self, closer: Callable[[], None]):
+        with self._lock:
+            if not self._event.is_set():
+                self._closers.append(closer)
+                return
+        closer()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            closers, self._closers = self._closers, []
+        for closer in closers:
+            try:
+                closer()
+            except Exception:
+                pass
+
+
+@dataclass
+class HedgePolicy:
+    """When to send a backup request
+
+    The hedge fires once a call has been running longer than `percentile` of the
+    recent latencies for its stage and deployment (never sooner than `min_delay`
+    seconds, and only after `min_samples` calls have been observed).
+    """
+    percentile: float = 95.0
+    min_samples: int = 5
+    min_delay: float = 1.0
+    max_hedges: int = 1
+
+    @classmethod
+    def from_env(cls) -> Optional["HedgePolicy"]:
+        """MODEL_HEDGE=1 enables hedging; returns None otherwise"""
+        if os.getenv("MODEL_HEDGE", "").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            percentile=float(os.getenv("MODEL_HEDGE_PERCENTILE", "95")),
+            min_delay=float(os.getenv("MODEL_HEDGE_MIN_DELAY", "1")),
+            max_hedges=int(os.getenv("MODEL_HEDGE_MAX", "1"))
+        )
+
+    def delay(self, stats: LatencyStats) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little history"""
+        if sum(1 for _, ok in stats.samples if ok) < self.min_samples:
+            return None
+        return max(self.min_delay, stats.percentile(self.percentile))
+
+
+def hedged(fn: Callable[[HedgeToken], T], delay: float, max_hedges: int = 1,
+           allow_hedge: Callable[[], bool] = lambda: True) -> Tuple[T, int]:
+    """
+    Run fn, starting up to `max_hedges` duplicates while it is slower than `delay`
+
+    Each duplicate is started `delay` seconds after the previous one, and only if
+    allow_hedge() agrees (e.g. the rate limiter still has budget). The first
+    successful result wins and every other request is cancelled through its
+    HedgeToken. An error is raised only once every started request has failed.
+
+    Args:
+        fn: Request taking a HedgeToken; runs on a worker thread
+        delay: Seconds before each hedge
+        max_hedges: Maximum number of duplicates
+        allow_hedge: Called before each hedge; False skips it
+
+    Returns:
+        (result, number of hedges sent)
+    """
+    results: "queue.Queue[Tuple[HedgeToken, bool, object]]" = queue.Queue()
+    tokens: List[HedgeToken] = []
+
+    def run(token: HedgeToken):
+        try:
+            results.put((token, True, fn(token)))
+        except BaseException as e:
+            results.put((token, False, e))
+
+    def launch():
+        token = HedgeToken()
+        tokens.append(token)
+        threading.Thread(target=run, args=(token,), name="hedged-request", daemon=True).start()
+
+    launch()
+    pending = 1
+    hedges = 0
+    first_error = None
+    while True:
+        timeout = delay if hedges < max_hedges else None
+        try:
+            token, ok, value = results.get(timeout=timeout)
+        except queue.Empty:
+            if allow_hedge():
+                launch()
+                pending += 1
+                hedges += 1
+            else:
+                max_hedges = hedges  # out of budget: wait for what is already running
+            continue
+
+        pending -= 1
+        if ok:
+            for other in tokens:
+                if other is not token:
+                    other.cancel()
+            return value, hedges
+        if first_error is None:
+            first_error = value
+        if pending == 0:
+            raise first_error
@@ -0,0 +1,292 @@
+"""
+Local OpenAI-compatible Mock Server
+本地模拟 Azure OpenAI chat-completions 接口：脚本化响应、延迟分布、按 token/s 流式输出、429 与 5xx 注入
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+
+DEFAULT_CONTENT = "```powershell\nWrite-Host 'mock response'\n```"
+
+CHAT_PATH = re.compile(r"^/openai/deployments/(?P<deployment>[^/]+)/chat/completions$|^/(?:v1/)?chat/completions$")
+
+
+def parse_latency(spec: str, rng: Optional[random.Random] = None) -> Callable[[], float]:
+    """
+    Build a latency sampler (seconds) from a spec string
+
+    Supported: "0.5" / "const:0.5", "uniform:LOW,HIGH", "normal:MEAN,STD",
+    "lognormal:MEDIAN,SIGMA" (heavy tail), "exp:MEAN". Samples are clamped at 0.
+    """
+    rng = rng or random
+    kind, _, args = spec.partition(":") if ":" in spec else ("const", "", spec)
+    values = [float(v) for v in args.split(",") if v.strip()]
+    samplers = {
+        "const": lambda: values[0],
+        "uniform": lambda: rng.uniform(values[0], values[1]),
+        "normal": lambda: rng.gauss(values[0], values[1]),
+        "lognormal": lambda: rng.lognormvariate(math.log(values[0]), values[1]),
+        "exp": lambda: rng.expovariate(1.0 / values[0]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution '{kind}' (expected one of {', '.join(samplers)})")
+    sampler = samplers[kind]
+    return lambda: max(0.0, sampler())
+
+
+@dataclass
+class MockRule:
+    """One scripted behaviour; the first rule whose `match` regex finds the prompt (and has uses left) wins"""
+    content: Optional[str] = None
+    status: int = 200
+    match: Optional[str] = None
+    times: Optional[int] = None  # None: unlimited
+    latency: Optional[str] = None
+    retry_after: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "MockRule":
+        return cls(**{k: data[k] for k in cls.__dataclass_fields__ if k in data})
+
+
+@dataclass
+class MockConfig:
+    """Server behaviour
+
+    Failure injection is applied before scripted rules: every `burst_every`-th
+    block of `burst_length` requests fails with `burst_status`, and otherwise a
+    request is throttled with probability `rate_429`.
+    """
+    content: str = DEFAULT_CONTENT
+    latency: str = "0"
+    tokens_per_second: float = 0.0  # 0: stream as fast as possible
+    rate_429: float = 0.0
+    retry_after: float = 1.0
+    burst_every: int = 0
+    burst_length: int = 0
+    burst_status: int = 503
+    rules: List[MockRule] = field(default_factory=list)
+    seed: Optional[int] = None
+
+
+# Provider-side prompt caching: prefixes of at least 1024 tokens are cached in 128-token blocks
+PREFIX_CACHE_MIN = 1024
+PREFIX_CACHE_BLOCK = 128
+
+
+def _tokens(text: str) -> List[str]:
+    """Split text into ~4-character pieces, roughly one model token each"""
+    return [text[i:i + 4] for i in range(0, len(text), 4)] or [""]
+
+
+class MockOpenAIServer:
+    """Threaded HTTP server speaking the (Azure) OpenAI chat-completions protocol
+
+    Serves ``POST /openai/deployments/<name>/chat/completions`` (Azure) and
+    ``POST /v1/chat/completions``, streaming or not, and ``GET /stats`` with
+    per-status request counts. Use as a context manager in tests or run
+    ``mock_server.py`` from the command line.
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            config: Behaviour (default: instant fixed response)
+            host: Bind address
+            port: Port (0 picks a free one; see .endpoint)
+        """
+        self.config = config or MockConfig()
+        self._random = random.Random(self.config.seed)
+        self._latency = parse_latency(self.config.latency, self._random)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._rule_uses: Counter = Counter()
+        self.stats: Counter = Counter()
+        self._prefixes = set()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint(self) -> str:
+        """Value for AZURE_OPENAI_ENDPOINT"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------------------------------------------------------------- behaviour
+
+    def plan(self, prompt: str) -> MockRule:
+        """Decide how to answer the next request"""
+        config = self.config
+        with self._lock:
+            index = self._count
+            self._count += 1
+            if config.burst_every and index % config.burst_every < config.burst_length:
+                return MockRule(status=config.burst_status)
+            if config.rate_429 and self._random.random() < config.rate_429:
+                return MockRule(status=429, retry_after=config.retry_after)
+            for i, rule in enumerate(config.rules):
+                if rule.match and not re.search(rule.match, prompt):
+                    continue
+                if rule.times is not None and self._rule_uses[i] >= rule.times:
+                    continue
+                self._rule_uses[i] += 1
+                return rule
+        return MockRule(content=config.content)
+
+    def cached_tokens(self, prompt: str) -> int:
+        """Length of the longest previously seen prompt prefix, counted like the real service"""
+        block = PREFIX_CACHE_BLOCK * 4  # characters per cache block (~4 characters per token)
+        digest = hashlib.sha256()
+        cached = 0
+        with self._lock:
+            for n in range(1, len(prompt) // block + 1):
+                digest.update(prompt[(n - 1) * block:n * block].encode("utf-8"))
+                key = digest.hexdigest()
+                if key in self._prefixes and n == cached // PREFIX_CACHE_BLOCK + 1:
+                    cached = n * PREFIX_CACHE_BLOCK
+                self._prefixes.add(key)
+        return cached if cached >= PREFIX_CACHE_MIN else 0
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass  # keep load tests quiet
+
+            def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+                with server._lock:
+                    server.stats[status] += 1
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    with server._lock:
+                        counts = {str(k): v for k, v in server.stats.items()}
+                    self._send_json(200, {"requests": server._count, "status": counts})
+                else:
+                    self._send_json(404, {"error": {"code": "NotFound", "message": self.path}})
+
+            def do_POST(self):
+                path = self.path.split("?", 1)[0]
+                match = CHAT_PATH.match(path)
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not match:
+                    self._send_json(404, {"error": {"code": "NotFound", "message": path}})
+                    return
+
+                prompt = "\n".join(
+                    m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content"))
+                    for m in request.get("messages", [])
+                )
+                rule = server.plan(prompt)
+                latency = parse_latency(rule.latency, server._random)() if rule.latency else server._latency()
+                time.sleep(latency)
+
+                if rule.status == 429:
+                    retry_after = rule.retry_after if rule.retry_after is not None else server.config.retry_after
+                    self._send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded (mock)"}}, {
+                        "Retry-After": str(max(1, math.ceil(retry_after))),
+                        "retry-after-ms": str(int(retry_after * 1000))
+                    })
+                    return
+                if rule.status >= 400:
+                    self._send_json(rule.status, {"error": {"code": str(rule.status), "message": "Injected failure (mock)"}})
+                    return
+
+                model = match.group("deployment") or request.get("model", "mock")
+                content = rule.content if rule.content is not None else server.config.content
+                finish_reason = "stop"
+                pieces = _tokens(content)
+                if request.get("max_tokens") and len(pieces) > request["max_tokens"]:
+                    # Cut off at the limit like the real service
+                    content, finish_reason = "".join(pieces[:request["max_tokens"]]), "length"
+                usage = {
+                    "prompt_tokens": max(1, len(prompt) // 4),
+                    "completion_tokens": len(_tokens(content)),
+                    "prompt_tokens_details": {"cached_tokens": server.cached_tokens(prompt)}
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                if request.get("stream"):
+                    self._stream(model, content, usage, bool((request.get("stream_options") or {}).get("include_usage")),
+                                 finish_reason)
+                else:
+                    self._send_json(200, {
+                        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": finish_reason
+                        }],
+                        "usage": usage
+                    })
+
+            def _stream(self, model: str, content: str, usage: Dict, include_usage: bool, finish_reason: str = "stop"):
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+                def event(choices, chunk_usage=None):
+                    body = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                            "model": model, "choices": choices, "usage": chunk_usage}
+                    self.wfile.write(f"data: {json.dumps(body)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                delay = 1.0 / server.config.tokens_per_second if server.config.tokens_per_second else 0.0
+                try:
+                    for piece in _tokens(content):
+                        event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                        time.sleep(delay)
+                    event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+                    if include_usage:
+                        event([], usage)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client cancelled (e.g. a hedge that lost the race)
+                with server._lock:
+                    server.stats[200] += 1
+
+        return Handler
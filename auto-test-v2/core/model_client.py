@@ -2,37 +2,429 @@
 Azure OpenAI Model Client
 使用 Azure AD 认证的 OpenAI 客户端
 """
+import asyncio
+import itertools
 import os
-from openai import AzureOpenAI
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
-from .retry import retry
+import time
+from contextlib import ExitStack, nullcontext
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Tuple
+from .client_pool import get_http_client, get_token_provider
+from .retry import retry, async_retry, CircuitOpenError, DEFAULT_POLICY
+from .router import Router, Target, get_router
+from .cassette import get_cassette
+from .concurrency import adaptive_concurrency_enabled, get_concurrency_controller
+from .singleflight import get_single_flight
+from .hedging import HedgeCancelled, HedgePolicy, HedgeToken, hedged
+from .response_cache import ResponseCache
+from .rate_limiter import RateLimiter, estimate_tokens, get_rate_limiter
+from .telemetry import CallRecord, get_telemetry, usage_fields
+from .token_predictor import CONTINUE_PROMPT, get_token_predictor
+
+if TYPE_CHECKING:  # openai is imported lazily, on first use
+    from openai import AsyncAzureOpenAI, AzureOpenAI
+
+
+def _strip_code_fences(content: str) -> str:
+    """Remove markdown code fences wrapping the whole response, if present"""
+    content = content.strip()
+    if content.startswith("```"):
+        lines = content.splitlines()
+        if len(lines) >= 2 and lines[-1].startswith("```"):
+            return "\n".join(lines[1:-1]).strip()
+    return content
+
+
+def _record_call(deployment: str, stage: str, started: float, usage=None, attempts: list = None, **extra):
+    """Report one model call (all retry attempts included) to the process-wide telemetry"""
+    get_telemetry().record(CallRecord(
+        stage=stage,
+        deployment=deployment,
+        latency=time.perf_counter() - started,
+        retries=max(0, len(attempts or []) - 1),
+        **usage_fields(usage),
+        **extra
+    ))
+
+
+def _continuation_messages(messages: list, partial: str) -> list:
+    """Ask the model to carry on from a reply that was cut off at max_tokens"""
+    return messages + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": CONTINUE_PROMPT}
+    ]
+
+
+REPLAY_ENDPOINT = "https://cassette-replay.invalid/"
+
+
+def _can_fail_over(exc: BaseException) -> bool:
+    """Transient/throttling errors and open circuits move on to the next deployment"""
+    return isinstance(exc, CircuitOpenError) or DEFAULT_POLICY.is_retryable(exc)
+
+
+def _router_for(router: Router, deployment: str) -> Router:
+    """Explicit router, else a single-deployment router for a pinned deployment, else the shared one"""
+    if router is not None:
+        return router
+    return Router.from_env(deployment) if deployment else get_router()
+
 
 class ModelClient:
     """Azure OpenAI Client with Azure AD Authentication"""
     
-    def __init__(self):
+    def __init__(self, cache: ResponseCache = None, rate_limiter: RateLimiter = None, deployment: str = None,
+                 router: Router = None, hedge: HedgePolicy = None):
+        """
+        Prefer core.client_pool.get_model_client() over constructing clients directly,
+        so the credential, token and HTTP connections are shared across the process.
+        
+        Args:
+            cache: Optional response cache. If None, built from MODEL_CACHE* env vars
+            rate_limiter: Optional RPM/TPM limiter. If None, the process-wide limiter is used
+            deployment: Pin every stage to this deployment (default: route by stage via MODEL_ROUTES)
+            router: Optional deployment router. If None, the process-wide router is used
+            hedge: Optional hedging policy for slow calls. If None, built from MODEL_HEDGE* env vars
+        """
         # 从环境变量读取配置
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
-        self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4.1")
+        # MODEL_CASSETTE: record calls to / replay them from a cassette file (replay needs no endpoint)
+        self.cassette = get_cassette()
+        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or (REPLAY_ENDPOINT if self._replaying else None)
+        self.api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
         
-        if not endpoint:
+        if not self.endpoint:
             raise RuntimeError("AZURE_OPENAI_ENDPOINT environment variable missing")
         
-        # 使用无密钥认证（Azure AD Token）
-        token_provider = get_bearer_token_provider(
-            DefaultAzureCredential(),
-            "https://cognitiveservices.azure.com/.default"
-        )
+        # 按阶段选择部署（未配置 MODEL_ROUTES 时所有阶段使用 AZURE_OPENAI_DEPLOYMENT）
+        self.router = _router_for(router, deployment)
+        self.deployment = self.router.default.name
+        
+        # 使用无密钥认证（Azure AD Token），凭据与 HTTP 连接池进程内共享；客户端在首次请求时创建
+        self._clients = {}
+        
+        # 可选的磁盘响应缓存
+        self.cache = cache if cache is not None else ResponseCache.from_env()
+        
+        # 进程级共享的 RPM/TPM 速率限制器
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+        
+        # 可选的对冲请求（默认关闭）
+        self.hedge = hedge if hedge is not None else HedgePolicy.from_env()
+        
+        # 进程级共享的相同请求合并（MODEL_SINGLEFLIGHT=0 关闭）
+        self.single_flight = get_single_flight()
+        # MODEL_ADAPTIVE_CONCURRENCY: AIMD window per deployment, shrinks on 429/timeouts
+        self.adaptive_concurrency = adaptive_concurrency_enabled()
+        # max_tokens=None: predict the limit per call and continue outputs cut off at it
+        self.predictor = get_token_predictor()
+        self.max_continuations = int(os.getenv("MODEL_MAX_CONTINUATIONS", "2"))
+    
+    def _client_for(self, target: Target) -> "AzureOpenAI":
+        """OpenAI client for the target's endpoint (one per endpoint, sharing token and HTTP pool)"""
+        endpoint = target.endpoint or self.endpoint
+        if endpoint not in self._clients:
+            # Imported on first use: openai costs ~0.7s to import and CLIs/--help/replays never need it
+            from openai import AzureOpenAI
+            self._clients[endpoint] = AzureOpenAI(
+                azure_endpoint=endpoint,
+                api_version=self.api_version,
+                azure_ad_token_provider=get_token_provider(endpoint),
+                http_client=get_http_client(),
+                max_retries=0  # retries are handled by core.retry
+            )
+        return self._clients[endpoint]
+    
+    @property
+    def _client(self) -> "AzureOpenAI":
+        """Client for the default deployment's endpoint"""
+        return self._client_for(self.router.default)
+    
+    @property
+    def _replaying(self) -> bool:
+        return self.cassette is not None and self.cassette.replaying
+    
+    def _completions(self, target: Target):
+        """chat.completions for the target, routed through the cassette when recording/replaying"""
+        if self.cassette is None:
+            return self._client_for(target).chat.completions
+        if self._replaying and (target.endpoint or self.endpoint) not in self._clients:
+            return self.cassette.wrap(None).chat.completions  # replay never touches the real client
+        return self.cassette.wrap(self._client_for(target)).chat.completions
+    
+    def _failover(self, stage: str, call: Callable[[Target], object], attempts: list,
+                  record_success: bool = True) -> Tuple[object, Target]:
+        """
+        Run call(target) against the stage's candidate deployments in router order
+        
+        Every candidate except the last gets a single attempt, so a throttled or
+        failing deployment hands over immediately instead of backing off; the last
+        one gets the full retry policy. Fatal errors (bad request, auth) are raised
+        without failing over.
+        
+        Returns:
+            (result, target that produced it)
+        """
+        candidates = self.router.candidates(stage)
+        for i, target in enumerate(candidates):
+            is_last = i == len(candidates) - 1
+            started = time.perf_counter()
+            try:
+                result = retry(lambda: call(target), attempts=None if is_last else 1, key=target.key,
+                               breaker=True, on_attempt=attempts.append)
+            except Exception as e:
+                if _can_fail_over(e):
+                    self.router.record(stage, target, time.perf_counter() - started, ok=False)
+                if is_last or not _can_fail_over(e):
+                    raise
+                print(f"⚠️ {target.key} unavailable ({type(e).__name__}), failing over to {candidates[i + 1].key}")
+                continue
+            if record_success:
+                self.router.record(stage, target, time.perf_counter() - started, ok=True)
+            return result, target
+        raise AssertionError("unreachable")  # pragma: no cover
+    
+    def _slot(self, target: Target):
+        """Concurrency slot for one request to target (no-op when adaptive concurrency is off)"""
+        if not self.adaptive_concurrency:
+            return nullcontext()
+        return get_concurrency_controller(target.key).slot()
+    
+    def _max_tokens(self, stage: str, max_tokens: Optional[int], size_hint: Optional[float]) -> int:
+        """Explicit max_tokens, else the predicted limit (16000 when prediction is off)"""
+        if max_tokens is not None:
+            return max_tokens
+        return self.predictor.predict(stage, size_hint) if self.predictor is not None else 16000
+    
+    def _observe(self, stage: str, size_hint: Optional[float], completion_tokens: int):
+        if self.predictor is not None:
+            self.predictor.observe(stage, size_hint, completion_tokens)
+    
+    def _hedge_delay(self, stage: str, target: Target):
+        """Seconds after which a call should be hedged, or None when hedging is off or lacks history"""
+        if self.hedge is None:
+            return None
+        return self.hedge.delay(self.router.stats(stage, target))
+    
+    def _reserve_hedge(self, target: Target, reserved: int, held: list) -> bool:
+        """
+        Take a concurrency slot and rate-limit budget for a hedge without waiting
+
+        Args:
+            target: Deployment the hedge goes to
+            reserved: Token reservation of the request
+            held: Receives (controller or None, tokens taken) for _release_hedges
+
+        Returns:
+            False (nothing taken) when the window is full or the quota is exhausted
+        """
+        controller = get_concurrency_controller(target.key) if self.adaptive_concurrency else None
+        if controller is not None and not controller.try_acquire():
+            return False
+        taken = 0
+        if self.rate_limiter is not None:
+            wait, taken = self.rate_limiter.try_acquire(reserved)
+            if wait > 0.0:
+                if controller is not None:
+                    controller.release(HedgeCancelled())  # neutral outcome: the window is left as it was
+                return False
+        held.append((controller, taken))
+        return True
+    
+    def _release_hedges(self, held: list, prompt_tokens: int, reported: List[int]):
+        """
+        Free the slots of the duplicates once a race is decided and settle their budget
         
-        # 初始化客户端
-        self._client = AzureOpenAI(
-            azure_endpoint=endpoint,
-            api_version=api_version,
-            azure_ad_token_provider=token_provider
+        The service has accepted every duplicate and counts it against the quota, so each
+        is settled against the usage a finished loser reported, else its prompt tokens.
+        """
+        for controller, taken in held:
+            if controller is not None:
+                controller.release(HedgeCancelled())
+            self._settle(taken, reported.pop() if reported else prompt_tokens)
+    
+    def _settle(self, taken: int, used: int):
+        """Return the unused part of a rate-limit reservation (no-op without a limiter)"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.settle(taken, used)
+    
+    def _open_stream(self, target: Target, messages: list, temperature: float, max_tokens: int):
+        return self._completions(target).create(
+            model=target.name,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True}
         )
     
-    def generate(self, system_prompt: str, user_prompt: str, temperature: float = 0.3, max_tokens: int = 16000) -> str:
+    def _read_cancellable(self, target: Target, messages: list, temperature: float, max_tokens: int,
+                          token: HedgeToken, finished: Optional[list] = None):
+        """One racing request: stream the completion so a lost race can close the connection
+
+        The usage of every request that reads to the end is appended to finished.
+        """
+        stream = self._open_stream(target, messages, temperature, max_tokens)
+        token.on_cancel(stream.close)
+        parts = []
+        usage = None
+        finish_reason = None
+        try:
+            for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if chunk.choices:
+                    finish_reason = getattr(chunk.choices[0], "finish_reason", None) or finish_reason
+                    if chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+        except Exception:
+            if token.cancelled:
+                raise HedgeCancelled()
+            raise
+        if usage is not None and finished is not None:
+            finished.append(usage)
+        if token.cancelled:
+            raise HedgeCancelled()
+        return "".join(parts), usage, finish_reason
+    
+    def _open_until_first_chunk(self, target: Target, messages: list, temperature: float, max_tokens: int,
+                                token: HedgeToken):
+        """One racing stream: open it and buffer chunks up to the first content delta"""
+        stream = self._open_stream(target, messages, temperature, max_tokens)
+        token.on_cancel(stream.close)
+        chunks = iter(stream)
+        buffered = []
+        try:
+            for chunk in chunks:
+                buffered.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except Exception:
+            if token.cancelled:
+                raise HedgeCancelled()
+            raise
+        if token.cancelled:
+            raise HedgeCancelled()
+        return buffered, chunks
+    
+    def _complete(self, messages: list, temperature: float, max_tokens: Optional[int], use_cache: bool = True,
+                  stage: str = "generate", size_hint: Optional[float] = None) -> str:
+        """
+        Run one chat completion (cached, coalesced and retried) and strip markdown fences
+        
+        Args:
+            messages: Full message list sent to the model
+            temperature: Response randomness
+            max_tokens: Maximum tokens to generate (None: predicted, with continuation if cut off)
+            use_cache: Set False to bypass the response cache for this call
+            stage: Pipeline stage reported to telemetry (generate/refine/evaluate/analyze/...)
+            size_hint: Size of the expected output for max_tokens prediction (see TokenPredictor)
+        
+        Returns:
+            Generated text
+        """
+        started = time.perf_counter()
+        primary = self.router.targets(stage)[0].name
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = ResponseCache.make_key(primary, messages, temperature, max_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                _record_call(primary, stage, started, cache_hit=True)
+                return cached
+        
+        call = lambda: self._call_model(messages, temperature, max_tokens, stage, started, size_hint)
+        if self.single_flight is None:
+            content = call()
+        else:
+            # Identical concurrent requests (GUI, batch, workflow) share one in-flight call
+            flight_key = cache_key or ResponseCache.make_key(primary, messages, temperature, max_tokens)
+            content, shared = self.single_flight.do(flight_key, call)
+            if shared:
+                _record_call(primary, stage, started, coalesced=True)
+                return content
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+        return content
+    
+    def _call_model(self, messages: list, temperature: float, max_tokens: Optional[int], stage: str,
+                    started: float, size_hint: Optional[float] = None) -> str:
+        """Complete a request, continuing up to max_continuations times while output hits max_tokens"""
+        limit = self._max_tokens(stage, max_tokens, size_hint)
+        parts = []
+        completion_tokens = 0
+        request = messages
+        for continuation in itertools.count():
+            content, finish_reason, usage = self._call_once(request, temperature, limit, stage, started)
+            parts.append(content)
+            completion_tokens += getattr(usage, "completion_tokens", None) or 0
+            if finish_reason != "length" or continuation >= self.max_continuations:
+                break
+            print(f"✂️  {stage} output hit max_tokens={limit}, requesting continuation {continuation + 1}")
+            request = _continuation_messages(messages, "".join(parts))
+            started = time.perf_counter()
+        if max_tokens is None:
+            self._observe(stage, size_hint, completion_tokens)
+        return _strip_code_fences("".join(parts))
+    
+    def _call_once(self, messages: list, temperature: float, max_tokens: int, stage: str,
+                   started: float) -> Tuple[str, Optional[str], object]:
+        """Send one completion through failover/retry/hedging and report it to telemetry
+        
+        Returns:
+            (raw content, finish_reason, usage)
+        """
+        attempts = []
+        last = {"target": self.router.default, "hedges": 0}
+        
+        def _call(target: Target):
+            last["target"] = target
+            reserved = estimate_tokens(messages, max_tokens)
+            taken = self.rate_limiter.acquire(reserved) if self.rate_limiter is not None else 0
+            delay = self._hedge_delay(stage, target)
+            hedge_quota = []
+            finished = []
+            try:
+                with self._slot(target):
+                    if delay is None:
+                        resp = self._completions(target).create(
+                            model=target.name,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens
+                        )
+                        choice = resp.choices[0]
+                        content, usage, finish_reason = choice.message.content, resp.usage, getattr(choice, "finish_reason", None)
+                    else:
+                        (content, usage, finish_reason), hedges = hedged(
+                            lambda token: self._read_cancellable(target, messages, temperature, max_tokens, token,
+                                                                 finished),
+                            delay, self.hedge.max_hedges, lambda: self._reserve_hedge(target, reserved, hedge_quota)
+                        )
+                        last["hedges"] += hedges
+            except BaseException:
+                usage = None
+                self._settle(taken, 0)  # a failed attempt hands its whole reservation back
+                raise
+            finally:
+                # One reservation pays for the answer; the duplicates are billed for what they used
+                self._release_hedges(hedge_quota, estimate_tokens(messages),
+                                     [u.total_tokens for u in finished if u is not usage])
+            if usage is not None:
+                self._settle(taken, usage.total_tokens)
+            last["usage"] = usage
+            return content or "", finish_reason
+        
+        try:
+            (content, finish_reason), target = self._failover(stage, _call, attempts)
+        except Exception as e:
+            _record_call(last["target"].name, stage, started, attempts=attempts, error=type(e).__name__,
+                         hedges=last["hedges"], max_tokens=max_tokens)
+            raise
+        _record_call(target.name, stage, started, last.get("usage"), attempts, hedges=last["hedges"],
+                     max_tokens=max_tokens, truncated=finish_reason == "length")
+        return content, finish_reason, last.get("usage")
+    
+    def generate(self, system_prompt: str, user_prompt: str, temperature: float = 0.3, max_tokens: Optional[int] = None,
+                 use_cache: bool = True, stage: str = "generate", size_hint: Optional[float] = None) -> str:
         """
         Generate response from Azure OpenAI
         
@@ -40,56 +432,365 @@ class ModelClient:
             system_prompt: System instruction
             user_prompt: User query
             temperature: Response randomness (0.0-1.0)
-            max_tokens: Maximum tokens to generate (default 16000 - maximum for GPT-4)
+            max_tokens: Maximum tokens to generate (default: predicted per stage, continued if cut off)
+            use_cache: Set False to bypass the response cache for this call
+            stage: Pipeline stage reported to telemetry
+            size_hint: Expected output size for prediction (test steps for generate, script tokens for refine)
         
         Returns:
             Generated text
         """
-        def _call():
-            resp = self._client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            content = resp.choices[0].message.content.strip()
-            # Remove markdown code fences if present
-            if content.startswith("```"):
-                lines = content.splitlines()
-                if len(lines) >= 2 and lines[-1].startswith("```"):
-                    return "\n".join(lines[1:-1]).strip()
-            return content
-        
-        return retry(_call)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        return self._complete(messages, temperature, max_tokens, use_cache, stage, size_hint)
     
-    def generate_with_context(self, messages: list, temperature: float = 0.3, max_tokens: int = 16000) -> str:
+    def generate_with_context(self, messages: list, temperature: float = 0.3, max_tokens: Optional[int] = None,
+                              use_cache: bool = True, stage: str = "generate", size_hint: Optional[float] = None) -> str:
         """
         Generate with conversation context
         
         Args:
             messages: List of {"role": "...", "content": "..."} dicts
             temperature: Response randomness
-            max_tokens: Maximum tokens to generate (default 16000 - maximum for GPT-4)
+            max_tokens: Maximum tokens to generate (default: predicted per stage, continued if cut off)
+            use_cache: Set False to bypass the response cache for this call
+            stage: Pipeline stage reported to telemetry
+            size_hint: Expected output size for prediction (test steps for generate, script tokens for refine)
         
         Returns:
             Generated text
         """
-        def _call():
-            resp = self._client.chat.completions.create(
-                model=self.deployment,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
+        return self._complete(messages, temperature, max_tokens, use_cache, stage, size_hint)
+    
+    def generate_stream(self, system_prompt: str = None, user_prompt: str = None, messages: list = None,
+                        temperature: float = 0.3, max_tokens: Optional[int] = None, use_cache: bool = True,
+                        stage: str = "generate", size_hint: Optional[float] = None) -> Iterator[str]:
+        """
+        Stream a completion as it is generated
+        
+        Pass either system_prompt + user_prompt, or a full messages list. Chunks are
+        yielded raw (markdown fences are not stripped); join them and pass the result
+        through the same cleanup as a non-streamed response. Cache hits are yielded
+        as a single chunk. A stream cut off at max_tokens is followed seamlessly by
+        the chunks of a continuation call.
+        
+        Args:
+            system_prompt: System instruction
+            user_prompt: User query
+            messages: Full message list (overrides system_prompt/user_prompt)
+            temperature: Response randomness
+            max_tokens: Maximum tokens to generate (default: predicted per stage)
+            use_cache: Set False to bypass the response cache for this call
+            stage: Pipeline stage reported to telemetry
+            size_hint: Expected output size for prediction (see generate)
+        
+        Yields:
+            Text chunks in arrival order
+        """
+        if messages is None:
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+        
+        started = time.perf_counter()
+        primary = self.router.targets(stage)[0].name
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = ResponseCache.make_key(primary, messages, temperature, max_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                _record_call(primary, stage, started, cache_hit=True, streamed=True)
+                yield cached
+                return
+        
+        limit = self._max_tokens(stage, max_tokens, size_hint)
+        parts = []
+        completion_tokens = 0
+        request = messages
+        for continuation in itertools.count():
+            finish_reason, usage = yield from self._stream_once(request, temperature, limit, stage, started, parts)
+            completion_tokens += getattr(usage, "completion_tokens", None) or 0
+            if finish_reason != "length" or continuation >= self.max_continuations:
+                break
+            print(f"✂️  {stage} output hit max_tokens={limit}, requesting continuation {continuation + 1}")
+            request = _continuation_messages(messages, "".join(parts))
+            started = time.perf_counter()
+        
+        if max_tokens is None:
+            self._observe(stage, size_hint, completion_tokens)
+        if cache_key is not None:
+            self.cache.put(cache_key, _strip_code_fences("".join(parts)))
+    
+    def _stream_once(self, messages: list, temperature: float, max_tokens: int, stage: str, started: float,
+                     parts: List[str]):
+        """Stream one completion, appending its deltas to parts; returns (finish_reason, usage)"""
+        attempts = []
+        reserved = estimate_tokens(messages, max_tokens)
+        target = self.router.default
+        first_token_stage = f"{stage}:first-token"
+        last = {"hedges": 0}
+        
+        def _open(candidate: Target):
+            taken = self.rate_limiter.acquire(reserved) if self.rate_limiter is not None else 0
+            hedge_quota = []
+            try:
+                with ExitStack() as slot:
+                    # A failed open releases the slot with its error (429/timeout shrink the window)
+                    slot.enter_context(self._slot(candidate))
+                    last["opened"] = time.perf_counter()
+                    # Hedge on time to first token: a replica that has not started answering is the usual stall
+                    delay = self._hedge_delay(first_token_stage, candidate)
+                    if delay is None:
+                        result = [], iter(self._open_stream(candidate, messages, temperature, max_tokens))
+                    else:
+                        result, hedges = hedged(
+                            lambda token: self._open_until_first_chunk(candidate, messages, temperature, max_tokens,
+                                                                       token),
+                            delay, self.hedge.max_hedges,
+                            lambda: self._reserve_hedge(candidate, reserved, hedge_quota)
+                        )
+                        last["hedges"] += hedges
+                    # An open stream keeps its slot until it has been read to the end
+                    last["slot"] = slot.pop_all()
+            except BaseException:
+                self._settle(taken, 0)
+                raise
+            finally:
+                # Losers are cancelled at the winner's first token, before any usage is reported
+                self._release_hedges(hedge_quota, estimate_tokens(messages), [])
+            last["taken"] = taken
+            return result
+        
+        # Only opening the stream is retried/failed over; a stream that fails midway raises
+        usage = None
+        finish_reason = None
+        first = True
+        try:
+            (buffered, stream), target = self._failover(stage, _open, attempts, record_success=False)
+            with last.pop("slot"):
+                for chunk in itertools.chain(buffered, stream):
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    finish_reason = getattr(chunk.choices[0], "finish_reason", None) or finish_reason
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first:
+                            self.router.record(first_token_stage, target, time.perf_counter() - last["opened"], ok=True)
+                            first = False
+                        parts.append(delta)
+                        yield delta
+        except Exception as e:
+            # A stream that broke midway is billed for what it reported, if anything
+            self._settle(last.get("taken", 0), usage.total_tokens if usage is not None else 0)
+            _record_call(target.name, stage, started, usage, attempts, streamed=True, error=type(e).__name__,
+                         hedges=last["hedges"], max_tokens=max_tokens)
+            raise
+        
+        self.router.record(stage, target, time.perf_counter() - started, ok=True)
+        _record_call(target.name, stage, started, usage, attempts, streamed=True, hedges=last["hedges"],
+                     max_tokens=max_tokens, truncated=finish_reason == "length")
+        if usage is not None:
+            self._settle(last["taken"], usage.total_tokens)
+        return finish_reason, usage
+
+
+class AsyncModelClient:
+    """Async Azure OpenAI Client with bounded request concurrency
+
+    `max_concurrency` is a hard per-client cap; within it the shared AIMD
+    window of each deployment decides how many requests actually go out.
+    """
+    
+    def __init__(self, max_concurrency: int = None, cache: ResponseCache = None, rate_limiter: RateLimiter = None,
+                 deployment: str = None, router: Router = None):
+        """
+        Args:
+            max_concurrency: Hard cap on in-flight requests (default: MODEL_MAX_CONCURRENCY env var or 8)
+            cache: Optional response cache. If None, built from MODEL_CACHE* env vars
+            rate_limiter: Optional RPM/TPM limiter. If None, the process-wide limiter is used
+            deployment: Pin every stage to this deployment (default: route by stage via MODEL_ROUTES)
+            router: Optional deployment router. If None, the process-wide router is used
+        """
+        # MODEL_CASSETTE: record calls to / replay them from a cassette file (replay needs no endpoint)
+        self.cassette = get_cassette()
+        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or (REPLAY_ENDPOINT if self._replaying else None)
+        self.api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
+        
+        if not self.endpoint:
+            raise RuntimeError("AZURE_OPENAI_ENDPOINT environment variable missing")
+        
+        self.router = _router_for(router, deployment)
+        self.deployment = self.router.default.name
+        
+        # 使用无密钥认证（Azure AD Token），与同步客户端共享后台刷新的 Token
+        self._clients = {}
+        
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("MODEL_MAX_CONCURRENCY", "8"))
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.adaptive_concurrency = adaptive_concurrency_enabled()
+        self.predictor = get_token_predictor()
+        self.max_continuations = int(os.getenv("MODEL_MAX_CONTINUATIONS", "2"))
+        self.cache = cache if cache is not None else ResponseCache.from_env()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+    
+    def _client_for(self, target: Target) -> "AsyncAzureOpenAI":
+        """Async OpenAI client for the target's endpoint"""
+        endpoint = target.endpoint or self.endpoint
+        if endpoint not in self._clients:
+            from openai import AsyncAzureOpenAI
+            self._clients[endpoint] = AsyncAzureOpenAI(
+                azure_endpoint=endpoint,
+                api_version=self.api_version,
+                azure_ad_token_provider=get_token_provider(endpoint),
+                max_retries=0  # retries are handled by core.retry
             )
-            content = resp.choices[0].message.content.strip()
-            # Remove markdown code fences if present
-            if content.startswith("```"):
-                lines = content.splitlines()
-                if len(lines) >= 2 and lines[-1].startswith("```"):
-                    return "\n".join(lines[1:-1]).strip()
-            return content
-        
-        return retry(_call)
+        return self._clients[endpoint]
+    
+    @property
+    def _replaying(self) -> bool:
+        return self.cassette is not None and self.cassette.replaying
+    
+    def _completions(self, target: Target):
+        """Async counterpart of ModelClient._completions"""
+        if self.cassette is None:
+            return self._client_for(target).chat.completions
+        if self._replaying and (target.endpoint or self.endpoint) not in self._clients:
+            return self.cassette.wrap_async(None).chat.completions
+        return self.cassette.wrap_async(self._client_for(target)).chat.completions
+    
+    def _slot(self, target: Target):
+        """Async counterpart of ModelClient._slot"""
+        if not self.adaptive_concurrency:
+            return nullcontext()
+        return get_concurrency_controller(target.key).slot_async()
+    
+    async def _failover(self, stage: str, call, attempts: list) -> Tuple[object, Target]:
+        """Async counterpart of ModelClient._failover"""
+        candidates = self.router.candidates(stage)
+        for i, target in enumerate(candidates):
+            is_last = i == len(candidates) - 1
+            started = time.perf_counter()
+            try:
+                result = await async_retry(lambda: call(target), attempts=None if is_last else 1, key=target.key,
+                                           breaker=True, on_attempt=attempts.append)
+            except Exception as e:
+                if _can_fail_over(e):
+                    self.router.record(stage, target, time.perf_counter() - started, ok=False)
+                if is_last or not _can_fail_over(e):
+                    raise
+                print(f"⚠️ {target.key} unavailable ({type(e).__name__}), failing over to {candidates[i + 1].key}")
+                continue
+            self.router.record(stage, target, time.perf_counter() - started, ok=True)
+            return result, target
+        raise AssertionError("unreachable")  # pragma: no cover
+    
+    def _max_tokens(self, stage: str, max_tokens: Optional[int], size_hint: Optional[float]) -> int:
+        """Async counterpart of ModelClient._max_tokens"""
+        if max_tokens is not None:
+            return max_tokens
+        return self.predictor.predict(stage, size_hint) if self.predictor is not None else 16000
+    
+    def _observe(self, stage: str, size_hint: Optional[float], completion_tokens: int):
+        if self.predictor is not None:
+            self.predictor.observe(stage, size_hint, completion_tokens)
+    
+    async def _complete(self, messages: list, temperature: float, max_tokens: Optional[int], use_cache: bool = True,
+                        stage: str = "generate", size_hint: Optional[float] = None) -> str:
+        """Async counterpart of ModelClient._complete; waits for a concurrency slot per attempt"""
+        started = time.perf_counter()
+        primary = self.router.targets(stage)[0].name
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = ResponseCache.make_key(primary, messages, temperature, max_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                _record_call(primary, stage, started, cache_hit=True)
+                return cached
+        
+        limit = self._max_tokens(stage, max_tokens, size_hint)
+        parts = []
+        completion_tokens = 0
+        request = messages
+        for continuation in itertools.count():
+            content, finish_reason, usage = await self._call_once(request, temperature, limit, stage, started)
+            parts.append(content)
+            completion_tokens += getattr(usage, "completion_tokens", None) or 0
+            if finish_reason != "length" or continuation >= self.max_continuations:
+                break
+            print(f"✂️  {stage} output hit max_tokens={limit}, requesting continuation {continuation + 1}")
+            request = _continuation_messages(messages, "".join(parts))
+            started = time.perf_counter()
+        if max_tokens is None:
+            self._observe(stage, size_hint, completion_tokens)
+        
+        content = _strip_code_fences("".join(parts))
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+        return content
+    
+    async def _call_once(self, messages: list, temperature: float, max_tokens: int, stage: str,
+                         started: float) -> Tuple[str, Optional[str], object]:
+        """Async counterpart of ModelClient._call_once"""
+        attempts = []
+        last = {"target": self.router.default}
+        
+        async def _call(target: Target):
+            last["target"] = target
+            reserved = estimate_tokens(messages, max_tokens)
+            taken = await self.rate_limiter.acquire_async(reserved) if self.rate_limiter is not None else 0
+            try:
+                # Hold the slot only while the request is in flight, not during retry backoff
+                async with self._semaphore, self._slot(target):
+                    resp = await self._completions(target).create(
+                        model=target.name,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+            except BaseException:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.settle(taken, 0)
+                raise
+            if self.rate_limiter is not None and resp.usage is not None:
+                self.rate_limiter.settle(taken, resp.usage.total_tokens)
+            last["usage"] = resp.usage
+            choice = resp.choices[0]
+            return choice.message.content or "", getattr(choice, "finish_reason", None)
+        
+        try:
+            (content, finish_reason), target = await self._failover(stage, _call, attempts)
+        except Exception as e:
+            _record_call(last["target"].name, stage, started, attempts=attempts, error=type(e).__name__,
+                         max_tokens=max_tokens)
+            raise
+        _record_call(target.name, stage, started, last.get("usage"), attempts, max_tokens=max_tokens,
+                     truncated=finish_reason == "length")
+        return content, finish_reason, last.get("usage")
+    
+    async def generate(self, system_prompt: str, user_prompt: str, temperature: float = 0.3,
+                       max_tokens: Optional[int] = None, use_cache: bool = True, stage: str = "generate",
+                       size_hint: Optional[float] = None) -> str:
+        """Async version of ModelClient.generate"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        return await self._complete(messages, temperature, max_tokens, use_cache, stage, size_hint)
+    
+    async def generate_with_context(self, messages: list, temperature: float = 0.3, max_tokens: Optional[int] = None,
+                                    use_cache: bool = True, stage: str = "generate",
+                                    size_hint: Optional[float] = None) -> str:
+        """Async version of ModelClient.generate_with_context"""
+        return await self._complete(messages, temperature, max_tokens, use_cache, stage, size_hint)
+    
+    async def aclose(self):
+        """Close the underlying HTTP clients"""
+        for client in self._clients.values():
+            await client.close()
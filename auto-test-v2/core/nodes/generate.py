@@ -3,16 +3,23 @@ Generate Node: Generate PowerShell test script using AI
 生成节点：使用AI生成PowerShell测试脚本
 """
 from pathlib import Path
+from typing import Optional
+from langchain_core.runnables import RunnableConfig
 from ..state import AutoTestState
 from ..test_generator import TestScriptGenerator
 
 
-def generate_script_node(state: AutoTestState) -> AutoTestState:
+def generate_script_node(state: AutoTestState, config: Optional[RunnableConfig] = None) -> AutoTestState:
     """
     Generate PowerShell test script using AI
     
+    The script is streamed to disk while it is generated. If the run config carries
+    an ``output_queue`` (``config["configurable"]["output_queue"]``), each generated
+    line is also pushed to it as a GUI ("log", line, "info") message.
+    
     Args:
         state: Current workflow state with parsed_data
+        config: LangGraph run config (optional)
     
     Returns:
         Updated state with generated_script_path and generated_script_content
@@ -26,10 +33,6 @@ def generate_script_node(state: AutoTestState) -> AutoTestState:
                 "errors": state["errors"] + ["No parsed data available for script generation"]
             }
         
-        # Generate script
-        generator = TestScriptGenerator()
-        script_content = generator.generate_script(state["parsed_data"])
-        
         # Save script to LangGraph-specific output directory
         output_dir = Path(__file__).parent.parent.parent / "output_langgraph"
         output_dir.mkdir(parents=True, exist_ok=True)
@@ -38,6 +41,24 @@ def generate_script_node(state: AutoTestState) -> AutoTestState:
         logs_dir = output_dir / "logs"
         logs_dir.mkdir(parents=True, exist_ok=True)
         
+        test_case_id = state["test_case_id"]
+        script_filename = f"test_{test_case_id}.ps1"
+        script_path = output_dir / script_filename
+        
+        # Push partial output to the GUI if a queue was provided
+        output_queue = ((config or {}).get("configurable") or {}).get("output_queue")
+        on_line = None
+        if output_queue is not None:
+            on_line = lambda line: output_queue.put(("log", f"   {line}", "info"))
+        
+        # Generate script, streaming the draft into script_path as it arrives
+        generator = TestScriptGenerator()
+        script_content = generator.generate_script(
+            state["parsed_data"],
+            stream_path=str(script_path),
+            on_line=on_line
+        )
+        
         # Replace log path in script to use LangGraph output directory
         # Original: $logDir = "$PSScriptRoot\\..\\output\\logs"
         # Replace with absolute path to output_langgraph/logs
@@ -46,10 +67,6 @@ def generate_script_node(state: AutoTestState) -> AutoTestState:
             f'$logDir = "{str(logs_dir)}"'
         )
         
-        test_case_id = state["test_case_id"]
-        script_filename = f"test_{test_case_id}.ps1"
-        script_path = output_dir / script_filename
-        
         with open(script_path, 'w', encoding='utf-8') as f:
             f.write(script_content)
         
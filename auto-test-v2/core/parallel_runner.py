@@ -0,0 +1,155 @@
+"""
+Parallel Case Generation
+并行批量生成：多个测试用例在线程池中同时走 生成 → 审查 流程，共享同一个模型客户端与限流器
+"""
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .csv_parser import parse_csv_to_json
+from .priority import current_lane, priority_lane
+from .telemetry import get_telemetry
+from .test_generator import TestScriptGenerator
+
+
+CASE_SUFFIXES = (".csv", ".json")
+
+
+def collect_case_files(spec: str) -> List[str]:
+    """
+    Resolve --batch input to case files
+
+    Args:
+        spec: Directory (every *.csv / *.json in it) or glob pattern
+
+    Returns:
+        Sorted paths; a JSON file converted from a CSV of the same name is
+        skipped in favour of the CSV, which is the source of truth
+    """
+    if os.path.isdir(spec):
+        paths = [str(p) for p in Path(spec).iterdir() if p.suffix.lower() in CASE_SUFFIXES]
+    else:
+        paths = [p for p in glob.glob(spec) if Path(p).suffix.lower() in CASE_SUFFIXES]
+    csv_stems = {Path(p).with_suffix("") for p in paths if p.lower().endswith(".csv")}
+    return sorted(p for p in paths if p.lower().endswith(".csv") or Path(p).with_suffix("") not in csv_stems)
+
+
+def load_case(path: str) -> Dict:
+    """Parse one CSV or JSON case (CSV is converted in memory, no JSON is written)"""
+    if path.lower().endswith(".csv"):
+        return parse_csv_to_json(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@dataclass
+class CaseResult:
+    """Outcome of one case in a batch"""
+    path: str
+    test_case_id: str = ""
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    skipped: bool = False  # output already up to date (build manifest)
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ParallelCaseRunner:
+    """Run generate (+ refine) for many cases on a worker pool
+
+    All workers share one TestScriptGenerator, so they go through the same
+    model client, rate limiter and adaptive concurrency window; `workers`
+    only bounds how many cases are in progress at once.
+    """
+
+    def __init__(self, generator: TestScriptGenerator, workers: int = 4, refine: bool = True,
+                 output_dir: str = "output", force: bool = False):
+        """
+        Args:
+            generator: Shared generator (and through it the shared model client)
+            workers: Cases processed in parallel
+            refine: Run the review/correction step for each case
+            output_dir: Directory receiving test_<id>.ps1 files
+            force: Regenerate cases whose outputs are up to date
+        """
+        self.generator = generator
+        self.workers = max(1, workers)
+        self.refine = refine
+        self.force = force
+        self.output_dir = Path(output_dir)
+        self.elapsed = 0.0
+        self.usage: Dict[str, float] = {}
+
+    def _run_case(self, path: str, lane: str) -> CaseResult:
+        result = CaseResult(path=path)
+        started = time.perf_counter()
+        try:
+            with priority_lane(lane):
+                test_case = load_case(path)
+                result.test_case_id = test_case["test_case_id"]
+                output_path = str(self.output_dir / f"test_{result.test_case_id}.ps1")
+                if not self.force and self.generator.is_up_to_date(test_case, output_path, self.refine):
+                    result.output_path, result.skipped = output_path, True
+                else:
+                    result.output_path = self.generator.generate_and_save_case(
+                        test_case, output_path=output_path, refine=self.refine, force=True
+                    )
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def run(self, paths: List[str], on_result: Optional[Callable[[CaseResult], None]] = None) -> List[CaseResult]:
+        """
+        Process every case; a failing case is recorded and does not stop the others
+
+        Args:
+            paths: CSV/JSON case files
+            on_result: Called (from the calling thread) as each case finishes
+
+        Returns:
+            CaseResults in input order
+        """
+        telemetry = get_telemetry()
+        mark = telemetry.mark()
+        started = time.perf_counter()
+        # Worker threads start with a fresh context, so hand them the caller's lane
+        lane = current_lane()
+        results: Dict[str, CaseResult] = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="case") as pool:
+            futures = {pool.submit(self._run_case, path, lane): path for path in paths}
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.path] = result
+                if on_result is not None:
+                    on_result(result)
+        self.elapsed = time.perf_counter() - started
+        self.usage = telemetry.summary(mark).get("total", {})
+        return [results[path] for path in paths]
+
+    def format_results(self, results: List[CaseResult]) -> str:
+        """Per-case status table followed by throughput (cases/min, tokens/min)"""
+        lines = [f"   {'case':<24} {'status':<8} {'time':>7}  output / error"]
+        for r in results:
+            name = r.test_case_id or Path(r.path).name
+            status = "FAILED" if not r.ok else "skipped" if r.skipped else "ok"
+            lines.append(f"   {name:<24} {status:<8} {r.seconds:>6.1f}s  {r.output_path if r.ok else r.error}")
+
+        done = sum(r.ok and not r.skipped for r in results)
+        skipped = sum(r.skipped for r in results)
+        minutes = max(self.elapsed, 1e-9) / 60
+        tokens = self.usage.get("prompt_tokens", 0) + self.usage.get("completion_tokens", 0)
+        lines.append(
+            f"📊 {done}/{len(results)} cases generated ({skipped} up to date) in {self.elapsed:.1f}s "
+            f"with {self.workers} workers: {done / minutes:.1f} cases/min, {tokens / minutes:,.0f} tokens/min "
+            f"({int(self.usage.get('calls', 0))} model calls)"
+        )
+        return "\n".join(lines)
@@ -0,0 +1,169 @@
+"""
+Phase-Parallel Generation
+分阶段并行生成：先让模型给出阶段计划（共享变量、各阶段目标与步骤），再并行生成各阶段主体，在衔接处校验后拼接进脚本骨架
+"""
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from .priority import current_lane, priority_lane
+from .script_skeleton import render_script
+from .script_validator import ScriptValidator
+from config.prompts import PHASE_PLAN_PROMPT, PHASE_PLAN_FULL_PROMPT, PHASE_BODY_PROMPT, PHASE_CASE_PROMPT
+
+
+@dataclass
+class Phase:
+    """One phase of the plan and, once generated, its body"""
+    name: str
+    goal: str
+    steps: List[int]
+    body: str = ""
+    issues: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+@dataclass
+class PhasePlan:
+    """Shared setup, the phases in execution order, and (without the skeleton) the planner's teardown"""
+    setup: str
+    phases: List[Phase]
+    teardown: str = ""
+
+
+def parse_phase_plan(text: str) -> PhasePlan:
+    """
+    Parse the planner's JSON reply
+
+    Raises:
+        ValueError: No JSON object, a malformed phase entry, or no phases
+    """
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise ValueError("phase plan is not JSON")
+    data = json.loads(match.group(0))
+    entries = data.get("phases") or []
+    if not isinstance(entries, list):
+        raise ValueError("phase plan 'phases' is not a list")
+    phases = []
+    for i, p in enumerate(entries, 1):
+        if not isinstance(p, dict):
+            raise ValueError(f"phase {i} of the plan is not an object")
+        steps = p.get("steps") or []
+        if not isinstance(steps, list) or not all(isinstance(s, (int, str)) for s in steps):
+            raise ValueError(f"phase {i} of the plan has malformed steps")
+        phases.append(Phase(name=str(p.get("name") or f"PHASE {i}").strip().upper(),
+                            goal=str(p.get("goal") or "").strip(), steps=[int(s) for s in steps]))
+    if not phases:
+        raise ValueError("phase plan has no phases")
+    return PhasePlan(setup=str(data.get("setup") or "").strip(), phases=phases,
+                     teardown=str(data.get("teardown") or "").strip())
+
+
+def phase_header(index: int, name: str) -> str:
+    rule = "# " + "=" * 60
+    return f"{rule}\n# PHASE {index}: {name}\n{rule}"
+
+
+class PhasedGenerator:
+    """Plan → parallel phase bodies → validated stitch
+
+    A long case no longer has to fit one response: the plan call is short,
+    and each phase body is its own request, so wall-clock time is about the
+    plan plus the slowest phase instead of the whole script's output tokens.
+    Every body is checked at its seams (balanced blocks, no repeated
+    skeleton code) and regenerated once with the findings if it fails.
+    """
+
+    def __init__(self, generator, max_workers: int = 4, fix_attempts: int = 1):
+        """
+        Args:
+            generator: TestScriptGenerator (its model client and helpers are reused)
+            max_workers: Phase bodies generated at once
+            fix_attempts: Regenerations of a phase body that fails the seam checks
+        """
+        self.generator = generator
+        self.max_workers = max(1, max_workers)
+        self.fix_attempts = fix_attempts
+
+    @property
+    def client(self):
+        return self.generator.client
+
+    def plan(self, test_case: Dict) -> PhasePlan:
+        """Ask the model for the phase plan (shared setup and phases; setup/teardown boilerplate without the skeleton)"""
+        stage_prompt = PHASE_PLAN_PROMPT if self.generator.skeleton else PHASE_PLAN_FULL_PROMPT
+        messages = self.generator.case_messages(stage_prompt, test_case)
+        raw = self.client.generate_with_context(messages=messages, temperature=0.1, stage="plan",
+                                                size_hint=len(test_case["steps"]))
+        return parse_phase_plan(raw)
+
+    def phase_messages(self, test_case: Dict, plan: PhasePlan, index: int) -> List[Dict]:
+        """Messages for one phase body: static prefix, then the case, the setup and the phase"""
+        phase = plan.phases[index - 1]
+        phase_list = "\n".join(f"{i}. {p.name}: {p.goal}" for i, p in enumerate(plan.phases, 1))
+        case_prompt = self.generator.build_generation_prompt(test_case)
+        return self.generator.case_messages(PHASE_BODY_PROMPT, test_case, case_prompt + "\n" + PHASE_CASE_PROMPT.format(
+            setup=plan.setup, phase_list=phase_list, index=index, total=len(plan.phases), name=phase.name,
+            goal=phase.goal, steps=", ".join(map(str, phase.steps)) or "-"
+        ))
+
+    def generate_phase(self, test_case: Dict, plan: PhasePlan, index: int) -> Phase:
+        """Generate one phase body, regenerating it with the seam findings if it fails validation"""
+        phase = plan.phases[index - 1]
+        started = time.perf_counter()
+        messages = self.phase_messages(test_case, plan, index)
+        phase.body, phase.issues = self.generator.generate_body(
+            messages, stage="phase", size_hint=len(phase.steps) or 1, label=f"Phase {index} ({phase.name})",
+            fix_attempts=self.fix_attempts
+        )
+        phase.seconds = time.perf_counter() - started
+        return phase
+
+    def stitch(self, test_case: Dict, plan: PhasePlan) -> str:
+        """Shared setup and each phase under its separator, inside the script skeleton (or before the planner's teardown)"""
+        parts = [plan.setup] if plan.setup else []
+        for index, phase in enumerate(plan.phases, 1):
+            parts.append(f"{phase_header(index, phase.name)}\n{phase.body}")
+        if not self.generator.skeleton:
+            return "\n\n".join(parts + ([plan.teardown] if plan.teardown else [])) + "\n"
+        return render_script(test_case["test_case_id"], "\n\n".join(parts))
+
+    def generate(self, test_case: Dict) -> str:
+        """
+        Generate a complete script phase by phase
+
+        Returns:
+            Stitched script
+
+        Raises:
+            ValueError: The plan could not be parsed (callers fall back to single-shot generation)
+        """
+        started = time.perf_counter()
+        plan = self.plan(test_case)
+        print(f"🧩 Phase plan: {' → '.join(p.name for p in plan.phases)} ({time.perf_counter() - started:.1f}s)")
+
+        # Worker threads start with a fresh context, so hand them the caller's lane
+        lane = current_lane()
+
+        def run(index: int) -> Phase:
+            with priority_lane(lane):
+                return self.generate_phase(test_case, plan, index)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="phase") as pool:
+            list(pool.map(run, range(1, len(plan.phases) + 1)))
+
+        for index, phase in enumerate(plan.phases, 1):
+            status = "ok" if not phase.issues else f"{len(phase.issues)} seam issue(s) left: {'; '.join(phase.issues)}"
+            print(f"   phase {index} {phase.name:<12} {phase.seconds:>5.1f}s  {status}")
+
+        script = self.stitch(test_case, plan)
+        result = ScriptValidator().validate_script(script)
+        if not result["is_valid"]:
+            print(f"⚠️  Stitched script has {result['issue_count']} validation issue(s): "
+                  f"{'; '.join(i['type'] for i in result['issues'])}")
+        print(f"✅ Phased generation finished in {time.perf_counter() - started:.1f}s")
+        return script
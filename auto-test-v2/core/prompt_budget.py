@@ -0,0 +1,141 @@
+"""
+Token-aware Prompt Budgeting
+按 Token 预算裁剪 prompt 内容：优先保留开头、结尾以及 FAIL/ERROR 上下文
+"""
+import re
+from typing import List, Optional, Pattern
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character heuristic
+    tiktoken = None
+
+
+# Input-token budget per stage for the variable content (logs, scripts).
+# The fixed part of the prompt is measured separately and subtracted.
+STAGE_BUDGETS = {
+    "analyze": 12000,
+    "evaluate": 24000,
+}
+
+# Lines worth keeping from the middle of a log
+FAILURE_PATTERN = re.compile(r"\b(FAIL(ED|URE)?|ERROR|EXCEPTION|FATAL)\b|❌|Traceback", re.IGNORECASE)
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken (o200k_base, GPT-4.1/4o); ~4 chars per token without it"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def content_budget(stage: str, *fixed_parts: str) -> int:
+    """Tokens left for variable content once the fixed prompt parts are accounted for"""
+    return max(0, STAGE_BUDGETS[stage] - sum(count_tokens(p) for p in fixed_parts))
+
+
+def _gap(omitted: int) -> str:
+    return f"... [{omitted} lines omitted] ..."
+
+
+def pack_lines(
+    text: str,
+    budget: int,
+    head_share: float = 0.25,
+    tail_share: float = 0.35,
+    priority: Optional[Pattern] = FAILURE_PATTERN,
+    context: int = 2
+) -> str:
+    """
+    Fit text into a token budget by keeping whole lines in priority order
+
+    Head and tail each get a share of the budget first; the rest goes to
+    lines matching `priority` (with `context` lines around them); any
+    budget left after that extends the head and tail. Dropped ranges are
+    replaced with a single "... [N lines omitted] ..." marker.
+
+    Args:
+        text: Content to pack (logs, script)
+        budget: Token budget for the packed result
+        head_share: Fraction of the budget reserved for the first lines
+        tail_share: Fraction of the budget reserved for the last lines
+        priority: Regex selecting lines to keep from the middle (None: head/tail only)
+        context: Lines kept before and after each priority match
+
+    Returns:
+        Original text if it fits, otherwise the packed text
+    """
+    if count_tokens(text) <= budget:
+        return text
+
+    lines = text.splitlines()
+    cost = [count_tokens(line) + 1 for line in lines]
+    gap_cost = count_tokens(_gap(len(lines))) + 1
+    keep = [False] * len(lines)
+    state = {"used": 0}
+
+    def take(i: int, limit: int) -> bool:
+        """Keep line i if it fits within limit (a marker is budgeted per kept run)"""
+        if keep[i]:
+            return True
+        extra = cost[i] + (gap_cost if (i == 0 or not keep[i - 1]) else 0)
+        if state["used"] + extra > limit:
+            return False
+        keep[i] = True
+        state["used"] += extra
+        return True
+
+    def fill_head(limit: int):
+        for i in range(len(lines)):
+            if not take(i, limit):
+                break
+
+    def fill_tail(limit: int):
+        for i in range(len(lines) - 1, -1, -1):
+            if not take(i, limit):
+                break
+
+    fill_head(int(budget * head_share))
+    fill_tail(int(budget * (head_share + tail_share)))
+
+    if priority is not None:
+        for i, line in enumerate(lines):
+            if keep[i] or not priority.search(line):
+                continue
+            window = range(max(0, i - context), min(len(lines), i + context + 1))
+            if sum(cost[j] for j in window if not keep[j]) + gap_cost + state["used"] > budget:
+                continue
+            for j in window:
+                take(j, budget)
+
+    fill_head(budget)
+    fill_tail(budget)
+
+    packed: List[str] = []
+    omitted = 0
+    for i, line in enumerate(lines):
+        if keep[i]:
+            if omitted:
+                packed.append(_gap(omitted))
+                omitted = 0
+            packed.append(line)
+        else:
+            omitted += 1
+    if omitted:
+        packed.append(_gap(omitted))
+    return "\n".join(packed)
@@ -7,6 +7,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional
 from .model_client import ModelClient
+from .client_pool import get_model_client
+from .prompt_budget import content_budget, pack_lines
 from config.prompts import LOG_ANALYSIS_PROMPT
 
 
@@ -18,9 +20,9 @@ class ReportGenerator:
         Initialize report generator
         
         Args:
-            model_client: Optional ModelClient instance. If None, will create new one.
+            model_client: Optional ModelClient instance. If None, uses the shared process-wide client.
         """
-        self.model_client = model_client or ModelClient()
+        self.model_client = model_client or get_model_client()
         
     def analyze_logs_with_ai(self, logs: str, test_case_id: str = "") -> str:
         """
@@ -38,16 +40,19 @@ class ReportGenerator:
 TEST CASE: {test_case_id}
 
 LOGS:
-{logs[:4000]}
+{{logs}}
 
 Provide a clear analysis in English."""
+        # Keep the start, the summary at the end and every FAIL/ERROR with context
+        budget = content_budget("analyze", LOG_ANALYSIS_PROMPT, user_prompt)
+        user_prompt = user_prompt.replace("{logs}", pack_lines(logs, budget))
 
         try:
             analysis = self.model_client.generate(
                 system_prompt=LOG_ANALYSIS_PROMPT,
                 user_prompt=user_prompt,
                 temperature=0.3,
-                max_tokens=2000
+                stage="analyze"
             )
             return analysis
         except Exception as e:
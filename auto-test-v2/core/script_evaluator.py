@@ -6,6 +6,8 @@ import json
 import re
 from typing import Dict, Optional
 from .model_client import ModelClient
+from .client_pool import get_model_client
+from .prompt_budget import content_budget, pack_lines
 from config.prompts import SCRIPT_EVALUATION_PROMPT
 
 
@@ -17,9 +19,53 @@ class ScriptEvaluator:
         Initialize script evaluator
         
         Args:
-            model_client: Optional ModelClient instance. If None, will create new one.
+            model_client: Optional ModelClient instance. If None, uses the shared process-wide client.
         """
-        self.model_client = model_client or ModelClient()
+        self._model_client = model_client
+    
+    @property
+    def model_client(self) -> ModelClient:
+        """Model client, resolved lazily so prompt building/parsing work without credentials"""
+        if self._model_client is None:
+            self._model_client = get_model_client()
+        return self._model_client
+    
+    def build_evaluation_prompt(
+        self,
+        script: str,
+        test_case_id: str = "",
+        test_scenario: str = "",
+        expected_steps: int = 0
+    ) -> str:
+        """Format the user prompt for SCRIPT_EVALUATION_PROMPT, packing the script into the stage token budget"""
+        prompt = f"""Evaluate this auto-generated PowerShell test script:
+
+TEST CASE ID: {test_case_id}
+TEST SCENARIO: {test_scenario}
+EXPECTED STEPS: {expected_steps}
+
+SCRIPT TO EVALUATE:
+```powershell
+{{script}}
+```
+
+Provide a comprehensive quality evaluation in JSON format.
+Calculate overall_score as weighted average:
+- Correctness: 30%
+- Completeness: 25%
+- Best Practices: 15%
+- Robustness: 20%
+- Maintainability: 10%
+
+Output ONLY valid JSON, no explanatory text."""
+        budget = content_budget("evaluate", SCRIPT_EVALUATION_PROMPT, prompt)
+        return prompt.replace("{script}", pack_lines(script, budget, priority=None))
+    
+    def parse_evaluation(self, response: str) -> Dict:
+        """Parse a raw evaluation response and attach the letter grade"""
+        evaluation = self._parse_evaluation_response(response)
+        evaluation["grade"] = self._calculate_grade(evaluation["overall_score"])
+        return evaluation
     
     def evaluate_script_quality(
         self, 
@@ -54,26 +100,7 @@ class ScriptEvaluator:
                 "recommendations": [...]
             }
         """
-        user_prompt = f"""Evaluate this auto-generated PowerShell test script:
-
-TEST CASE ID: {test_case_id}
-TEST SCENARIO: {test_scenario}
-EXPECTED STEPS: {expected_steps}
-
-SCRIPT TO EVALUATE:
-```powershell
-{script[:8000]}  # Limit to avoid token overflow
-```
-
-Provide a comprehensive quality evaluation in JSON format.
-Calculate overall_score as weighted average:
-- Correctness: 30%
-- Completeness: 25%
-- Best Practices: 15%
-- Robustness: 20%
-- Maintainability: 10%
-
-Output ONLY valid JSON, no explanatory text."""
+        user_prompt = self.build_evaluation_prompt(script, test_case_id, test_scenario, expected_steps)
 
         try:
             print(" AI evaluating script quality...")
@@ -83,14 +110,11 @@ Output ONLY valid JSON, no explanatory text."""
                 system_prompt=SCRIPT_EVALUATION_PROMPT,
                 user_prompt=user_prompt,
                 temperature=0.3,  # Lower temperature for more consistent scoring
-                max_tokens=2000
+                stage="evaluate"
             )
             
-            # Parse JSON response
-            evaluation = self._parse_evaluation_response(response)
-            
-            # Add grade based on overall score
-            evaluation["grade"] = self._calculate_grade(evaluation["overall_score"])
+            # Parse JSON response and add grade based on overall score
+            evaluation = self.parse_evaluation(response)
             
             print(f"✅ Evaluation complete: {evaluation['overall_score']}/100 ({evaluation['grade']})")
             
@@ -0,0 +1,185 @@
+"""
+Script Skeleton
+脚本骨架：管理员检查、日志与 Transcript、计数器与 Write-Result、执行汇总与暂停由模板确定性生成，模型只生成各阶段主体
+"""
+import os
+import re
+from typing import List, Optional, Tuple
+
+from .script_validator import ScriptValidator
+
+BODY_START = "#region Test phases"
+BODY_END = "#endregion Test phases"
+
+RULE = "# " + "=" * 60
+BANNER = 'Write-Host "' + "=" * 60 + '" -ForegroundColor Cyan'
+
+# Everything before the phases; {test_case_id} is the only placeholder
+SKELETON_HEADER = f"""{RULE}
+# Test: {{test_case_id}}
+# Setup, result tracking and summary come from the script skeleton
+{RULE}
+
+# Check admin privileges
+if (-not ([Security.Principal.WindowsPrincipal][Security.Principal.WindowsIdentity]::GetCurrent()).IsInRole([Security.Principal.WindowsBuiltInRole]::Administrator)) {{{{
+    Write-Host "ERROR: Must run as Administrator" -ForegroundColor Red
+    exit 1
+}}}}
+
+{RULE}
+# SETUP LOGGING
+{RULE}
+$timestamp = Get-Date -Format "yyyyMMdd_HHmmss"
+$logDir = "$PSScriptRoot\\..\\output\\logs"
+if (-not (Test-Path $logDir)) {{{{
+    New-Item -ItemType Directory -Path $logDir -Force | Out-Null
+}}}}
+$logFile = Join-Path $logDir "test_{{test_case_id}}_$timestamp.log"
+
+# Start transcript to capture all output
+Start-Transcript -Path $logFile -Append
+
+{BANNER}
+Write-Host "TEST EXECUTION START: $(Get-Date -Format 'yyyy-MM-dd HH:mm:ss')" -ForegroundColor Cyan
+Write-Host "Test case: {{test_case_id}}" -ForegroundColor Gray
+Write-Host "Log file: $logFile" -ForegroundColor Gray
+{BANNER}
+Write-Host ""
+
+# Result tracking
+$script:SuccessCount = 0
+$script:FailCount = 0
+
+function Write-Result {{{{
+    param([string]$Msg, [bool]$Success)
+    if ($Success -eq $true) {{{{
+        Write-Host "[PASS] $Msg" -ForegroundColor Green
+        $script:SuccessCount++
+    }}}} else {{{{
+        Write-Host "[FAIL] $Msg" -ForegroundColor Red
+        $script:FailCount++
+    }}}}
+}}}}
+
+{BODY_START}
+"""
+
+# Everything after the phases (the exact closing sequence TEST_GENERATION_PROMPT asks for)
+SKELETON_FOOTER = f"""{BODY_END}
+
+Write-Host ""
+{BANNER}
+Write-Host "TEST EXECUTION SUMMARY" -ForegroundColor Cyan
+{BANNER}
+Write-Host "Total Passed: $script:SuccessCount" -ForegroundColor Green
+Write-Host "Total Failed: $script:FailCount" -ForegroundColor Red
+Write-Host "Log file: $logFile" -ForegroundColor Gray
+{BANNER}
+
+Stop-Transcript
+
+Write-Host ""
+Write-Host "Press any key to exit..." -ForegroundColor Yellow
+$null = $Host.UI.RawUI.ReadKey('NoEcho,IncludeKeyDown')
+"""
+
+# Code the skeleton already provides; finding it inside a body means the seam is broken
+BOILERPLATE_MARKERS = {
+    "Start-Transcript": "starts a second transcript",
+    "Stop-Transcript": "stops the transcript before the script ends",
+    "TEST EXECUTION SUMMARY": "prints the summary before the script ends",
+    "ReadKey": "pauses before the script ends",
+    "function Write-Result": "redefines Write-Result",
+    "IsInRole": "repeats the admin check",
+}
+
+# Single boilerplate lines that are safe to drop from a body (multi-line blocks are left to the seam checks)
+_BOILERPLATE_LINES = re.compile(
+    r"^[ \t]*(?:Start-Transcript\b.*|Stop-Transcript\b.*|\$null\s*=\s*\$Host\.UI\.RawUI\.ReadKey\(.*"
+    r"|Write-Host\s+[\"'][^\"'\n]*Press any key to exit[^\n]*"
+    r"|\$script:(?:SuccessCount|FailCount)\s*=\s*0\s*)\r?\n?",
+    re.MULTILINE | re.IGNORECASE
+)
+
+# ScriptValidator findings that can be judged on a body alone (the rest need the whole script)
+SEAM_ISSUE_TYPES = {
+    "unbalanced_braces", "unbalanced_try_catch", "forbidden_goto", "forbidden_label", "enum_trim_bug",
+    "non_silent_install", "gui_automation",
+}
+
+
+def skeleton_enabled() -> bool:
+    """On by default; MODEL_SCRIPT_SKELETON=0 has the model write whole scripts again"""
+    return os.getenv("MODEL_SCRIPT_SKELETON", "1").lower() not in ("0", "false", "no")
+
+
+def _safe_id(test_case_id: str) -> str:
+    """Test case ID as it may appear in a file name and a double-quoted PowerShell string"""
+    return re.sub(r"[^\w.-]", "_", str(test_case_id))
+
+
+def render_script(test_case_id: str, body: str) -> str:
+    """
+    Complete script: skeleton header, the generated phases, skeleton footer
+
+    Args:
+        test_case_id: Used in the log file name and the start banner
+        body: Generated phases (see strip_boilerplate)
+
+    Returns:
+        Script that always has the admin check, transcript, counters, summary and pause
+    """
+    return SKELETON_HEADER.format(test_case_id=_safe_id(test_case_id)) + "\n" + body.strip() + "\n\n" + SKELETON_FOOTER
+
+
+def split_script(script: str) -> Optional[Tuple[str, str, str]]:
+    """(header, body, footer) of a rendered script, or None if the skeleton markers are missing"""
+    start = script.find(BODY_START)
+    end = script.rfind(BODY_END)
+    if start < 0 or end < start:
+        return None
+    body_start = start + len(BODY_START)
+    return script[:body_start], script[body_start:end].strip(), script[end:]
+
+
+def extract_body(script: str) -> str:
+    """The generated phases of a rendered script (a script without the skeleton is returned whole)"""
+    parts = split_script(script)
+    return parts[1] if parts else script.strip()
+
+
+def replace_body(script: str, revised: str) -> str:
+    """
+    script with its phases taken from a revision, keeping its skeleton byte for byte
+
+    Args:
+        script: Rendered script
+        revised: Revised phases, or a revised whole script that kept the skeleton markers
+
+    Returns:
+        The re-rendered script; a revision that rewrote the boilerplate without the markers is returned as is
+    """
+    parts = split_script(script)
+    if split_script(revised) is not None:
+        body = extract_body(revised)
+    elif not any(marker in revised for marker in BOILERPLATE_MARKERS):
+        body = revised.strip()
+    else:
+        return revised
+    if parts is None:
+        return body
+    header, _, footer = parts
+    return header + "\n\n" + strip_boilerplate(body) + "\n\n" + footer
+
+
+def strip_boilerplate(body: str) -> str:
+    """Drop single lines of skeleton code that a model repeated anyway (transcript, pause, counter resets)"""
+    return _BOILERPLATE_LINES.sub("", body).strip()
+
+
+def seam_issues(body: str) -> List[str]:
+    """Problems of a generated body that would break the rendered script"""
+    issues = [f"[{marker}] the body {problem}" for marker, problem in BOILERPLATE_MARKERS.items() if marker in body]
+    result = ScriptValidator().validate_script(body)
+    issues += [f"[{i['type']}] {i['message']}" for i in result["issues"] if i["type"] in SEAM_ISSUE_TYPES]
+    return issues
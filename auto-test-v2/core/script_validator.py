@@ -145,7 +145,20 @@ class ScriptValidator:
                 "type": "missing_stop_transcript",
                 "message": "脚本缺少 Stop-Transcript"
             })
-        
+
+        # Check for exactly one pause, as the last statement
+        pause_count = script.count("ReadKey")
+        if pause_count > 1:
+            self.warnings.append({
+                "type": "duplicate_pause",
+                "message": f"脚本包含 {pause_count} 处 ReadKey 暂停, 应只在末尾暂停一次"
+            })
+        elif pause_count == 1 and "ReadKey" not in self._last_statement(lines):
+            self.warnings.append({
+                "type": "code_after_pause",
+                "message": "ReadKey 暂停之后还有代码, 暂停应为脚本最后一行"
+            })
+
         # Check for unclosed strings or braces
         open_braces = script.count('{')
         close_braces = script.count('}')
@@ -155,6 +168,15 @@ class ScriptValidator:
                 "message": f"花括号不匹配: {open_braces} 个 '{{', {close_braces} 个 '}}'"
             })
     
+    @staticmethod
+    def _last_statement(lines: List[str]) -> str:
+        """Last line that is not blank, a comment or only closing braces (e.g. of an if around the pause)"""
+        for line in reversed(lines):
+            stripped = line.strip()
+            if stripped and not stripped.startswith("#") and not re.fullmatch(r"[}\s]+", stripped):
+                return stripped
+        return ""
+    
     def _check_string_comparison(self, script: str):
         """Check for proper string trimming in comparisons"""
         # Look for direct registry/file comparisons without trimming
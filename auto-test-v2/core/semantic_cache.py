@@ -0,0 +1,227 @@
+"""
+Semantic Near-Duplicate Cache
+近似重复测试用例缓存：用哈希向量化 + 余弦相似度查找已生成过的相似用例，高度相似时直接复用或作为草稿
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+DEFAULT_INDEX_DIR = Path(__file__).parent.parent / ".cache" / "semantic"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-\\/:][a-z0-9]+)*")
+
+
+def _features(text: str) -> List[str]:
+    """Word unigrams and bigrams; dotted/path-like tokens (case22.1, C:\\Windows) stay whole"""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def vectorize(text: str, n_features: int = 2 ** 18) -> Dict[int, float]:
+    """
+    Hashing-trick term vector (L2-normalised, sparse)
+
+    Each feature is hashed to a bucket with a hash-derived sign so collisions
+    tend to cancel instead of adding up; no vocabulary has to be stored.
+    """
+    vector: Dict[int, float] = {}
+    for feature in _features(text):
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        index = h % n_features
+        vector[index] = vector.get(index, 0.0) + (1.0 if h >> 63 else -1.0)
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {i: v / norm for i, v in vector.items() if v} if norm else {}
+
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    """Cosine similarity of two normalised sparse vectors"""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(i, 0.0) for i, v in a.items())
+
+
+@dataclass
+class SemanticMatch:
+    """Closest previously generated case and what to do with it"""
+    source_id: str
+    similarity: float
+    decision: str  # "reuse", "draft" or "miss"
+    script: str
+
+    def adapt(self, test_case_id: str) -> str:
+        """
+        Cached script with the source case ID (log/transcript names) swapped for the new one
+
+        Only whole IDs are replaced: case1 must not turn case10 or case1.5 into something else.
+        Underscores and file extensions still count as separators, so test_case1_<timestamp>.log is adapted.
+        """
+        pattern = rf"(?<![A-Za-z0-9.-]){re.escape(self.source_id)}(?![A-Za-z0-9-]|\.[0-9])"
+        return re.sub(pattern, lambda _: test_case_id, self.script)
+
+
+class SemanticCache:
+    """Vector index of (test case text -> generated script) pairs
+
+    `lookup` finds the most similar case generated before (other than the case
+    itself). At or above `reuse_threshold` the cached script is reused and
+    generation is skipped; at or above `draft_threshold` it is handed to the
+    model as a draft; below that it is a miss. Every decision is printed with
+    its similarity and the thresholds, and appended to ``decisions.jsonl`` so
+    hit rates can be tracked across runs.
+    """
+
+    def __init__(self, index_dir: Optional[str] = None, reuse_threshold: float = 0.97,
+                 draft_threshold: float = 0.80, max_entries: int = 2000):
+        """
+        Args:
+            index_dir: Directory for index.json and decisions.jsonl (default: auto-test-v2/.cache/semantic)
+            reuse_threshold: Similarity at which the cached script is reused as is
+            draft_threshold: Similarity at which the cached script is offered as a draft
+            max_entries: Oldest entries are dropped beyond this
+        """
+        self.index_dir = Path(index_dir) if index_dir else DEFAULT_INDEX_DIR
+        self.reuse_threshold = reuse_threshold
+        self.draft_threshold = draft_threshold
+        self.max_entries = max_entries
+        self.counts = {"reuse": 0, "draft": 0, "miss": 0}
+        self._lock = threading.Lock()
+        self._entries: Optional[List[Dict]] = None
+        self._mtime: Optional[float] = None
+        self._vectors: Dict[str, Dict[int, float]] = {}
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        """
+        Build cache from environment variables, or None if disabled
+
+        MODEL_SEMANTIC_CACHE=1 enables it; MODEL_SEMANTIC_CACHE_DIR,
+        MODEL_SEMANTIC_REUSE (default 0.97) and MODEL_SEMANTIC_DRAFT (default 0.80) tune it.
+        """
+        if os.getenv("MODEL_SEMANTIC_CACHE", "0").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            index_dir=os.getenv("MODEL_SEMANTIC_CACHE_DIR") or None,
+            reuse_threshold=float(os.getenv("MODEL_SEMANTIC_REUSE", "0.97")),
+            draft_threshold=float(os.getenv("MODEL_SEMANTIC_DRAFT", "0.80"))
+        )
+
+    @property
+    def index_path(self) -> Path:
+        return self.index_dir / "index.json"
+
+    @property
+    def log_path(self) -> Path:
+        return self.index_dir / "decisions.jsonl"
+
+    def _load(self) -> List[Dict]:
+        """Entries, re-read when another process has rewritten the index"""
+        try:
+            mtime = self.index_path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if self._entries is None or mtime != self._mtime:
+            try:
+                self._entries = json.loads(self.index_path.read_text(encoding="utf-8"))["entries"]
+            except (OSError, ValueError, KeyError):
+                self._entries = []
+            self._mtime = mtime
+            self._vectors = {}
+        return self._entries
+
+    def _vector(self, entry: Dict) -> Dict[int, float]:
+        # Vectors are derived, not stored, so the vectorizer can change without migrating the index
+        key = entry["source_id"]
+        if key not in self._vectors:
+            self._vectors[key] = vectorize(entry["text"])
+        return self._vectors[key]
+
+    def lookup(self, source_id: str, text: str) -> SemanticMatch:
+        """
+        Find the nearest previously generated case
+
+        Args:
+            source_id: ID of the case being generated (its own entry is ignored)
+            text: Case text (scenario and steps)
+
+        Returns:
+            SemanticMatch; decision is "miss" if nothing is similar enough
+        """
+        query = vectorize(text)
+        best, best_similarity = None, 0.0
+        with self._lock:
+            for entry in self._load():
+                if entry["source_id"] == source_id:
+                    continue
+                similarity = cosine(query, self._vector(entry))
+                if similarity > best_similarity:
+                    best, best_similarity = entry, similarity
+
+        if best is not None and best_similarity >= self.reuse_threshold:
+            decision = "reuse"
+        elif best is not None and best_similarity >= self.draft_threshold:
+            decision = "draft"
+        else:
+            decision = "miss"
+        match = SemanticMatch(best["source_id"] if best else "", best_similarity, decision,
+                              best["script"] if best else "")
+        self._log(source_id, match)
+        return match
+
+    def _log(self, source_id: str, match: SemanticMatch):
+        with self._lock:
+            self.counts[match.decision] += 1
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "timestamp": time.time(),
+                    "case": source_id,
+                    "nearest": match.source_id or None,
+                    "similarity": round(match.similarity, 4),
+                    "decision": match.decision,
+                    "reuse_threshold": self.reuse_threshold,
+                    "draft_threshold": self.draft_threshold
+                }) + "\n")
+        nearest = f"{match.source_id} ({match.similarity:.3f})" if match.source_id else "none"
+        print(f"🧠 Semantic cache: nearest {nearest}, reuse ≥ {self.reuse_threshold}, "
+              f"draft ≥ {self.draft_threshold} → {match.decision}")
+
+    def add(self, source_id: str, text: str, script: str):
+        """Index a generated script (replaces an earlier entry for the same case)"""
+        with self._lock:
+            entries = [e for e in self._load() if e["source_id"] != source_id]
+            entries.append({"source_id": source_id, "text": text, "script": script, "created_at": time.time()})
+            self._entries = entries[-self.max_entries:]
+            self._vectors.pop(source_id, None)
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"version": 1, "entries": self._entries}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+            self._mtime = self.index_path.stat().st_mtime
+
+    def stats(self) -> Dict[str, float]:
+        """Decisions in this process plus the hit rate (reuse + draft) over all logged decisions"""
+        logged = {"reuse": 0, "draft": 0, "miss": 0}
+        try:
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        logged[json.loads(line)["decision"]] += 1
+                    except (ValueError, KeyError):
+                        pass
+        except OSError:
+            pass
+        total = sum(logged.values())
+        return {
+            **self.counts,
+            "hit_rate": (self.counts["reuse"] + self.counts["draft"]) / max(1, sum(self.counts.values())),
+            "lifetime_hit_rate": (logged["reuse"] + logged["draft"]) / total if total else 0.0,
+            "lifetime_lookups": total
+        }
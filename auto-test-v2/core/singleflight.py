@@ -0,0 +1,138 @@
+"""
+Single-flight Request Coalescing
+合并并发的相同请求：同一 key 只发出一次调用，所有等待者共享结果（可选跨进程锁文件）
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from .rate_limiter import _FileLock
+
+T = TypeVar('T')
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls
+
+    In-process, the first caller for a key runs the call and concurrent callers
+    with the same key block until it finishes and receive its result (or its
+    exception). With `lock_dir`, the leader also holds ``<key>.lock`` across
+    processes and publishes its result to ``<key>.json``; a process that had
+    to wait for the lock reuses that result instead of calling again.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, result_ttl: float = 300.0):
+        """
+        Args:
+            lock_dir: Directory for cross-process lock/result files (None: in-process only)
+            result_ttl: Seconds a published cross-process result is kept
+        """
+        self.lock_dir = Path(lock_dir) if lock_dir else None
+        self.result_ttl = result_ttl
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SingleFlight"]:
+        """On by default; MODEL_SINGLEFLIGHT=0 disables, MODEL_SINGLEFLIGHT_DIR adds cross-process sharing"""
+        if os.getenv("MODEL_SINGLEFLIGHT", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(os.getenv("MODEL_SINGLEFLIGHT_DIR") or None)
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Run fn once per concurrent key
+
+        Returns:
+            (result, shared) where shared is True if another caller's result was reused
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            with self._lock:
+                self.coalesced += 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            if self.lock_dir is None:
+                call.result = fn()
+            else:
+                call.result, shared = self._do_cross_process(key, fn)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_cross_process(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        result_path = self.lock_dir / f"{key}.json"
+        waiting_since = time.time()
+        with _FileLock(self.lock_dir / f"{key}.lock"):
+            # Another process finished this request while we waited for the lock
+            try:
+                if result_path.stat().st_mtime >= waiting_since:
+                    with self._lock:
+                        self.coalesced += 1
+                    return json.loads(result_path.read_text(encoding="utf-8"))["result"], True
+            except (OSError, ValueError, KeyError):
+                pass
+
+            result = fn()
+            tmp = result_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"result": result}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, result_path)
+        self._sweep()
+        return result, False
+
+    def _sweep(self):
+        """Drop published results older than result_ttl (lock files are left alone while recent)"""
+        cutoff = time.time() - self.result_ttl
+        for path in self.lock_dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+        for path in self.lock_dir.glob("*.lock"):
+            try:
+                if path.stat().st_mtime < cutoff - 24 * 3600:
+                    path.unlink()
+            except OSError:
+                pass
+
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_loaded = False
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Process-wide coalescer shared by every ModelClient"""
+    global _single_flight, _single_flight_loaded
+    with _single_flight_lock:
+        if not _single_flight_loaded:
+            _single_flight = SingleFlight.from_env()
+            _single_flight_loaded = True
+        return _single_flight
@@ -1,14 +1,76 @@
+import hashlib
 import json
+import os
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 from .model_client import ModelClient
-from config.prompts import SYSTEM_PROMPT, TEST_GENERATION_PROMPT, REFINEMENT_PROMPT
+from .client_pool import get_model_client
+from .build_manifest import BuildManifest, fingerprint
+from .router import get_router
+from .semantic_cache import SemanticCache, SemanticMatch
+from .prompt_budget import count_tokens
+from .script_validator import ScriptValidator
+from .script_skeleton import (SKELETON_HEADER, SKELETON_FOOTER, skeleton_enabled, render_script, extract_body,
+                              replace_body, strip_boilerplate, seam_issues)
+from config.prompts import (SYSTEM_PROMPT, TEST_GENERATION_PROMPT, SCRIPT_BODY_PROMPT, TEST_CASE_PROMPT,
+                            REFINEMENT_PROMPT, SIMILAR_SCRIPT_DRAFT_PROMPT, PHASE_PLAN_PROMPT, PHASE_PLAN_FULL_PROMPT,
+                            PHASE_BODY_PROMPT, PHASE_CASE_PROMPT, BODY_FIX_PROMPT, VALIDATION_FIX_PROMPT)
+
+# Low temperatures for consistent output
+GENERATE_TEMPERATURE = 0.2
+REFINE_TEMPERATURE = 0.1
+
+# Every template that shapes a generated script; editing any of them invalidates the build manifest
+PROMPT_TEMPLATES = (SYSTEM_PROMPT, TEST_GENERATION_PROMPT, SCRIPT_BODY_PROMPT, TEST_CASE_PROMPT, REFINEMENT_PROMPT,
+                    SIMILAR_SCRIPT_DRAFT_PROMPT, PHASE_PLAN_PROMPT, PHASE_PLAN_FULL_PROMPT, PHASE_BODY_PROMPT,
+                    PHASE_CASE_PROMPT, BODY_FIX_PROMPT, VALIDATION_FIX_PROMPT, SKELETON_HEADER, SKELETON_FOOTER)
+
+# ScriptValidator warnings that send a script to refinement (all validator issues do);
+# the rest are too speculative to spend a model call on
+REFINE_WARNING_TYPES = {
+    "missing_admin_check", "no_error_handling", "no_transcript", "no_summary", "missing_stop_transcript",
+    "duplicate_pause", "code_after_pause",
+}
+
+
+def static_prefix(stage_prompt: str) -> List[Dict]:
+    """
+    Leading messages shared by every call of a stage
+    
+    Providers cache prompts by exact prefix, so SYSTEM_PROMPT and the stage's
+    instructions always come first and byte-identical; anything that varies per
+    test case (steps, scripts, reviews) must be appended after them.
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": stage_prompt}
+    ]
+
 
 class TestScriptGenerator:
     """Generate goal-oriented PowerShell test scripts from human steps"""
     
-    def __init__(self, model_client: ModelClient = None):
-        self.client = model_client or ModelClient()
+    def __init__(self, model_client: ModelClient = None, semantic_cache: SemanticCache = None,
+                 manifest: BuildManifest = None, skeleton: Optional[bool] = None):
+        """
+        Args:
+            model_client: Optional model client (default: shared client, created on first use)
+            semantic_cache: Optional near-duplicate cache. If None, built from MODEL_SEMANTIC_CACHE* env vars
+            manifest: Optional build manifest for skipping up-to-date outputs. If None, built from MODEL_BUILD_MANIFEST* env vars
+            skeleton: Have the model write only the phases and render the boilerplate from core.script_skeleton.
+                If None, MODEL_SCRIPT_SKELETON decides (on by default)
+        """
+        self._client = model_client
+        self.semantic_cache = semantic_cache if semantic_cache is not None else SemanticCache.from_env()
+        self.manifest = manifest if manifest is not None else BuildManifest.from_env()
+        self.skeleton = skeleton if skeleton is not None else skeleton_enabled()
+    
+    @property
+    def client(self) -> ModelClient:
+        """Model client, resolved lazily so prompt building and saving work without credentials"""
+        if self._client is None:
+            self._client = get_model_client()
+        return self._client
     
     def load_test_case(self, json_path: str) -> Dict:
         """Load test case from JSON file"""
@@ -31,12 +93,123 @@ class TestScriptGenerator:
         
         return "\n".join(lines)
     
-    def generate_script(self, test_case: Dict) -> str:
+    def build_generation_prompt(self, test_case: Dict, draft: Optional[SemanticMatch] = None) -> str:
+        """Per-case part of the generation request (TEST_CASE_PROMPT), optionally with a similar case's script as draft"""
+        prompt = TEST_CASE_PROMPT.format(
+            test_scenario=test_case.get('test_scenario', 'No scenario description provided'),
+            steps_context=self.format_steps_context(test_case['steps']),
+            test_case_id=test_case['test_case_id']
+        )
+        if draft is not None:
+            prompt += SIMILAR_SCRIPT_DRAFT_PROMPT.format(
+                source_id=draft.source_id,
+                similarity=draft.similarity,
+                test_case_id=test_case['test_case_id'],
+                script=extract_body(draft.script) if self.skeleton else draft.script
+            )
+        return prompt
+    
+    def similarity_text(self, test_case: Dict) -> str:
+        """What near-duplicate detection compares: scenario and steps, without the case ID"""
+        return f"{test_case.get('test_scenario', '')}\n{self.format_steps_context(test_case['steps'])}"
+    
+    def case_messages(self, stage_prompt: str, test_case: Dict, case_prompt: Optional[str] = None) -> List[Dict]:
+        """Static prefix for a stage, then the per-case prompt (default: the formatted TEST_CASE_PROMPT)"""
+        return static_prefix(stage_prompt) + [
+            {"role": "user", "content": case_prompt if case_prompt is not None else self.build_generation_prompt(test_case)}
+        ]
+    
+    def build_generation_messages(self, test_case: Dict, draft: Optional[SemanticMatch] = None) -> List[Dict]:
+        """Message list for generating a script (or, with the skeleton, its phases) from a test case"""
+        stage_prompt = SCRIPT_BODY_PROMPT if self.skeleton else TEST_GENERATION_PROMPT
+        return self.case_messages(stage_prompt, test_case, self.build_generation_prompt(test_case, draft))
+    
+    def assemble_script(self, test_case: Dict, reply: str) -> str:
+        """Complete script from a generation reply: the skeleton around the returned phases, or the reply itself"""
+        script = self.extract_script_from_markdown(reply)
+        if not self.skeleton:
+            return script
+        return render_script(test_case['test_case_id'], strip_boilerplate(script))
+    
+    def generate_body(self, messages: List[Dict], stage: str, size_hint: Optional[int] = None,
+                      label: str = "Script body", fix_attempts: int = 1,
+                      reply: Optional[str] = None) -> Tuple[str, List[str]]:
+        """
+        Generate code that goes inside the skeleton, regenerating it with the seam findings if it fails validation
+        
+        Args:
+            messages: Generation messages
+            stage: Model stage for routing and max_tokens prediction
+            size_hint: As for ModelClient.generate_with_context
+            label: Name used in progress output
+            fix_attempts: Regenerations of a body that fails the seam checks
+            reply: Already received first reply (e.g. streamed); if None, it is generated here
+        
+        Returns:
+            (body, seam issues left after the last attempt)
+        """
+        for attempt in range(fix_attempts + 1):
+            if reply is None:
+                reply = self.client.generate_with_context(messages=messages, temperature=GENERATE_TEMPERATURE,
+                                                          stage=stage, size_hint=size_hint)
+            body = strip_boilerplate(self.extract_script_from_markdown(reply))
+            issues = seam_issues(body)
+            if not issues or attempt == fix_attempts:
+                break
+            print(f"⚠️  {label} failed seam checks, regenerating: {'; '.join(issues)}")
+            messages = messages + [
+                {"role": "assistant", "content": reply},
+                {"role": "user", "content": BODY_FIX_PROMPT.format(issues="\n".join(f"- {i}" for i in issues))}
+            ]
+            reply = None
+        return body, issues
+    
+    def use_phased(self, test_case: Dict, phased: Optional[bool] = None) -> bool:
+        """
+        Whether to generate phase by phase (core.phased_generator)
+        
+        Args:
+            test_case: Test case to generate
+            phased: Explicit choice; None uses MODEL_PHASED_MIN_STEPS (phased from that many steps on, 0 = never)
+        """
+        if phased is not None:
+            return phased
+        min_steps = int(os.getenv("MODEL_PHASED_MIN_STEPS", "0"))
+        return min_steps > 0 and len(test_case['steps']) >= min_steps
+    
+    def build_refinement_messages(self, script: str) -> List[Dict]:
+        """Message list putting a generated script under the refinement checklist (static prefix, then the script)"""
+        return static_prefix(REFINEMENT_PROMPT) + [
+            {"role": "user", "content": f"Generated script:\n\n{script}"}
+        ]
+    
+    def build_correction_messages(self, script: str, findings: List[str]) -> List[Dict]:
+        """Message list asking for the corrected script, with the validation findings as targeted context"""
+        return self.build_refinement_messages(script) + [
+            {"role": "user", "content": VALIDATION_FIX_PROMPT.format(issues="\n".join(f"- {f}" for f in findings))}
+        ]
+    
+    def review_findings(self, script: str) -> List[str]:
+        """
+        Problems worth a refinement call, found locally by ScriptValidator
+        
+        Returns:
+            "[type] message" for every validator issue and every warning in REFINE_WARNING_TYPES (empty: script passes)
+        """
+        result = ScriptValidator().validate_script(self.extract_script_from_markdown(script))
+        findings = result["issues"] + [w for w in result["warnings"] if w["type"] in REFINE_WARNING_TYPES]
+        return [f"[{f['type']}] {f['message']}" for f in findings]
+    
+    def generate_script(self, test_case: Dict, stream_path: Optional[str] = None,
+                        on_line: Optional[Callable[[str], None]] = None, phased: Optional[bool] = None) -> str:
         """
         Generate PowerShell test script from test case
         
         Args:
             test_case: Dictionary with 'test_case_id', 'test_scenario', and 'steps'
+            stream_path: If set, stream the response and write it to this file as it arrives
+            on_line: If set, stream the response and call this with each completed line
+            phased: Plan phases and generate them in parallel (None: decided by use_phased)
         
         Returns:
             Generated PowerShell script as string
@@ -45,73 +218,156 @@ class TestScriptGenerator:
         test_scenario = test_case.get('test_scenario', 'No scenario description provided')
         steps = test_case['steps']
         
-        # Format steps as context
-        steps_context = self.format_steps_context(steps)
-        
         # Generate script with AI
         print(f"🤖 Generating test script for: {test_case_id}")
         if test_scenario:
             print(f"🎯 Test Scenario: {test_scenario}")
         print(f"📋 Analyzing {len(steps)} human operation steps...")
         
-        user_prompt = TEST_GENERATION_PROMPT.format(
-            test_scenario=test_scenario,
-            steps_context=steps_context,
-            test_case_id=test_case_id
-        )
+        match = None
+        if self.semantic_cache is not None:
+            match = self.semantic_cache.lookup(test_case_id, self.similarity_text(test_case))
+            if match.decision == "reuse":
+                script = match.adapt(test_case_id)
+                self._replay_draft(script, stream_path, on_line)
+                print(f"✅ Reused script of near-duplicate case {match.source_id}")
+                return script
         
-        script = self.client.generate(
-            system_prompt=SYSTEM_PROMPT,
-            user_prompt=user_prompt,
-            temperature=0.2  # Low temperature for consistent output
+        if self.use_phased(test_case, phased):
+            from .phased_generator import PhasedGenerator
+            try:
+                script = PhasedGenerator(self).generate(test_case)
+            except ValueError as e:
+                print(f"⚠️  Phased generation unavailable ({e}), generating in one pass")
+            else:
+                self._replay_draft(script, stream_path, on_line)
+                self.remember_script(test_case, script)
+                return script
+        
+        messages = self.build_generation_messages(
+            test_case, draft=match if match is not None and match.decision == "draft" else None
         )
         
+        if stream_path or on_line:
+            script = self._generate_streaming(messages, stream_path, on_line, size_hint=len(steps))
+        elif not self.skeleton:
+            script = self.client.generate_with_context(
+                messages=messages,
+                temperature=GENERATE_TEMPERATURE,
+                stage="generate",
+                size_hint=len(steps)  # max_tokens is predicted from the step count
+            )
+        
+        if self.skeleton:
+            body, issues = self.generate_body(messages, stage="generate", size_hint=len(steps),
+                                              reply=script if stream_path or on_line else None)
+            if issues:
+                print(f"⚠️  Script body still has {len(issues)} seam issue(s): {'; '.join(issues)}")
+            script = render_script(test_case_id, body)
+        
         print(f"✅ Script generated")
+        self.remember_script(test_case, script)
         
         return script
     
+    def remember_script(self, test_case: Dict, script: str):
+        """Index a generated (or refined) script for near-duplicate lookups"""
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(test_case['test_case_id'], self.similarity_text(test_case),
+                                    self.extract_script_from_markdown(script))
+    
+    def _replay_draft(self, script: str, stream_path: Optional[str], on_line: Optional[Callable[[str], None]]):
+        """Give streaming consumers a reused script the same way they would see a generated one"""
+        if stream_path:
+            Path(stream_path).parent.mkdir(parents=True, exist_ok=True)
+            Path(stream_path).write_text(script, encoding='utf-8-sig')
+        if on_line:
+            for line in script.split("\n"):
+                on_line(line)
+    
+    def _generate_streaming(self, messages: List[Dict], stream_path: Optional[str],
+                            on_line: Optional[Callable[[str], None]], size_hint: Optional[int] = None) -> str:
+        """
+        Stream the generation, writing partial output to disk and/or a line callback
+        
+        Args:
+            messages: Generation messages (see build_generation_messages)
+            stream_path: Optional file receiving raw chunks as they arrive
+            on_line: Optional callback receiving each completed line
+            size_hint: Number of test steps (for max_tokens prediction)
+        
+        Returns:
+            Complete generated script (markdown fences removed)
+        """
+        parts = []
+        pending = ""
+        out = None
+        if stream_path:
+            Path(stream_path).parent.mkdir(parents=True, exist_ok=True)
+            out = open(stream_path, 'w', encoding='utf-8-sig')
+        
+        try:
+            for chunk in self.client.generate_stream(
+                messages=messages,
+                temperature=GENERATE_TEMPERATURE,
+                size_hint=size_hint
+            ):
+                parts.append(chunk)
+                if out:
+                    out.write(chunk)
+                    out.flush()
+                if on_line:
+                    pending += chunk
+                    *lines, pending = pending.split("\n")
+                    for line in lines:
+                        on_line(line)
+            if on_line and pending:
+                on_line(pending)
+        finally:
+            if out:
+                out.close()
+        
+        return self.extract_script_from_markdown("".join(parts))
+    
     def refine_script(self, script: str) -> str:
         """
         Refine generated script to ensure best practices
         
+        The script is validated locally first; the model is only asked for a
+        correction when the validator finds real problems, and gets them as context.
+        
         Args:
             script: Generated PowerShell script
         
         Returns:
-            Refined script
+            Refined script (the input itself if it passed validation)
         """
         print(f"🔍 Refining script...")
         
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "assistant", "content": f"Generated script:\n\n{script}"},
-            {"role": "user", "content": REFINEMENT_PROMPT}
-        ]
+        findings = self.review_findings(script)
+        if not findings:
+            print(f"✅ Script passed validation, no refinement needed")
+            return script
+        
+        print(f"⚠️  Validation found {len(findings)} problem(s):")
+        for finding in findings:
+            print(f"   - {finding}")
         
-        refinement_result = self.client.generate_with_context(
-            messages=messages,
-            temperature=0.1
+        # Ask AI to fix exactly these problems
+        refined_script = self.client.generate_with_context(
+            messages=self.build_correction_messages(script, findings),
+            temperature=REFINE_TEMPERATURE,
+            stage="refine",
+            size_hint=count_tokens(script)  # the corrected script is about as long as the original
         )
         
-        # Check if refinement suggests changes
-        if "no issues" in refinement_result.lower() or "looks good" in refinement_result.lower():
-            print(f"✅ Script passed review")
-            return script
-        else:
-            print(f"⚠️  Refinement suggestions found")
-            print(refinement_result)
-            
-            # Ask AI to generate corrected version
-            messages.append({"role": "assistant", "content": refinement_result})
-            messages.append({"role": "user", "content": "Please provide the corrected complete PowerShell script."})
-            
-            refined_script = self.client.generate_with_context(
-                messages=messages,
-                temperature=0.1
-            )
-            
-            print(f"✅ Script refined")
-            return refined_script
+        print(f"✅ Script refined")
+        return self.apply_correction(script, refined_script)
+    
+    def apply_correction(self, script: str, reply: str) -> str:
+        """Script after a correction reply; with the skeleton only the phases are taken from it"""
+        corrected = self.extract_script_from_markdown(reply)
+        return replace_body(script, corrected) if self.skeleton else corrected
     
     def extract_script_from_markdown(self, text: str) -> str:
         """Extract PowerShell script from markdown code blocks"""
@@ -147,7 +403,38 @@ class TestScriptGenerator:
         
         print(f"💾 Script saved to: {output_path}")
     
-    def generate_and_save(self, json_path: str, output_path: str = None, refine: bool = True, config: dict = None):
+    def build_fingerprint(self, test_case: Dict, refine: bool = True, deployments: Optional[List[str]] = None,
+                          phased: Optional[bool] = None) -> str:
+        """
+        Fingerprint of everything a generated script depends on (see core.build_manifest)
+        
+        Args:
+            test_case: Parsed test case (config merged in)
+            refine: Whether the script goes through refinement
+            deployments: Deployments that produce the script (default: the router's generate/refine targets)
+            phased: As for generate_script
+        """
+        if deployments is None:
+            router = self._client.router if self._client is not None else get_router()
+            stages = ("generate", "refine") if refine else ("generate",)
+            deployments = [t.key for stage in stages for t in router.targets(stage)]
+        return fingerprint({
+            "test_case": test_case,
+            "prompts": hashlib.sha256("\0".join(PROMPT_TEMPLATES).encode("utf-8")).hexdigest(),
+            "deployments": deployments,
+            "settings": {"refine": refine, "phased": self.use_phased(test_case, phased), "skeleton": self.skeleton,
+                         "generate_temperature": GENERATE_TEMPERATURE, "refine_temperature": REFINE_TEMPERATURE}
+        })
+    
+    def is_up_to_date(self, test_case: Dict, output_path: str, refine: bool = True,
+                      phased: Optional[bool] = None) -> bool:
+        """Whether output_path was generated from this exact case, prompts, deployment and settings"""
+        return self.manifest is not None and self.manifest.is_up_to_date(
+            output_path, self.build_fingerprint(test_case, refine, phased=phased))
+    
+    def generate_and_save(self, json_path: str, output_path: str = None, refine: bool = True, config: dict = None,
+                          stream: bool = False, on_line: Optional[Callable[[str], None]] = None, force: bool = False,
+                          phased: Optional[bool] = None):
         """
         Complete workflow: load JSON → generate script → refine → save
         
@@ -156,10 +443,24 @@ class TestScriptGenerator:
             output_path: Output .ps1 file path (optional, auto-generated if not provided)
             refine: Whether to refine the script
             config: Optional configuration dict (e.g., {'msi_path': 'C:\\path\\to.msi', 'service_name': 'ServiceName'})
+            stream: Write the draft to output_path incrementally while it is generated
+            on_line: Optional callback receiving each generated line (implies stream)
+            force: Regenerate even if the build manifest says the output is up to date
+            phased: Plan phases and generate them in parallel (None: decided by use_phased)
+        """
+        return self.generate_and_save_case(self.load_test_case(json_path), output_path, refine, config, stream,
+                                           on_line, force, phased)
+    
+    def generate_and_save_case(self, test_case: Dict, output_path: str = None, refine: bool = True, config: dict = None,
+                               stream: bool = False, on_line: Optional[Callable[[str], None]] = None,
+                               force: bool = False, phased: Optional[bool] = None):
         """
-        # Load test case
-        test_case = self.load_test_case(json_path)
+        generate_and_save for an already parsed test case (e.g. a CSV converted in memory)
         
+        Args:
+            test_case: Dictionary with 'test_case_id', 'test_scenario', and 'steps'
+            output_path, refine, config, stream, on_line, force, phased: As for generate_and_save
+        """
         # Merge config into test case if provided
         if config:
             if 'config' not in test_case:
@@ -171,15 +472,27 @@ class TestScriptGenerator:
             test_case_id = test_case['test_case_id']
             output_path = f"output/test_{test_case_id}.ps1"
         
-        # Generate script
-        script = self.generate_script(test_case)
+        # Skip outputs whose inputs have not changed since they were generated
+        inputs_fingerprint = self.build_fingerprint(test_case, refine, phased=phased) if self.manifest is not None else None
+        if not force and inputs_fingerprint is not None and self.manifest.is_up_to_date(output_path, inputs_fingerprint):
+            print(f"⏭️  Up to date, not regenerated: {output_path} (use --force to regenerate)")
+            return output_path
+        
+        # Generate script (streamed drafts are overwritten by the final save below)
+        if stream or on_line:
+            script = self.generate_script(test_case, stream_path=output_path, on_line=on_line, phased=phased)
+        else:
+            script = self.generate_script(test_case, phased=phased)
         
         # Refine if requested
         if refine:
             script = self.refine_script(script)
+            self.remember_script(test_case, script)
         
         # Save script
         self.save_script(script, output_path)
+        if inputs_fingerprint is not None:
+            self.manifest.record(output_path, inputs_fingerprint, test_case_id=test_case['test_case_id'])
         
         print(f"\n{'='*60}")
         print(f"✅ Test script generation completed!")
@@ -0,0 +1,141 @@
+"""
+Adaptive max_tokens Prediction
+按阶段、步骤数与历史输出长度预测 max_tokens，避免每次请求都按 16000 预留 TPM 配额
+"""
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_HISTORY_FILE = Path(__file__).parent.parent / ".cache" / "token_history.json"
+
+# Prior output size per stage: base tokens + tokens per unit of size hint
+# (generate: per test step; refine: per token of the script being corrected)
+STAGE_PRIORS: Dict[str, Tuple[float, float]] = {
+    "generate": (2500, 300),
+    "refine": (800, 1.1),
+    "evaluate": (1200, 0),
+    "analyze": (1500, 0),
+    "plan": (600, 30),  # phased generation: shared variables plus the phase list
+    "phase": (600, 250),  # one phase body, per step it covers
+}
+DEFAULT_PRIOR = (2000, 0)
+
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off at the length limit. Continue exactly where it stopped: "
+    "no repetition, no preamble, no new code fence."
+)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+class TokenPredictor:
+    """Predict max_tokens per call from the stage prior and observed output lengths
+
+    Each stage has a prior ``base + per_unit * size_hint``. Once `min_samples`
+    outputs have been observed for a stage, the prior is rescaled by the
+    `percentile` of observed/prior ratios, then padded by `margin` and clamped
+    to [floor, ceiling]. Outputs that still hit the limit are finished by a
+    continuation call, and their full length feeds back into the history.
+    """
+
+    def __init__(self, history_file: Optional[str] = None, margin: float = 1.25, floor: int = 512,
+                 ceiling: int = 16000, percentile: float = 95, min_samples: int = 3, window: int = 50):
+        """
+        Args:
+            history_file: JSON file with observed output lengths per stage (None: in-memory only)
+            margin: Safety factor applied on top of the prediction
+            floor: Smallest max_tokens ever predicted
+            ceiling: Largest max_tokens ever predicted (the deployment's output limit)
+            percentile: Percentile of observed/prior ratios used once history exists
+            min_samples: Observations per stage before history overrides the prior
+            window: Most recent observations kept per stage
+        """
+        self.history_file = Path(history_file) if history_file else None
+        self.margin = margin
+        self.floor = floor
+        self.ceiling = ceiling
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._history: Dict[str, List[float]] = {}
+        if self.history_file is not None:
+            try:
+                self._history = json.loads(self.history_file.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                pass
+
+    @classmethod
+    def from_env(cls) -> Optional["TokenPredictor"]:
+        """
+        On by default; MODEL_ADAPTIVE_MAX_TOKENS=0 restores the fixed 16000 limit
+
+        MODEL_TOKEN_HISTORY_FILE (default .cache/token_history.json),
+        MODEL_MAX_TOKENS_MARGIN (1.25) and MODEL_MAX_TOKENS_CEILING (16000) tune it.
+        """
+        if os.getenv("MODEL_ADAPTIVE_MAX_TOKENS", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            history_file=os.getenv("MODEL_TOKEN_HISTORY_FILE") or str(DEFAULT_HISTORY_FILE),
+            margin=float(os.getenv("MODEL_MAX_TOKENS_MARGIN", "1.25")),
+            ceiling=int(os.getenv("MODEL_MAX_TOKENS_CEILING", "16000"))
+        )
+
+    def prior(self, stage: str, size_hint: Optional[float] = None) -> float:
+        base, per_unit = STAGE_PRIORS.get(stage, DEFAULT_PRIOR)
+        return base + per_unit * (size_hint or 0)
+
+    def predict(self, stage: str, size_hint: Optional[float] = None) -> int:
+        """
+        max_tokens for one call
+
+        Args:
+            stage: Pipeline stage (generate/refine/evaluate/analyze/...)
+            size_hint: Stage-specific size (test steps for generate, script tokens for a correction)
+        """
+        expected = self.prior(stage, size_hint)
+        with self._lock:
+            ratios = list(self._history.get(stage, ()))
+        if len(ratios) >= self.min_samples:
+            expected *= _percentile(ratios, self.percentile)
+        return int(min(self.ceiling, max(self.floor, expected * self.margin)))
+
+    def observe(self, stage: str, size_hint: Optional[float], completion_tokens: int):
+        """Record the full output length of a finished call (continuations included)"""
+        if not completion_tokens:
+            return
+        ratio = completion_tokens / self.prior(stage, size_hint)
+        with self._lock:
+            ratios = self._history.setdefault(stage, [])
+            ratios.append(round(ratio, 4))
+            del ratios[:-self.window]
+            if self.history_file is not None:
+                try:
+                    self.history_file.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = self.history_file.with_suffix(f".{os.getpid()}.tmp")
+                    tmp.write_text(json.dumps(self._history), encoding="utf-8")
+                    os.replace(tmp, self.history_file)
+                except OSError:
+                    pass  # history is an optimisation; never fail a call over it
+
+
+_predictor: Optional[TokenPredictor] = None
+_predictor_loaded = False
+_predictor_lock = threading.Lock()
+
+
+def get_token_predictor() -> Optional[TokenPredictor]:
+    """Process-wide predictor shared by every ModelClient (None when adaptive max_tokens is off)"""
+    global _predictor, _predictor_loaded
+    with _predictor_lock:
+        if not _predictor_loaded:
+            _predictor = TokenPredictor.from_env()
+            _predictor_loaded = True
+        return _predictor
@@ -30,6 +30,7 @@ try:
     from core.test_generator import TestScriptGenerator
     from core.script_validator import ScriptValidator
     from core.report_generator import ReportGenerator
+    from core.priority import INTERACTIVE, priority_lane
     HAS_CORE = True
 except ImportError as e:
     # Fallback: 如果找不到模块，提示用户
@@ -49,6 +50,9 @@ except ImportError as e:
         """临时占位类"""
         def __init__(self):
             raise ImportError("核心模块未找到，请在 auto-test-v2 目录中运行客户端")
+    
+    from contextlib import nullcontext as priority_lane
+    INTERACTIVE = None
 
 
 class AutoTestGUI:
@@ -409,6 +413,12 @@ class AutoTestGUI:
     
     def _generate_script_thread(self, csv_file):
         """Thread function for script generation"""
+        # A user is waiting on this: go ahead of batch/background model traffic
+        with priority_lane(INTERACTIVE):
+            self._generate_script(csv_file)
+    
+    def _generate_script(self, csv_file):
+        """Generate, validate and report one script (runs on the worker thread)"""
         try:
             csv_path = Path(csv_file)
             
@@ -437,10 +447,19 @@ class AutoTestGUI:
             
             generator = TestScriptGenerator()
             
+            # Stream generated lines into the log and advance progress 60% → 85%
+            streamed = {"lines": 0}
+            def on_line(line):
+                streamed["lines"] += 1
+                self.output_queue.put(("log", f"   {line}", "info"))
+                self.output_queue.put(("progress", 60 + min(25, streamed["lines"] * 25 / 300)))
+            
             output_path = generator.generate_and_save(
                 json_path=str(json_path),
                 output_path=None,  # Auto-generate
-                refine=True  # Enable refinement
+                refine=True,  # Enable refinement
+                on_line=on_line,
+                force=True  # an explicit Generate click always asks the model again
             )
             
             self.output_queue.put(("progress", 90))
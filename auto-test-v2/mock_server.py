@@ -0,0 +1,77 @@
+"""
+Local mock of the Azure OpenAI chat-completions endpoint
+本地模拟服务：在不占用共享配额的情况下压测重试、并发上限与速率限制器
+
+使用方法:
+    python mock_server.py --port 8765 --latency lognormal:0.8,0.5 --tps 60
+    python mock_server.py --rate-429 0.2 --retry-after 2 --burst-every 50 --burst-length 5
+    python mock_server.py --script mock_script.json
+
+    然后: set AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765/  (本地地址无需 Azure 登录)
+
+脚本文件格式 (--script):
+    {"rules": [
+        {"match": "code reviewer", "content": "{\\"overall_score\\": 90}"},
+        {"match": "failed these automated checks", "content": "```powershell\\nWrite-Host 'fixed'\\n```"},
+        {"status": 503, "times": 2},
+        {"content": "```powershell\\nWrite-Host 'ok'\\n```", "latency": "uniform:1,3"}
+    ]}
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.mock_server import MockConfig, MockOpenAIServer, MockRule
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI-compatible mock server with latency, 429 and 5xx injection')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port (default 8765)')
+    parser.add_argument('--script', help='JSON file with scripted rules (see module docstring)')
+    parser.add_argument('--content', help='Default response content')
+    parser.add_argument('--latency', default='0', help='Latency before responding: SECONDS, uniform:LO,HI, normal:MEAN,STD, lognormal:MEDIAN,SIGMA, exp:MEAN')
+    parser.add_argument('--tps', type=float, default=0.0, help='Streaming speed in tokens per second (default: unthrottled)')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Probability of answering 429 (0-1)')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429 (default 1)')
+    parser.add_argument('--burst-every', type=int, default=0, help='Start a 5xx burst every N requests')
+    parser.add_argument('--burst-length', type=int, default=0, help='Requests per 5xx burst')
+    parser.add_argument('--burst-status', type=int, default=503, help='Status code for bursts (default 503)')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible latency/429 patterns')
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        tokens_per_second=args.tps,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        burst_status=args.burst_status,
+        seed=args.seed
+    )
+    if args.content:
+        config.content = args.content
+    if args.script:
+        script = json.loads(Path(args.script).read_text(encoding='utf-8'))
+        config.rules = [MockRule.from_dict(rule) for rule in script.get('rules', [])]
+
+    server = MockOpenAIServer(config, host=args.host, port=args.port).start()
+    print(f"🧪 Mock Azure OpenAI listening on {server.endpoint}")
+    print(f"   set AZURE_OPENAI_ENDPOINT={server.endpoint}")
+    print(f"   request counts: {server.endpoint}stats   (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n📊 {dict(server.stats)}")
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,18 +5,19 @@
 2. python run.py --csv input/test.csv
    或
    python run.py --json input/test.json
+   或
+   python run.py --batch input/ --workers 8   # 并行生成目录下全部用例
 
 CSV 会自动转换为 JSON，然后生成 PowerShell 测试脚本
 """
 import argparse
+import os
 import sys
 from pathlib import Path
 
 # Add current directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
-from core.csv_parser import parse_csv_to_json, save_json
-from core.test_generator import TestScriptGenerator
 
 def main():
     parser = argparse.ArgumentParser(
@@ -27,18 +28,67 @@ def main():
     input_group = parser.add_mutually_exclusive_group(required=True)
     input_group.add_argument('--csv', help='Input CSV file path')
     input_group.add_argument('--json', help='Input JSON file path')
+    input_group.add_argument('--batch', metavar='DIR_OR_GLOB',
+                             help='Generate every CSV/JSON case in a directory or matching a glob, in parallel')
     
     # Output options
     parser.add_argument('-o', '--output', help='Output PowerShell script path (optional, auto-generated if not provided)')
     parser.add_argument('--no-refine', action='store_true', help='Skip script refinement step')
     parser.add_argument('--keep-json', action='store_true', help='Keep intermediate JSON file (for CSV input)')
+    parser.add_argument('--phased', action='store_true',
+                        help='Plan phases first and generate them in parallel (for long cases; same as MODEL_PHASED_MIN_STEPS=1)')
+    parser.add_argument('--no-skeleton', action='store_true',
+                        help='Have the model write the whole script, boilerplate included (same as MODEL_SCRIPT_SKELETON=0)')
+    parser.add_argument('--force', action='store_true',
+                        help='Regenerate even if the build manifest says the output is up to date')
+    parser.add_argument('--output-dir', default='output', help='Directory for generated scripts in --batch mode (default: output)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('MODEL_MAX_CONCURRENCY', '8')),
+                        help='Cases generated in parallel in --batch mode; they share one client and rate limiter '
+                             '(default: MODEL_MAX_CONCURRENCY or 8)')
+    
+    # Cache options
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument('--cache', action='store_true', help='Enable on-disk LLM response cache (same as MODEL_CACHE=1)')
+    cache_group.add_argument('--no-cache', action='store_true', help='Bypass cached responses and fetch fresh ones')
+    parser.add_argument('--semantic-cache', action='store_true',
+                        help='Reuse or draft from scripts of near-duplicate test cases (same as MODEL_SEMANTIC_CACHE=1)')
+    
+    # Record/replay options (offline runs and benchmarks)
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument('--record', metavar='CASSETTE', help='Record every model call to a cassette file')
+    cassette_group.add_argument('--replay', metavar='CASSETTE', help='Serve model calls from a recorded cassette (no network)')
+    parser.add_argument('--replay-latency', type=float, default=0.0, metavar='SCALE',
+                        help='Re-inject recorded latency during replay (0 = instant, 1 = original timing)')
     
     args = parser.parse_args()
     
+    if args.cache:
+        os.environ['MODEL_CACHE'] = '1'
+    if args.no_cache:
+        os.environ['MODEL_CACHE_BYPASS'] = '1'
+    if args.semantic_cache:
+        os.environ['MODEL_SEMANTIC_CACHE'] = '1'
+    if args.phased:
+        os.environ['MODEL_PHASED_MIN_STEPS'] = '1'
+    if args.no_skeleton:
+        os.environ['MODEL_SCRIPT_SKELETON'] = '0'
+    if args.record or args.replay:
+        os.environ['MODEL_CASSETTE'] = args.record or args.replay
+        os.environ['MODEL_CASSETTE_MODE'] = 'record' if args.record else 'replay'
+        os.environ['MODEL_CASSETTE_LATENCY'] = str(args.replay_latency)
+    
+    # Imported after argument parsing so --help and usage errors return immediately
+    from core.csv_parser import parse_csv_to_json, save_json
+    from core.test_generator import TestScriptGenerator
+    from core.telemetry import get_telemetry
+    
     print(f"\n{'='*70}")
     print(f"  Auto-Test V2 - Goal-Oriented Test Script Generator")
     print(f"{'='*70}\n")
     
+    if args.batch:
+        sys.exit(run_batch(args, TestScriptGenerator(), get_telemetry()))
+    
     json_path = None
     temp_json = False
     
@@ -89,9 +139,21 @@ def main():
         output_path = generator.generate_and_save(
             json_path=json_path,
             output_path=args.output,
-            refine=not args.no_refine
+            refine=not args.no_refine,
+            force=args.force
         )
         
+        if generator.client.cache is not None:
+            stats = generator.client.cache.stats()
+            print(f"🗄️  Response cache: {stats['hits']} hits, {stats['misses']} misses")
+        if generator.semantic_cache is not None:
+            stats = generator.semantic_cache.stats()
+            print(f"🧠 Semantic cache: {stats['reuse']} reused, {stats['draft']} drafts, {stats['miss']} misses "
+                  f"(hit rate {stats['lifetime_hit_rate']:.0%} over {stats['lifetime_lookups']} lookups)")
+        print(get_telemetry().format_summary())
+        if generator.client.router.routes:
+            print(generator.client.router.format_stats())
+        
         # Clean up temporary JSON if needed
         if temp_json and not args.keep_json:
             Path(json_path).unlink()
@@ -110,5 +172,54 @@ def main():
         traceback.print_exc()
         sys.exit(1)
 
+def run_batch(args, generator, telemetry) -> int:
+    """
+    --batch mode: every case on a shared worker pool, in the background lane; returns the process exit code
+    
+    Args:
+        args: Parsed command line
+        generator: TestScriptGenerator shared by all workers (one model client, response cache and rate limiter)
+        telemetry: Telemetry whose summary is printed at the end
+    """
+    from core.parallel_runner import ParallelCaseRunner, collect_case_files
+    from core.priority import BACKGROUND, priority_lane
+    
+    paths = collect_case_files(args.batch)
+    if not paths:
+        print(f"❌ No CSV/JSON cases found in: {args.batch}")
+        return 1
+    
+    print(f"📄 Input: {len(paths)} cases from {args.batch} ({args.workers} workers)")
+    print()
+    
+    runner = ParallelCaseRunner(generator, workers=args.workers, refine=not args.no_refine, output_dir=args.output_dir,
+                                force=args.force)
+    
+    def report(result):
+        if result.skipped:
+            status = f"⏭️  up to date: {result.output_path}"
+        else:
+            status = f"✅ {result.output_path}" if result.ok else f"❌ {result.error}"
+        print(f"[{result.test_case_id or Path(result.path).name}] {status} ({result.seconds:.1f}s)")
+    
+    # Like batch_generate.py: interactive GUI requests on the same deployment go first
+    with priority_lane(BACKGROUND):
+        results = runner.run(paths, on_result=report)
+    
+    print(f"\n{'='*70}")
+    print(runner.format_results(results))
+    if generator.semantic_cache is not None:
+        stats = generator.semantic_cache.stats()
+        print(f"🧠 Semantic cache: {stats['reuse']} reused, {stats['draft']} drafts, {stats['miss']} misses")
+    print(telemetry.format_summary())
+    
+    failed = [r for r in results if not r.ok]
+    if failed:
+        print(f"\n❌ {len(failed)} of {len(results)} cases failed")
+        return 1
+    print(f"\n✅ SUCCESS! {len(results)} test scripts ready in {args.output_dir}/")
+    return 0
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,143 @@
+# 测试离线批量生成
+# 使用 LocalBatchBackend 代替 Batch API，验证 JSONL 任务与结果回填
+# 任务的 max_tokens 来自 TokenPredictor，被截断的回复通过续写调用补全
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.batch_runner import BatchRunner, LocalBatchBackend, parse_batch_output
+from core.test_generator import TestScriptGenerator
+from core.token_predictor import TokenPredictor
+
+
+SCRIPT = "Start-Transcript -Path $log\ntry {\n    Get-Service x\n} catch {\n    Write-Host 'failed'\n}\nWrite-Host 'TEST EXECUTION SUMMARY'\nStop-Transcript"
+
+
+def fake_model(body):
+    """根据 prompt 内容返回模拟结果"""
+    system = body["messages"][0]["content"]
+    last = body["messages"][-1]["content"]
+    if "code reviewer" in system:
+        return json.dumps({
+            "overall_score": 88, "dimensions": {}, "strengths": [], "weaknesses": [], "recommendations": []
+        })
+    if "corrected complete PowerShell script" in last:
+        assert "non_silent_install" in last  # the validator findings are passed in
+        return f"```powershell\n{SCRIPT}\n# fixed\n```"
+    if "case_a" in last:
+        return f"```powershell\n# case_a\n{SCRIPT}\n```"
+    # case_b 的脚本使用了 /qn+，校验不通过，需要修正
+    return f"```powershell\n# case_b\nmsiexec /i agent.msi /qn+\n{SCRIPT}\n```"
+
+
+def test_batch_pipeline():
+    """测试生成 → 校验 → 修正 → 评估的批量流程"""
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = []
+        for cid in ("case_a", "case_b"):
+            path = Path(tmp) / f"{cid}.json"
+            path.write_text(json.dumps({
+                "test_case_id": cid,
+                "test_scenario": f"scenario {cid}",
+                "steps": [{"step": 1, "action": "Install MSI", "expected": "Installed"}]
+            }), encoding="utf-8")
+            inputs.append(str(path))
+
+        runner = BatchRunner(LocalBatchBackend(fake_model), deployment="gpt-4.1-batch",
+                             output_dir=str(Path(tmp) / "output"), job_dir=str(Path(tmp) / "jobs"))
+        summary = runner.run(inputs)
+
+        assert summary["case_a"]["error"] is None
+        assert summary["case_b"]["evaluation"]["overall_score"] == 88
+        script_a = Path(summary["case_a"]["output_path"]).read_text(encoding="utf-8-sig")
+        script_b = Path(summary["case_b"]["output_path"]).read_text(encoding="utf-8-sig")
+        assert "# fixed" not in script_a
+        assert "# fixed" in script_b
+
+        # 每个阶段一个 JSONL 任务文件，没有评审任务，仅校验不通过的 case_b 进入修正阶段
+        assert not list((Path(tmp) / "jobs").glob("*_review.jsonl"))
+        job_lines = (Path(tmp) / "jobs" / f"{runner.run_id}_correct.jsonl").read_text(encoding="utf-8").splitlines()
+        assert [json.loads(l)["custom_id"] for l in job_lines] == ["correct:case_b"]
+        assert json.loads(job_lines[0])["body"]["model"] == "gpt-4.1-batch"
+
+
+def _write_cases(tmp, ids):
+    inputs = []
+    for cid in ids:
+        path = Path(tmp) / f"{cid}.json"
+        path.write_text(json.dumps({
+            "test_case_id": cid,
+            "test_scenario": f"scenario {cid}",
+            "steps": [{"step": 1, "action": "Install MSI", "expected": "Installed"}]
+        }), encoding="utf-8")
+        inputs.append(str(path))
+    return inputs
+
+
+class TruncatingBackend(LocalBatchBackend):
+    """生成阶段的回复在 max_tokens 处被截断"""
+    def results(self, batch_id):
+        lines = []
+        for line in super().results(batch_id).splitlines():
+            record = json.loads(line)
+            if record["custom_id"].startswith("generate:"):
+                choice = record["response"]["body"]["choices"][0]
+                choice["message"]["content"] = choice["message"]["content"][:40]
+                choice["finish_reason"] = "length"
+            lines.append(json.dumps(record))
+        return "\n".join(lines)
+
+
+class ContinuingClient:
+    """续写调用：返回完整回复中尚未输出的部分"""
+    def __init__(self):
+        self.calls = []
+
+    def generate_with_context(self, messages, **kwargs):
+        self.calls.append(kwargs)
+        partial = messages[-2]["content"]
+        return fake_model({"messages": messages[:-2]})[len(partial):]
+
+
+def test_predicted_max_tokens_and_continuation():
+    """测试按预测设置 max_tokens，截断的回复被续写补全"""
+    with tempfile.TemporaryDirectory() as tmp:
+        runner = BatchRunner(TruncatingBackend(fake_model), deployment="gpt-4.1-batch",
+                             output_dir=str(Path(tmp) / "output"), job_dir=str(Path(tmp) / "jobs"))
+        client = ContinuingClient()
+        runner.generator = TestScriptGenerator(client, semantic_cache=None, manifest=None)
+        predictor = runner.predictor = TokenPredictor()
+        summary = runner.run(_write_cases(tmp, ["case_a"]), refine=False)
+
+        jobs = Path(tmp) / "jobs"
+        for phase, stage, hint in (("generate", "generate", 1), ("evaluate", "evaluate", None)):
+            line = json.loads((jobs / f"{runner.run_id}_{phase}.jsonl").read_text(encoding="utf-8"))
+            assert line["body"]["max_tokens"] == predictor.predict(stage, hint) < 16000
+
+        assert [(c["stage"], c["max_tokens"]) for c in client.calls] == [("generate", predictor.predict("generate", 1))]
+        script = Path(summary["case_a"]["output_path"]).read_text(encoding="utf-8-sig")
+        assert "# case_a" in script and "Stop-Transcript" in script
+        assert summary["case_a"]["evaluation"]["overall_score"] == 88
+
+
+def test_parse_batch_errors():
+    """测试批量输出中的错误行"""
+    output = "\n".join([
+        json.dumps({"custom_id": "a", "response": {"status_code": 429, "body": {"error": {"code": "429"}}}, "error": None}),
+        json.dumps({"custom_id": "b", "response": None, "error": {"message": "expired"}}),
+    ])
+    results = parse_batch_output(output)
+    assert results["a"]["content"] is None and "429" in results["a"]["error"]
+    assert "expired" in results["b"]["error"]
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 批量生成测试")
+    test_batch_pipeline()
+    test_predicted_max_tokens_and_continuation()
+    test_parse_batch_errors()
+    print("\n✅ 所有测试完成!")
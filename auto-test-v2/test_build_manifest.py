@@ -0,0 +1,88 @@
+# 测试增量生成清单
+# 1. 输出文件与记录的输入指纹一致时视为最新；输出被删除或手工修改时重新生成
+# 2. 用例内容、提示词模板、部署或生成参数变化时重新生成，--force 强制重新生成
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import core.test_generator as test_generator
+from core.build_manifest import BuildManifest, fingerprint
+from core.router import Router, Target
+from core.test_generator import TestScriptGenerator
+
+CASE = {
+    "test_case_id": "case-manifest",
+    "test_scenario": "Install the agent",
+    "steps": [{"step": 1, "action": "msiexec /i agent.msi /qn", "expected": "Installed"}]
+}
+
+
+class FakeClient:
+    def __init__(self, deployment="gpt-4.1"):
+        self.router = Router({}, default=Target(deployment))
+        self.calls = 0
+
+    def generate_with_context(self, messages, **kwargs):
+        self.calls += 1
+        return "Write-Host 'generated'"
+
+
+def test_manifest_up_to_date():
+    """测试输出文件的最新判断"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = BuildManifest(str(Path(tmp) / "manifest.json"))
+        output = Path(tmp) / "test_case.ps1"
+        output.write_text("Write-Host 'a'", encoding="utf-8")
+        inputs = fingerprint({"test_case": CASE})
+
+        assert not manifest.is_up_to_date(str(output), inputs)
+        manifest.record(str(output), inputs, test_case_id="case-manifest")
+        assert manifest.is_up_to_date(str(output), inputs)
+        assert BuildManifest(manifest.path).is_up_to_date(str(output), inputs)  # persisted
+        assert not manifest.is_up_to_date(str(output), fingerprint({"test_case": {**CASE, "test_scenario": "x"}}))
+
+        output.write_text("Write-Host 'edited by hand'", encoding="utf-8")
+        assert not manifest.is_up_to_date(str(output), inputs)
+        output.unlink()
+        assert not manifest.is_up_to_date(str(output), inputs)
+
+
+def test_generator_skips_unchanged_cases():
+    """测试生成器跳过未变化的用例"""
+    with tempfile.TemporaryDirectory() as tmp:
+        client = FakeClient()
+        manifest = BuildManifest(str(Path(tmp) / "manifest.json"))
+        generator = TestScriptGenerator(client, semantic_cache=None, manifest=manifest)
+        output = str(Path(tmp) / "test_case-manifest.ps1")
+
+        def build(case=CASE, refine=False, force=False):
+            generator.generate_and_save_case(dict(case), output_path=output, refine=refine, force=force)
+            return client.calls
+
+        assert build() == 1
+        assert build() == 1  # unchanged → skipped
+        assert generator.is_up_to_date(dict(CASE), output, refine=False)
+        assert build(force=True) == 2
+        assert build({**CASE, "steps": CASE["steps"] * 2}) == 3  # case content changed
+        assert build({**CASE, "steps": CASE["steps"] * 2}) == 3
+
+        original = test_generator.PROMPT_TEMPLATES
+        test_generator.PROMPT_TEMPLATES = original + ("new rule",)
+        try:
+            assert build({**CASE, "steps": CASE["steps"] * 2}) == 4  # prompt templates changed
+        finally:
+            test_generator.PROMPT_TEMPLATES = original
+
+        generator._client = FakeClient("gpt-4.1-mini")
+        build()
+        assert generator._client.calls == 1  # deployment changed
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 增量生成清单测试")
+    test_manifest_up_to_date()
+    test_generator_skips_unchanged_cases()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,100 @@
+# 测试录制/回放
+# 1. 录制普通与流式调用（含 usage 与延迟）
+# 2. 回放无需网络，结果一致，可注入延迟
+
+import os
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.cassette import Cassette, CassetteMissError, set_cassette
+from core.router import Router, Target
+
+
+def _completion(text):
+    usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15, prompt_tokens_details=None)
+    message = types.SimpleNamespace(content=text)
+    resp = types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+    resp.model_dump = lambda mode=None: {
+        "choices": [{"message": {"content": text}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15, "prompt_tokens_details": None}
+    }
+    return resp
+
+
+def _chunk(text):
+    chunk = types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=text))], usage=None)
+    chunk.model_dump = lambda mode=None: {"choices": [{"delta": {"content": text}}], "usage": None}
+    return chunk
+
+
+class FakeStream(list):
+    def close(self):
+        pass
+
+
+def _client(cassette_path, mode, latency=0.0):
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+    from core.model_client import ModelClient
+    set_cassette(Cassette(cassette_path, mode=mode, latency_scale=latency))
+    client = ModelClient(router=Router({}, default=Target("cassette-test")))
+    client.cache = None
+    client.rate_limiter = None
+    return client
+
+
+def test_record_then_replay():
+    """测试录制后离线回放"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "run.json")
+        calls = []
+
+        def create(stream=False, **kwargs):
+            calls.append(stream)
+            time.sleep(0.05)
+            if stream:
+                return FakeStream([_chunk("Write-Host "), _chunk("'hi'")])
+            return _completion("```powershell\nWrite-Host 'ok'\n```")
+
+        client = _client(path, "record")
+        fake = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+        client._clients = {client.endpoint: fake}
+        assert client.generate("system", "user") == "Write-Host 'ok'"
+        assert "".join(client.generate_stream("system", "stream me")) == "Write-Host 'hi'"
+
+        recorded = Cassette(path, mode="replay").interactions
+        assert recorded[0]["usage"]["total_tokens"] == 15 and recorded[0]["latency"] >= 0.05
+        assert "chunks" in recorded[1] and recorded[1]["first_token"] >= 0.05
+
+        # 回放：不访问网络，结果一致
+        client = _client(path, "replay")
+        client._clients = {client.endpoint: None}
+        started = time.perf_counter()
+        assert client.generate("system", "user") == "Write-Host 'ok'"
+        assert "".join(client.generate_stream("system", "stream me")) == "Write-Host 'hi'"
+        assert time.perf_counter() - started < 0.05
+        assert calls == [False, True]
+
+        try:
+            client.generate("system", "never recorded")
+            assert False, "expected CassetteMissError"
+        except CassetteMissError:
+            pass
+
+        # 延迟注入：还原录制的耗时
+        client = _client(path, "replay", latency=1.0)
+        client._clients = {client.endpoint: None}
+        started = time.perf_counter()
+        client.generate("system", "user")
+        assert time.perf_counter() - started >= 0.05
+        set_cassette(None)
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 录制/回放测试")
+    test_record_then_replay()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,190 @@
+# 测试 AIMD 自适应并发窗口
+# 1. 成功时加性增加，429/超时时乘性减小（冷却期内只减一次）
+# 2. 窗口已满时 acquire 阻塞，release 后放行
+# 3. ModelClient 的请求（含流式请求）经过并发窗口，429 会收缩窗口
+# 4. 并发的流式请求不超过窗口上限
+
+import os
+import sys
+import threading
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.concurrency import AIMDController, classify_outcome, get_concurrency_controller
+from core.router import Router, Target
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+def test_classify_outcome():
+    """测试结果分类"""
+    assert classify_outcome(None) == "success"
+    assert classify_outcome(Throttled()) == "throttled"
+    assert classify_outcome(APITimeoutError()) == "timeout"
+    assert classify_outcome(ValueError()) == "error"
+
+
+def test_additive_increase_multiplicative_decrease():
+    """测试 AIMD 调整"""
+    controller = AIMDController(max_limit=8, initial=4, cooldown=60)
+    for _ in range(5):
+        with controller.slot():
+            pass
+    assert controller.window == 5  # about +1 per window's worth of successes
+
+    try:
+        with controller.slot():
+            raise Throttled()
+    except Throttled:
+        pass
+    assert controller.window == 2
+    # A second 429 inside the cooldown does not cut again
+    controller.acquire()
+    controller.release(APITimeoutError())
+    assert controller.window == 2
+    assert controller.snapshot()["cuts"] == 1
+
+    controller.acquire()
+    controller.release(ValueError())
+    assert controller.window == 2
+
+    for _ in range(200):
+        controller.acquire()
+        controller.release()
+    assert controller.window == 8  # capped at max_limit
+
+
+def test_acquire_blocks_when_window_full():
+    """测试窗口已满时阻塞"""
+    controller = AIMDController(max_limit=2, initial=1)
+    controller.acquire()
+    acquired = threading.Event()
+    t = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+    t.start()
+    assert not acquired.wait(0.2)
+    controller.release()
+    assert acquired.wait(1)
+    t.join()
+    assert controller.snapshot()["in_flight"] == 1
+
+
+def _fake_client(deployment, create):
+    """ModelClient whose chat.completions.create is `create`"""
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+    from core.model_client import ModelClient
+
+    client = ModelClient(router=Router({}, default=Target(deployment)))
+    client.cache = None
+    client.rate_limiter = None
+    client.hedge = None
+    client.single_flight = None
+    client.predictor = None
+    client._clients = {client.endpoint: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))}
+    return client
+
+
+def _chunk(content):
+    delta = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(delta=delta, finish_reason=None)])
+
+
+def test_model_client_feeds_controller():
+    """测试 ModelClient 将 429 反馈给并发窗口"""
+    responses = [Throttled(), "ok"]
+
+    def create(model, messages, **kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        message = types.SimpleNamespace(content=response)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+    client = _fake_client("aimd-test", create)
+    controller = get_concurrency_controller("aimd-test")
+    before = controller.limit
+    assert client.generate("system", "user", use_cache=False) == "ok"
+    snapshot = controller.snapshot()
+    assert snapshot["cuts"] == 1
+    assert snapshot["in_flight"] == 0
+    assert controller.limit < before
+
+
+def test_stream_feeds_controller():
+    """测试流式请求占用并发窗口，429 同样收缩窗口"""
+    controller = get_concurrency_controller("aimd-stream-test")
+    responses = [Throttled(), ["o", "k"]]
+    seen = []
+
+    def create(model, messages, stream=False, **kwargs):
+        assert stream
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return (_chunk(c) for c in response)
+
+    before = controller.limit
+    for chunk in _fake_client("aimd-stream-test", create).generate_stream("system", "user", use_cache=False):
+        seen.append(controller.snapshot()["in_flight"])
+    assert seen == [1, 1]  # the slot is held while the stream is read
+    snapshot = controller.snapshot()
+    assert snapshot["cuts"] == 1
+    assert snapshot["in_flight"] == 0
+    assert controller.limit < before
+
+
+def test_concurrent_streams_respect_window():
+    """测试并发流式请求受窗口上限约束"""
+    controller = get_concurrency_controller("aimd-stream-cap")
+    controller.max_limit = 2
+    controller.limit = 2.0
+    lock = threading.Lock()
+    state = {"open": 0, "peak": 0}
+
+    def create(model, messages, stream=False, **kwargs):
+        def chunks():
+            with lock:
+                state["open"] += 1
+                state["peak"] = max(state["peak"], state["open"])
+            try:
+                yield _chunk("first")
+                threading.Event().wait(0.1)  # the rest of the answer is still being generated
+                yield _chunk(" done")
+            finally:
+                with lock:
+                    state["open"] -= 1
+        return chunks()
+
+    client = _fake_client("aimd-stream-cap", create)
+    outputs = []
+
+    def consume():
+        outputs.append("".join(client.generate_stream("system", "user", use_cache=False)))
+
+    threads = [threading.Thread(target=consume) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert outputs == ["first done"] * 6
+    assert state["peak"] == 2, state
+    assert controller.snapshot()["in_flight"] == 0
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 自适应并发测试")
+    test_classify_outcome()
+    test_additive_increase_multiplicative_decrease()
+    test_acquire_blocks_when_window_full()
+    test_model_client_feeds_controller()
+    test_stream_feeds_controller()
+    test_concurrent_streams_respect_window()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,110 @@
+# 测试对冲请求
+# 1. 慢请求超过延迟阈值后发送备份请求，先完成者胜出并取消另一个
+# 2. 速率限制预算不足时不发送备份
+# 3. ModelClient 在历史延迟足够时对冲
+
+import os
+import sys
+import threading
+import time
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.hedging import HedgeCancelled, HedgePolicy, hedged
+from core.router import LatencyStats, Router, Target
+
+
+def test_hedge_wins_and_cancels_slow_request():
+    """测试备份请求先完成，原请求被取消"""
+    cancelled = threading.Event()
+    calls = {"n": 0}
+
+    def fn(token):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            token.on_cancel(cancelled.set)
+            cancelled.wait(5)
+            raise HedgeCancelled()
+        return "hedge"
+
+    result, hedges = hedged(fn, delay=0.05)
+    assert (result, hedges) == ("hedge", 1)
+    assert cancelled.wait(1)
+
+
+def test_no_hedge_without_budget():
+    """测试预算不足时只等待原请求"""
+    def fn(token):
+        time.sleep(0.1)
+        return "primary"
+
+    assert hedged(fn, delay=0.01, allow_hedge=lambda: False) == ("primary", 0)
+
+
+def test_policy_needs_history():
+    """测试历史样本不足时不对冲"""
+    stats = LatencyStats()
+    policy = HedgePolicy(percentile=90, min_samples=5, min_delay=0.5)
+    assert policy.delay(stats) is None
+    for latency in (1, 2, 3, 4, 10):
+        stats.add(latency, ok=True)
+    assert policy.delay(stats) == 10
+
+
+class FakeStream:
+    """模拟流式响应：阻塞直到 close() 或 release"""
+    def __init__(self, text, release):
+        self.text, self.release, self.closed = text, release, threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+    def __iter__(self):
+        while not (self.release.is_set() or self.closed.is_set()):
+            time.sleep(0.01)
+        if self.closed.is_set():
+            raise ConnectionError("stream closed")
+        delta = types.SimpleNamespace(content=self.text)
+        yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+
+
+def test_model_client_hedges_slow_call():
+    """测试 ModelClient 对慢调用发送对冲请求"""
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+    from core.model_client import ModelClient
+    from core.telemetry import get_telemetry
+
+    target = Target("hedge-test")
+    router = Router({}, default=target)
+    for _ in range(5):
+        router.record("generate", target, 0.05, ok=True)
+    client = ModelClient(router=router, hedge=HedgePolicy(min_samples=5, min_delay=0.05))
+    client.cache = None
+    client.rate_limiter = None
+
+    streams = []
+
+    def create(model, stream=False, **kwargs):
+        release = threading.Event()
+        if streams:
+            release.set()  # the hedge answers immediately
+        streams.append(FakeStream(f"answer {len(streams)}", release))
+        return streams[-1]
+
+    fake = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+    client._clients = {client.endpoint: fake}
+    mark = get_telemetry().mark()
+    assert client.generate("system", "user", use_cache=False) == "answer 1"
+    assert streams[0].closed.wait(1)
+    assert get_telemetry().summary(since=mark)["generate"]["hedges"] == 1
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 对冲请求测试")
+    test_hedge_wins_and_cancels_slow_request()
+    test_no_hedge_without_budget()
+    test_policy_needs_history()
+    test_model_client_hedges_slow_call()
+    print("\n✅ 所有测试完成!")
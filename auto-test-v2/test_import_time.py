@@ -0,0 +1,66 @@
+# 测试 CLI 启动耗时（python -X importtime）
+# 1. run.py / batch_generate.py / mock_server.py / vision_verify.py 的 --help 不导入 openai、azure.identity、langgraph
+# 2. GUI 启动时导入的 core 模块同样不导入重量级依赖
+# 3. 导入总耗时不超过预算（IMPORT_TIME_BUDGET_MS，默认 500ms），防止启动变慢
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+HEAVY_MODULES = ("openai", "azure.identity", "langgraph")
+BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "500"))
+
+ENTRY_POINTS = {
+    "run.py --help": [str(ROOT / "run.py"), "--help"],
+    "batch_generate.py --help": [str(ROOT / "batch_generate.py"), "--help"],
+    "mock_server.py --help": [str(ROOT / "mock_server.py"), "--help"],
+    "vision_verify.py --help": [str(ROOT.parent / "verify" / "vision_verify.py"), "--help"],
+    # same core imports as gui_client.py (tkinter itself is not needed here)
+    "gui_client core imports": ["-c", "import core.csv_parser, core.test_generator, core.script_validator, "
+                                      "core.report_generator, core.priority"],
+}
+
+
+def import_profile(args):
+    """Run `python -X importtime <args>`; returns {module: cumulative microseconds} for top-level imports"""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, capture_output=True,
+                            text=True, encoding="utf-8", errors="replace", timeout=60)
+    assert result.returncode == 0, result.stderr[-2000:]
+    modules, top_level = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules[name.strip()] = int(cumulative)
+        if not name[1:].startswith(" "):
+            top_level[name.strip()] = int(cumulative)
+    return modules, top_level
+
+
+def test_no_heavy_imports_at_startup():
+    """测试启动时不导入重量级依赖"""
+    for label, args in ENTRY_POINTS.items():
+        modules, _ = import_profile(args)
+        loaded = [m for m in modules if m.split(".")[0] in HEAVY_MODULES or m in HEAVY_MODULES]
+        assert not loaded, f"{label} imports {loaded}"
+        print(f"  ✓ {label}: no {', '.join(HEAVY_MODULES)}")
+
+
+def test_startup_budget():
+    """测试启动导入耗时在预算内"""
+    for label, args in ENTRY_POINTS.items():
+        _, top_level = import_profile(args)
+        # interpreter start-up (site, encodings) is the same for every script and not ours to trim
+        total_ms = sum(us for m, us in top_level.items() if m not in ("site", "encodings")) / 1000
+        slowest = sorted(top_level.items(), key=lambda kv: -kv[1])[:3]
+        print(f"  {label}: {total_ms:.0f}ms (slowest: {', '.join(f'{m} {us / 1000:.0f}ms' for m, us in slowest)})")
+        assert total_ms <= BUDGET_MS, f"{label} spends {total_ms:.0f}ms importing (budget {BUDGET_MS:.0f}ms)"
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 启动耗时测试")
+    test_no_heavy_imports_at_startup()
+    test_startup_budget()
+    print("\n✅ 所有测试完成!")
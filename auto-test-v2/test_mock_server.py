@@ -0,0 +1,65 @@
+# 测试本地模拟服务
+# 使用真实的 AzureOpenAI 客户端访问本地 mock：脚本化响应、429 重试、流式输出、5xx 突发
+
+import json
+import os
+import sys
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.mock_server import MockConfig, MockOpenAIServer, MockRule, parse_latency
+from core.router import Router, Target
+
+
+def _client(endpoint, deployment):
+    os.environ["AZURE_OPENAI_ENDPOINT"] = endpoint
+    from core.model_client import ModelClient
+    client = ModelClient(router=Router({}, default=Target(deployment)))
+    client.cache = None
+    client.rate_limiter = None
+    client.hedge = None
+    return client
+
+
+def test_scripted_responses_and_throttling():
+    """测试脚本化响应与 429 Retry-After 重试"""
+    config = MockConfig(rules=[
+        MockRule(status=429, times=1, retry_after=0.01),
+        MockRule(match="reviewer", content="Looks good."),
+        MockRule(content="```powershell\nWrite-Host 'mock'\n```"),
+    ])
+    with MockOpenAIServer(config) as server:
+        client = _client(server.endpoint, "mock-scripted")
+        assert client.generate("You are a code reviewer", "review") == "Looks good."
+        assert client.generate("system", "generate") == "Write-Host 'mock'"
+        stats = json.loads(urllib.request.urlopen(server.endpoint + "stats").read())
+        assert stats["status"]["429"] == 1
+
+
+def test_streaming_and_bursts():
+    """测试按 token/s 流式输出与 5xx 突发"""
+    config = MockConfig(content="Write-Host 'streamed'", tokens_per_second=200, burst_every=100, burst_length=1)
+    with MockOpenAIServer(config) as server:
+        client = _client(server.endpoint, "mock-stream")
+        chunks = list(client.generate_stream("system", "user", use_cache=False))
+        assert len(chunks) > 1
+        assert "".join(chunks) == "Write-Host 'streamed'"
+        assert server.stats[503] == 1
+
+
+def test_latency_distributions():
+    """测试延迟分布解析"""
+    assert parse_latency("0.25")() == 0.25
+    samples = [parse_latency("uniform:1,2")() for _ in range(50)]
+    assert all(1 <= s <= 2 for s in samples)
+    assert min(parse_latency("normal:0,1")() for _ in range(50)) >= 0
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 本地模拟服务测试")
+    test_scripted_responses_and_throttling()
+    test_streaming_and_bursts()
+    test_latency_distributions()
+    print("\n✅ 所有测试完成!")
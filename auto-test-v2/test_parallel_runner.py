@@ -0,0 +1,91 @@
+# 测试 run.py --batch 并行批量生成
+# 1. 目录输入：同名 CSV/JSON 只取 CSV
+# 2. 多个用例并行生成，共享一个客户端；失败用例不影响其他用例
+# 3. run.py --batch 有失败用例时返回非零退出码
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.build_manifest import BuildManifest
+from core.mock_server import MockConfig, MockOpenAIServer
+from core.parallel_runner import ParallelCaseRunner, collect_case_files
+from core.router import Router, Target
+from core.test_generator import TestScriptGenerator
+
+ROOT = Path(__file__).parent
+
+
+def _write_cases(folder: Path, count: int):
+    for i in range(count):
+        (folder / f"case{i}.csv").write_text(
+            f"# Test Scenario: scenario {i}\nStep,Action,Expected\n1,Install agent {i},Installed\n", encoding="utf-8")
+    # converted copy of case0.csv: must not be generated twice
+    (folder / "case0.json").write_text(json.dumps({"test_case_id": "case0", "steps": []}), encoding="utf-8")
+
+
+def test_collect_case_files():
+    """测试输入收集与 CSV/JSON 去重"""
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_cases(Path(tmp), 2)
+        (Path(tmp) / "notes.txt").write_text("x", encoding="utf-8")
+        names = [Path(p).name for p in collect_case_files(tmp)]
+        assert names == ["case0.csv", "case1.csv"]
+        assert [Path(p).name for p in collect_case_files(str(Path(tmp) / "*1.*"))] == ["case1.csv"]
+
+
+def test_cases_run_in_parallel():
+    """测试用例并行生成，失败用例单独记录"""
+    with tempfile.TemporaryDirectory() as tmp, \
+            MockOpenAIServer(MockConfig(content="Write-Host 'ok'", latency="0.3")) as server:
+        _write_cases(Path(tmp), 4)
+        (Path(tmp) / "broken.json").write_text("{not json", encoding="utf-8")
+
+        os.environ["AZURE_OPENAI_ENDPOINT"] = server.endpoint
+        from core.model_client import ModelClient
+        client = ModelClient(router=Router({}, default=Target("mock-batch")))
+        client.cache = None
+        client.hedge = None
+        client._client  # build the OpenAI client (and import openai) before timing
+        manifest = BuildManifest(str(Path(tmp) / "out" / "manifest.json"))  # outside the input directory
+        runner = ParallelCaseRunner(TestScriptGenerator(client, semantic_cache=None, manifest=manifest),
+                                    workers=4, refine=False, output_dir=str(Path(tmp) / "out"))
+        results = runner.run(collect_case_files(tmp))
+        print(runner.format_results(results))
+
+        assert [r.ok for r in results] == [False, True, True, True, True]
+        assert "JSONDecodeError" in results[0].error
+        assert (Path(tmp) / "out" / "test_case3.ps1").exists()
+        assert runner.elapsed < 4 * 0.3  # four 0.3s calls overlapped
+        assert runner.usage["calls"] == 4
+        assert "cases/min" in runner.format_results(results)
+
+
+def test_batch_exit_code():
+    """测试 run.py --batch 的退出码"""
+    with tempfile.TemporaryDirectory() as tmp, MockOpenAIServer(MockConfig(content="Write-Host 'ok'")) as server:
+        _write_cases(Path(tmp), 2)
+        env = {**os.environ, "AZURE_OPENAI_ENDPOINT": server.endpoint, "PYTHONIOENCODING": "utf-8",
+               "MODEL_BUILD_MANIFEST_FILE": str(Path(tmp) / "out" / "manifest.json")}
+        command = [sys.executable, str(ROOT / "run.py"), "--batch", tmp, "--no-refine",
+                   "--output-dir", str(Path(tmp) / "out"), "--workers", "2"]
+        assert subprocess.run(command, cwd=ROOT, env=env, capture_output=True).returncode == 0
+
+        (Path(tmp) / "broken.json").write_text("{not json", encoding="utf-8")
+        result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, encoding="utf-8")
+        assert result.returncode == 1
+        assert "1 of 3 cases failed" in result.stdout
+        assert "2 up to date" in result.stdout  # unchanged cases were not regenerated
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 并行批量生成测试")
+    test_collect_case_files()
+    test_cases_run_in_parallel()
+    test_batch_exit_code()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,156 @@
+# 测试分阶段并行生成
+# 1. 阶段计划解析与衔接处校验（重复的骨架代码、不平衡的花括号）
+# 2. 各阶段主体并行生成，按计划顺序拼接进脚本骨架（关闭骨架时使用计划中的 setup/teardown）；衔接校验失败的阶段带问题重新生成
+# 3. 计划无法解析或格式错误时回退为一次性生成
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.mock_server import MockConfig, MockOpenAIServer, MockRule
+from core.phased_generator import PhasedGenerator, parse_phase_plan
+from core.router import Router, Target
+from core.script_skeleton import extract_body, render_script, seam_issues
+from core.test_generator import TestScriptGenerator
+
+CASE = {
+    "test_case_id": "case-phased",
+    "test_scenario": "Install the agent, verify it and uninstall it",
+    "steps": [{"step": i, "action": f"Action {i}", "expected": f"Result {i}"} for i in range(1, 7)]
+}
+
+PLAN = {
+    "setup": "$msiPath = 'C:\\\\agent.msi'",
+    "phases": [
+        {"name": "install", "goal": "Install the MSI", "steps": [1, 2]},
+        {"name": "verify", "goal": "Verify service and files", "steps": [3, 4, 5]},
+        {"name": "cleanup", "goal": "Uninstall", "steps": [6]},
+    ]
+}
+
+
+def _body(name):
+    return f"```powershell\ntry {{\n    Write-Result -Msg '{name}' -Success $true\n}} catch {{\n    Write-Result -Msg '{name} - error' -Success $false\n}}\n```"
+
+
+def _generator(server):
+    os.environ["AZURE_OPENAI_ENDPOINT"] = server.endpoint
+    from core.model_client import ModelClient
+    client = ModelClient(router=Router({}, default=Target("mock-phased")))
+    client.cache = None
+    client.hedge = None
+    client._client  # build the OpenAI client (and import openai) before timing
+    return TestScriptGenerator(client, semantic_cache=None)
+
+
+def test_plan_and_seams():
+    """测试阶段计划解析与衔接校验"""
+    plan = parse_phase_plan("Here is the plan:\n" + json.dumps(PLAN))
+    assert [p.name for p in plan.phases] == ["INSTALL", "VERIFY", "CLEANUP"]
+    assert plan.phases[1].steps == [3, 4, 5]
+    malformed = ['{"phases": []}', '{"phases": "install, verify"}', '{"phases": ["install", null]}',
+                 '{"phases": [{"name": "install", "steps": "1-3"}]}', '{"phases": [{"name": "install", "steps": [{}]}]}']
+    for reply in malformed:
+        try:
+            parse_phase_plan(reply)
+            assert False, f"malformed plan accepted: {reply}"
+        except ValueError:
+            pass
+
+    assert seam_issues("try {\n  Get-Service x\n} catch {\n  Write-Host 'x'\n}") == []
+    issues = seam_issues("Start-Transcript -Path $log\nif ($x) {\n")
+    assert any("Start-Transcript" in i for i in issues)
+    assert any("unbalanced_braces" in i for i in issues)
+
+
+def test_phases_generated_in_parallel():
+    """测试各阶段并行生成、拼接与衔接修复"""
+    config = MockConfig(rules=[
+        MockRule(match="Plan a goal-oriented", content=json.dumps(PLAN), latency="0.1"),
+        MockRule(match="WRITE PHASE 1/3", content=_body("installed"), latency="0.4"),
+        # phase 2 first comes back with an unclosed block, then fixed
+        MockRule(match="WRITE PHASE 2/3", content="```powershell\nif ($svc) {\n  Write-Result -Msg 'x' -Success $true\n```",
+                 latency="0.4", times=1),
+        MockRule(match="WRITE PHASE 2/3", content=_body("verified"), latency="0.4"),
+        MockRule(match="WRITE PHASE 3/3", content=_body("removed"), latency="0.4"),
+    ])
+    with MockOpenAIServer(config) as server:
+        generator = _generator(server)
+        started = time.perf_counter()
+        script = generator.generate_script(CASE, phased=True)
+        elapsed = time.perf_counter() - started
+
+    print(f"  phased generation: {elapsed:.2f}s (serial would be ≥ 1.7s)")
+    assert elapsed < 1.5  # plan + slowest phase (phase 2 with its fix), not the sum of all calls
+    assert script.count("Start-Transcript") == 1 and script.count("IsInRole") == 1  # from the skeleton
+    assert script.rstrip().endswith("ReadKey('NoEcho,IncludeKeyDown')")
+    assert script.index("Start-Transcript") < script.index("$msiPath") < script.index("# PHASE 1")
+    order = [script.index(f"# PHASE {i}: {name}") for i, name in enumerate(["INSTALL", "VERIFY", "CLEANUP"], 1)]
+    assert order == sorted(order)
+    assert "'verified'" in script and "if ($svc) {" not in script
+    assert script.count("{") == script.count("}")
+
+
+class PlanClient:
+    """Answers the plan request with a fixed plan and records the prompt it was asked with"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.prompts = []
+
+    def generate_with_context(self, messages, **kwargs):
+        self.prompts.append(messages[1]["content"])
+        return json.dumps(self.plan)
+
+
+def test_stitch_with_and_without_skeleton():
+    """测试拼接：默认套用脚本骨架，关闭骨架时使用计划中的 setup/teardown"""
+    full_plan = {**PLAN, "setup": "Start-Transcript -Path $logFile\n" + PLAN["setup"],
+                 "teardown": "Stop-Transcript\n$null = $Host.UI.RawUI.ReadKey('NoEcho,IncludeKeyDown')"}
+    for skeleton, plan in ((True, PLAN), (False, full_plan)):
+        client = PlanClient(plan)
+        phased = PhasedGenerator(TestScriptGenerator(client, semantic_cache=None, skeleton=skeleton))
+        parsed = phased.plan(CASE)
+        for index, phase in enumerate(parsed.phases, 1):
+            phase.body = f"Write-Result -Msg 'phase {index}' -Success $true"
+        script = phased.stitch(CASE, parsed)
+
+        assert ("teardown" in client.prompts[0]) != skeleton  # the planner writes the boilerplate only without the skeleton
+        assert script.count("Start-Transcript") == 1 and script.count("Stop-Transcript") == 1
+        assert script.rstrip().endswith("ReadKey('NoEcho,IncludeKeyDown')")
+        assert ("#region Test phases" in script) == skeleton
+        if skeleton:
+            assert script == render_script(CASE["test_case_id"], extract_body(script))
+        else:
+            assert script.startswith("Start-Transcript") and "IsInRole" not in script
+
+
+def test_unparsable_plan_falls_back():
+    """测试计划无法解析（或格式错误）时回退为一次性生成"""
+    for plan in ("Sorry, no plan.", '{"phases": ["install", null]}'):
+        config = MockConfig(rules=[
+            MockRule(match="Plan a goal-oriented", content=plan),
+            MockRule(content="```powershell\nWrite-Host 'single pass'\n```"),
+        ])
+        with MockOpenAIServer(config) as server:
+            generator = _generator(server)
+            try:
+                PhasedGenerator(generator).plan(CASE)
+                assert False, f"plan accepted: {plan}"
+            except ValueError:
+                pass
+            script = generator.generate_script(CASE, phased=True)
+        assert script == render_script("case-phased", "Write-Host 'single pass'")
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 分阶段并行生成测试")
+    test_plan_and_seams()
+    test_phases_generated_in_parallel()
+    test_stitch_with_and_without_skeleton()
+    test_unparsable_plan_falls_back()
+    print("\n✅ 所有测试完成!")
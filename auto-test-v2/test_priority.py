@@ -0,0 +1,94 @@
+# 测试请求优先级通道
+# 1. 窗口已满时，交互式请求先于排在前面的后台请求获得并发槽
+# 2. 等待时间足够长的后台请求会被提升，不会饿死
+# 3. 后台请求为其他通道保留 RPM 配额
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.concurrency import AIMDController
+from core.priority import BACKGROUND, INTERACTIVE, NORMAL, current_lane, priority_lane
+from core.rate_limiter import RateLimiter
+
+
+def _queue_waiters(controller, lanes, order):
+    threads = []
+    for name, lane in lanes:
+        def wait(name=name, lane=lane):
+            controller.acquire(lane)
+            order.append(name)
+            controller.release()
+        t = threading.Thread(target=wait)
+        t.start()
+        threads.append(t)
+        time.sleep(0.05)  # queue them in this order
+    return threads
+
+
+def test_lane_context():
+    """测试通道上下文"""
+    assert current_lane() == NORMAL
+    with priority_lane(INTERACTIVE):
+        assert current_lane() == INTERACTIVE
+    assert current_lane() == NORMAL
+    try:
+        with priority_lane("urgent"):
+            pass
+        assert False, "unknown lane accepted"
+    except ValueError:
+        pass
+
+
+def test_interactive_goes_first():
+    """测试交互式请求插队"""
+    controller = AIMDController(max_limit=1, initial=1, aging=60)
+    controller.acquire()
+    order = []
+    threads = _queue_waiters(controller, [("batch-1", BACKGROUND), ("batch-2", BACKGROUND), ("gui", INTERACTIVE)], order)
+    controller.release()
+    for t in threads:
+        t.join(5)
+    assert order == ["gui", "batch-1", "batch-2"]
+
+
+def test_aging_prevents_starvation():
+    """测试等待足够久的后台请求被提升"""
+    controller = AIMDController(max_limit=1, initial=1, aging=0.1)
+    controller.acquire()
+    order = []
+    threads = _queue_waiters(controller, [("batch", BACKGROUND)], order)
+    time.sleep(0.4)  # waited more than two lanes' worth
+    threads += _queue_waiters(controller, [("gui", INTERACTIVE)], order)
+    controller.release()
+    for t in threads:
+        t.join(5)
+    assert order == ["batch", "gui"]
+
+
+def test_background_leaves_quota_reserve():
+    """测试后台请求保留配额"""
+    limiter = RateLimiter(rpm=10)
+    granted = 0
+    while limiter.try_acquire(lane=BACKGROUND)[0] == 0.0:
+        granted += 1
+    assert granted == 8  # stops at the 20% reserve (2 of 10 requests left)
+    assert limiter.try_acquire(lane=INTERACTIVE)[0] == 0.0
+    assert limiter.try_acquire(lane=NORMAL)[0] == 0.0
+
+    # A quota too small to keep a reserve still serves background requests
+    limiter = RateLimiter(rpm=1)
+    assert limiter.try_acquire(lane=BACKGROUND)[0] == 0.0
+    assert 59.0 < limiter.try_acquire(lane=BACKGROUND)[0] <= 60.0
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 请求优先级通道测试")
+    test_lane_context()
+    test_interactive_goes_first()
+    test_aging_prevents_starvation()
+    test_background_leaves_quota_reserve()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,51 @@
+# 测试 Token 预算裁剪
+# 1. 未超预算时原样返回
+# 2. 超预算时保留开头、结尾与 FAIL/ERROR 上下文
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.prompt_budget import count_tokens, content_budget, pack_lines, STAGE_BUDGETS
+
+
+def _log(n=2000, failures=(700, 1500)):
+    lines = [f"[{i:04d}] Step running: checking service state and registry values" for i in range(n)]
+    for i in failures:
+        lines[i] = f"[{i:04d}] ERROR: Service 'Spooler' failed to start (exit code 1053)"
+    lines[-1] = "TEST EXECUTION SUMMARY: Passed 5, Failed 2"
+    return "\n".join(lines)
+
+
+def test_small_content_is_untouched():
+    """测试预算内的内容不做修改"""
+    text = "line 1\nline 2"
+    assert pack_lines(text, 100) == text
+
+
+def test_packs_head_tail_and_failures():
+    """测试裁剪后保留开头、结尾与错误行，且不超预算"""
+    logs = _log()
+    packed = pack_lines(logs, 1500)
+
+    assert count_tokens(packed) <= 1500
+    assert packed.startswith("[0000]")
+    assert packed.endswith("TEST EXECUTION SUMMARY: Passed 5, Failed 2")
+    assert "[0700] ERROR" in packed and "[1500] ERROR" in packed
+    assert "[0699]" in packed and "[0701]" in packed  # context around failure
+    assert "lines omitted" in packed
+
+
+def test_content_budget_subtracts_fixed_prompt():
+    """测试固定 prompt 部分从阶段预算中扣除"""
+    fixed = "x" * 4000
+    assert content_budget("analyze", fixed) == STAGE_BUDGETS["analyze"] - count_tokens(fixed)
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - Prompt 预算测试")
+    test_small_content_is_untouched()
+    test_packs_head_tail_and_failures()
+    test_content_budget_subtracts_fixed_prompt()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,82 @@
+# 测试提示词前缀缓存
+# 1. 生成/审查/修正各阶段以逐字节相同的静态前缀开头，用例相关内容只出现在最后
+# 2. 通过本地 mock 服务验证第二个用例的请求命中前缀缓存，并在遥测中记录 cached_tokens
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config.prompts import SYSTEM_PROMPT
+from core.mock_server import MockConfig, MockOpenAIServer
+from core.router import Router, Target
+from core.telemetry import get_telemetry, prefix_cache_rate
+from core.test_generator import TestScriptGenerator
+
+CASE_A = {
+    "test_case_id": "case-prefix-a",
+    "test_scenario": "Install the agent MSI silently and verify the service",
+    "steps": [{"step": 1, "action": "msiexec /i agent.msi /qn", "expected": "Service AgentSvc is running"}]
+}
+CASE_B = {
+    "test_case_id": "case-prefix-b",
+    "test_scenario": "Uninstall the agent and verify cleanup",
+    "steps": [{"step": 1, "action": "msiexec /x agent.msi /qn", "expected": "AgentSvc is removed"}]
+}
+
+
+def _static_part(messages):
+    return messages[:-1]
+
+
+def test_stages_share_static_prefix():
+    """测试各阶段共享逐字节相同的静态前缀"""
+    generator = TestScriptGenerator(semantic_cache=None)
+    gen_a = generator.build_generation_messages(CASE_A)
+    gen_b = generator.build_generation_messages(CASE_B)
+    assert _static_part(gen_a) == _static_part(gen_b)
+    assert CASE_A["test_case_id"] not in str(_static_part(gen_a))
+    assert CASE_A["test_case_id"] in gen_a[-1]["content"]
+
+    review_a = generator.build_refinement_messages("Write-Host 'a'")
+    review_b = generator.build_refinement_messages("Write-Host 'b'")
+    assert _static_part(review_a) == _static_part(review_b)
+    correction = generator.build_correction_messages("Write-Host 'a'", ["[no_error_handling] missing try/catch"])
+    assert correction[:len(review_a)] == review_a  # correction extends the review request
+
+    for messages in (gen_a, review_a, correction):
+        assert messages[0] == {"role": "system", "content": SYSTEM_PROMPT}
+
+
+def test_prefix_cache_hits_recorded():
+    """测试前缀缓存命中被记录到遥测"""
+    with MockOpenAIServer(MockConfig(content="Write-Host 'ok'")) as server:
+        os.environ["AZURE_OPENAI_ENDPOINT"] = server.endpoint
+        from core.model_client import ModelClient
+        client = ModelClient(router=Router({}, default=Target("mock-prefix")))
+        client.cache = None
+        client.rate_limiter = None
+        client.hedge = None
+        generator = TestScriptGenerator(model_client=client, semantic_cache=None)
+
+        telemetry = get_telemetry()
+        mark = telemetry.mark()
+        generator.generate_script(CASE_A)
+        first = telemetry.records[mark]
+        generator.generate_script(CASE_B)
+        second = telemetry.records[mark + 1]
+
+        assert first.cached_tokens == 0
+        assert second.cached_tokens >= 1024
+        assert second.cached_tokens > 0.8 * second.prompt_tokens  # only the case itself is uncached
+        rate = prefix_cache_rate(telemetry.summary(mark)["generate"])
+        print(f"  prefix cache: {second.cached_tokens}/{second.prompt_tokens} tokens, stage rate {rate:.0%}")
+        assert rate > 0.4
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 提示词前缀缓存测试")
+    test_stages_share_static_prefix()
+    test_prefix_cache_hits_recorded()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,149 @@
+# 测试令牌桶限流器
+# 1. 配额内不等待
+# 2. 配额耗尽后计算等待时间
+# 3. 通过状态文件跨实例共享
+# 4. 按实际占用的 Token 退还；失败的请求退还全部预留，落败的对冲请求按 prompt 计费并占用并发窗口
+
+import os
+import sys
+import tempfile
+import threading
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.concurrency import get_concurrency_controller
+from core.hedging import HedgePolicy
+from core.rate_limiter import RateLimiter
+from core.router import Router, Target
+
+
+def test_burst_within_quota():
+    """测试配额内的请求不需要等待"""
+    limiter = RateLimiter(rpm=5, tpm=10000)
+    for _ in range(5):
+        assert limiter.try_acquire(1000) == (0.0, 1000)
+    # 第 6 个请求需要等待约 12 秒 (60 / 5)
+    wait, taken = limiter.try_acquire(1000)
+    assert taken == 0
+    assert 11.0 < wait <= 12.0
+
+
+def test_token_budget_and_settle():
+    """测试 Token 配额与实际用量退还"""
+    limiter = RateLimiter(tpm=6000)
+    assert limiter.try_acquire(5000)[0] == 0.0
+    assert limiter.try_acquire(5000)[0] > 0.0
+    limiter.settle(reserved=5000, used=1000)
+    assert limiter.try_acquire(5000)[0] == 0.0
+
+
+def test_settle_refunds_what_was_taken():
+    """测试超过可用配额的预留按实际占用量退还"""
+    limiter = RateLimiter(tpm=1000)
+    wait, taken = limiter.try_acquire(5000)
+    assert wait == 0.0 and taken == 1000  # capped at the whole quota
+    limiter.settle(taken, used=600)
+    assert 400 <= limiter.remaining()["tokens"] < 410  # not refilled to the full quota
+
+
+def _client(limiter, create, hedge=None):
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+    from core.model_client import ModelClient
+
+    target = Target("ratelimit-test")
+    router = Router({}, default=target)
+    for _ in range(5):
+        router.record("generate", target, 0.05, ok=True)
+    client = ModelClient(router=router, rate_limiter=limiter, hedge=hedge)
+    client.cache = None
+    client.single_flight = None
+    client.predictor = None
+    client._clients = {client.endpoint: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))}
+    return client
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class SlowStream:
+    """模拟流式响应：stalled 时阻塞直到 close()"""
+    def __init__(self, stalled):
+        self.stalled, self.closed = stalled, threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+    def __iter__(self):
+        if self.stalled:
+            self.closed.wait(5)
+            raise ConnectionError("stream closed")
+        delta = types.SimpleNamespace(content="ok")
+        yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+        yield types.SimpleNamespace(choices=[], usage=types.SimpleNamespace(
+            prompt_tokens=60, completion_tokens=40, total_tokens=100))
+
+
+def test_failed_call_refunds_reservation():
+    """测试失败的请求（普通与流式）退还全部预留"""
+    limiter = RateLimiter(tpm=100000)
+
+    def create(model, **kwargs):
+        raise BadRequest()
+
+    client = _client(limiter, create)
+    for call in (lambda: client.generate("system", "user", max_tokens=4000, use_cache=False),
+                 lambda: list(client.generate_stream("system", "user", max_tokens=4000, use_cache=False))):
+        try:
+            call()
+            assert False, "BadRequest not raised"
+        except BadRequest:
+            pass
+        assert limiter.remaining()["tokens"] > 99900
+
+
+def test_lost_hedges_settle_prompt_tokens():
+    """测试落败的对冲请求按 prompt 计费，并计入并发窗口"""
+    limiter = RateLimiter(tpm=20000)
+    controller = get_concurrency_controller("ratelimit-test")
+    opened = []
+    in_flight = []
+
+    def create(model, stream=False, **kwargs):
+        in_flight.append(controller.snapshot()["in_flight"])
+        opened.append(SlowStream(stalled=not opened))  # the first request stalls, the hedge answers
+        return opened[-1]
+
+    client = _client(limiter, create, hedge=HedgePolicy(min_samples=5, min_delay=0.05))
+    prompt = "x" * 8000  # about 2000 prompt tokens
+    assert client.generate("system", prompt, max_tokens=4000, use_cache=False) == "ok"
+    assert in_flight == [1, 2]  # the hedge holds a slot of its own
+    assert controller.snapshot()["in_flight"] == 0
+    # Each request reserved ~6000 tokens; the answer keeps its 100, the cancelled one its ~2000 prompt tokens
+    assert 17800 < limiter.remaining()["tokens"] < 18000
+
+
+def test_shared_state_file():
+    """测试两个限流器通过状态文件共享配额"""
+    with tempfile.TemporaryDirectory() as tmp:
+        state_file = str(Path(tmp) / "ratelimit.json")
+        worker_a = RateLimiter(rpm=2, state_file=state_file)
+        worker_b = RateLimiter(rpm=2, state_file=state_file)
+        assert worker_a.try_acquire()[0] == 0.0
+        assert worker_b.try_acquire()[0] == 0.0
+        assert worker_a.try_acquire()[0] > 0.0
+        assert worker_b.remaining()["requests"] < 1
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 限流器测试")
+    test_burst_within_quota()
+    test_token_budget_and_settle()
+    test_settle_refunds_what_was_taken()
+    test_failed_call_refunds_reservation()
+    test_lost_hedges_settle_prompt_tokens()
+    test_shared_state_file()
+    print("\n✅ 所有测试完成!")
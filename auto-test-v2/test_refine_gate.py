@@ -0,0 +1,84 @@
+# 测试校验门控的脚本精修
+# 1. 校验通过的脚本不再调用模型评审，整个用例只需一次模型调用
+# 2. 校验发现问题时只调用一次模型修正，问题作为上下文传入
+# 3. 暂停代码重复或暂停后还有代码时给出警告（暂停外层的右括号与注释不算代码）
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.router import Router, Target
+from core.script_skeleton import render_script
+from core.script_validator import ScriptValidator
+from core.test_generator import TestScriptGenerator
+
+CASE = {
+    "test_case_id": "case-gate",
+    "test_scenario": "Install the agent",
+    "steps": [{"step": 1, "action": "msiexec /i agent.msi /qn", "expected": "Installed"}]
+}
+
+GOOD_BODY = "try {\n    Get-Service -Name 'AgentService'\n} catch {\n    Write-Result -Msg 'Service query failed' -Success $false\n}"
+BAD_BODY = "Start-Process msiexec.exe -ArgumentList '/i agent.msi /qn+' -Wait\n" + GOOD_BODY
+
+
+class FakeClient:
+    def __init__(self, *replies):
+        self.router = Router({}, default=Target("gpt-4.1"))
+        self.replies = list(replies)
+        self.calls = []
+
+    def generate_with_context(self, messages, **kwargs):
+        self.calls.append((kwargs.get("stage"), messages))
+        return self.replies.pop(0)
+
+
+def test_valid_script_skips_refinement():
+    """测试校验通过时不调用模型"""
+    client = FakeClient(f"```powershell\n{GOOD_BODY}\n```")
+    generator = TestScriptGenerator(client, semantic_cache=None, manifest=None, skeleton=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "test_case-gate.ps1"
+        generator.generate_and_save_case(dict(CASE), output_path=str(output), refine=True)
+        assert output.read_text(encoding="utf-8-sig") == render_script("case-gate", GOOD_BODY).strip()
+    assert [stage for stage, _ in client.calls] == ["generate"]
+
+
+def test_findings_passed_to_single_fix():
+    """测试校验问题作为上下文，一次模型调用完成修正"""
+    client = FakeClient(f"```powershell\n{GOOD_BODY}\n```")
+    generator = TestScriptGenerator(client, semantic_cache=None, manifest=None, skeleton=True)
+    script = render_script("case-gate", BAD_BODY)
+    assert any("non_silent_install" in f for f in generator.review_findings(script))
+
+    refined = generator.refine_script(script)
+    assert refined == render_script("case-gate", GOOD_BODY)  # skeleton kept, phases replaced
+    assert len(client.calls) == 1
+    stage, messages = client.calls[0]
+    assert stage == "refine" and "non_silent_install" in messages[-1]["content"]
+    assert generator.review_findings(refined) == []
+
+
+def test_pause_checks():
+    """测试暂停代码的校验"""
+    script = render_script("case-gate", GOOD_BODY)
+    types = lambda s: {w["type"] for w in ScriptValidator().validate_script(s)["warnings"]}
+    assert not {"duplicate_pause", "code_after_pause"} & types(script)
+    assert "code_after_pause" in types(script + "Write-Host 'done'\n")
+    assert "duplicate_pause" in types(script + "$null = $Host.UI.RawUI.ReadKey('NoEcho,IncludeKeyDown')\n")
+
+    # A pause wrapped in an if block, followed by a comment, is still the last statement
+    pause = "$null = $Host.UI.RawUI.ReadKey('NoEcho,IncludeKeyDown')"
+    wrapped = script.replace(pause, "if ($Host.Name -eq 'ConsoleHost') {\n    " + pause + "\n}\n\n# end of test")
+    assert "code_after_pause" not in types(wrapped)
+    assert "code_after_pause" in types(wrapped + "\nWrite-Host 'done'\n")
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 校验门控精修测试")
+    test_valid_script_skips_refinement()
+    test_findings_passed_to_single_fix()
+    test_pause_checks()
+    print("\n✅ 所有测试完成!")
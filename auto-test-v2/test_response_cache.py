@@ -0,0 +1,102 @@
+# 测试 LLM 响应缓存
+# 1. 命中/未命中计数
+# 2. 绕过开关
+# 3. 容量淘汰
+# 4. 未超出容量时写入不扫描缓存目录
+
+import sys
+import tempfile
+import time
+import os
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.response_cache import ResponseCache
+
+
+MESSAGES = [
+    {"role": "system", "content": "You output only raw PowerShell."},
+    {"role": "user", "content": "Install the MSI silently"}
+]
+
+
+def test_cache_hit_and_miss():
+    """测试缓存命中与未命中"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(cache_dir=tmp)
+        key = ResponseCache.make_key("gpt-4.1", MESSAGES, 0.2, 16000)
+
+        assert cache.get(key) is None
+        cache.put(key, "Write-Host 'hello'")
+        assert cache.get(key) == "Write-Host 'hello'"
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+
+def test_key_covers_request_parameters():
+    """测试缓存键包含部署、消息、温度和 max_tokens"""
+    base = ResponseCache.make_key("gpt-4.1", MESSAGES, 0.2, 16000)
+    assert base == ResponseCache.make_key("gpt-4.1", list(MESSAGES), 0.2, 16000)
+    assert base != ResponseCache.make_key("gpt-4o", MESSAGES, 0.2, 16000)
+    assert base != ResponseCache.make_key("gpt-4.1", MESSAGES[:1], 0.2, 16000)
+    assert base != ResponseCache.make_key("gpt-4.1", MESSAGES, 0.3, 16000)
+    assert base != ResponseCache.make_key("gpt-4.1", MESSAGES, 0.2, 2000)
+
+
+def test_bypass_and_eviction():
+    """测试绕过开关与按容量/时间淘汰"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(cache_dir=tmp, bypass=True)
+        cache.put("aa01", "cached")
+        assert cache.get("aa01") is None
+
+        cache = ResponseCache(cache_dir=tmp, max_bytes=150)
+        cache.put("bb01", "x" * 60)
+        old = time.time() - 100
+        os.utime(cache._path("bb01"), (old, old))
+        cache.put("bb02", "y" * 60)
+        assert cache.get("bb01") is None
+        assert cache.get("bb02") == "y" * 60
+
+        cache = ResponseCache(cache_dir=tmp, max_age_seconds=10)
+        os.utime(cache._path("bb02"), (old, old))
+        assert cache.get("bb02") is None
+
+
+def test_put_scans_only_when_needed():
+    """测试按运行中的总大小判断是否需要扫描目录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(cache_dir=tmp, max_bytes=4000)
+        sweeps = []
+        evict = cache.evict
+        cache.evict = lambda: (sweeps.append(1), evict())
+        for i in range(20):
+            cache.put(f"cc{i:02d}", "z" * 100)
+        assert len(sweeps) == 1  # only the first write scans
+        cache.put("cc00", "z" * 100)  # overwriting does not grow the cache
+        assert len(sweeps) == 1
+
+        for i in range(20, 40):
+            cache.put(f"cc{i:02d}", "z" * 100)
+        assert len(sweeps) > 1
+        size = sum(p.stat().st_size for p in Path(tmp).glob("*/*.json"))
+        assert size <= 4000
+        assert cache.get("cc39") == "z" * 100
+
+        cache.sweep_interval = 0  # a due sweep also runs under the limit
+        cache.clear()
+        before = len(sweeps)
+        cache.put("dd01", "w")
+        assert len(sweeps) == before + 1
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 响应缓存测试")
+    test_cache_hit_and_miss()
+    test_key_covers_request_parameters()
+    test_bypass_and_eviction()
+    test_put_scans_only_when_needed()
+    print("\n✅ 所有测试完成!")
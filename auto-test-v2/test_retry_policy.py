@@ -0,0 +1,92 @@
+# 测试重试策略引擎
+# 1. 致命错误不重试
+# 2. 429 遵循 Retry-After
+# 3. 熔断器
+
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.retry import retry, RetryPolicy, CircuitBreaker, CircuitOpenError, get_circuit_breaker, retry_metrics
+
+
+class FakeAPIError(Exception):
+    """模拟 openai.APIStatusError"""
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+def _failing(errors):
+    calls = {"n": 0}
+
+    def fn():
+        calls["n"] += 1
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+    return fn, calls
+
+
+def test_fatal_errors_are_not_retried():
+    """测试认证/请求错误立即抛出"""
+    fn, calls = _failing([FakeAPIError(401), FakeAPIError(401)])
+    try:
+        retry(fn, policy=RetryPolicy(backoff=0.0), key="test-fatal")
+        assert False, "expected FakeAPIError"
+    except FakeAPIError:
+        pass
+    assert calls["n"] == 1
+
+
+def test_throttling_honours_retry_after():
+    """测试 429 时使用服务器返回的 Retry-After 作为最小等待"""
+    policy = RetryPolicy(backoff=0.0, jitter=False)
+    assert policy.delay(0, FakeAPIError(429, {"retry-after": "7"})) == 7.0
+    assert policy.delay(0, FakeAPIError(429, {"retry-after-ms": "1500"})) == 1.5
+
+    records = []
+    fn, calls = _failing([FakeAPIError(429, {"retry-after-ms": "1"}), FakeAPIError(503)])
+    assert retry(fn, policy=RetryPolicy(backoff=0.001), key="test-429", on_attempt=records.append) == "ok"
+    assert calls["n"] == 3
+    assert [r.error for r in records] == ["FakeAPIError", "FakeAPIError", None]
+    assert retry_metrics.snapshot()["test-429"]["attempts"] == 3
+
+
+def test_circuit_breaker_fails_fast():
+    """测试连续失败后熔断，超时后半开探测"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    try:
+        breaker.before_call("gpt-4.1")
+        assert False, "expected CircuitOpenError"
+    except CircuitOpenError:
+        pass
+
+    import time
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+    fn, calls = _failing([FakeAPIError(500)] * 6)
+    for _ in range(2):
+        try:
+            retry(fn, policy=RetryPolicy(attempts=3, backoff=0.0), key="test-breaker", breaker=True)
+        except (FakeAPIError, CircuitOpenError):
+            pass
+    assert get_circuit_breaker("test-breaker").state == "open"
+    assert calls["n"] == 5
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 重试策略测试")
+    test_fatal_errors_are_not_retried()
+    test_throttling_honours_retry_after()
+    test_circuit_breaker_fails_fast()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,158 @@
+# 测试多部署路由
+# 1. MODEL_ROUTES 解析
+# 2. 故障部署后移 / 恢复后重新排到前面 / 按延迟分流 / 并发记录与读取
+# 3. ModelClient 在限流时切换到下一个部署
+
+import os
+import sys
+import threading
+import time
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.router import Router, Target, parse_routes
+from core.retry import get_circuit_breaker
+
+
+class FakeAPIError(Exception):
+    """模拟 openai.APIStatusError"""
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(status_code=status_code, headers={})
+
+
+def test_parse_routes():
+    """测试路由配置解析"""
+    routes = parse_routes("evaluate=gpt-4.1-mini, gpt-4.1; generate=gpt-4.1@https://eu.example.com/")
+    assert [t.name for t in routes["evaluate"]] == ["gpt-4.1-mini", "gpt-4.1"]
+    assert routes["generate"][0].endpoint == "https://eu.example.com/"
+    assert routes["generate"][0].key == "gpt-4.1@eu.example.com"
+
+
+def test_failover_demotes_unhealthy_targets():
+    """测试错误率过高或熔断的部署被后移"""
+    mini, full = Target("router-mini"), Target("router-full")
+    router = Router({"evaluate": [mini, full]}, default=full, min_samples=2)
+    assert router.candidates("evaluate") == [mini, full]
+    assert router.candidates("analyze") == [full]
+
+    for _ in range(3):
+        router.record("evaluate", mini, 1.0, ok=False)
+    assert router.candidates("evaluate") == [full, mini]
+
+    breaker = get_circuit_breaker("router-open")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    router = Router({"generate": [Target("router-open"), full]}, default=full)
+    assert router.candidates("generate")[0] == full
+
+
+def test_recovered_target_is_promoted():
+    """测试故障部署恢复后重新排到前面"""
+    mini, full = Target("router-flaky"), Target("router-steady")
+    router = Router({"evaluate": [mini, full]}, default=full, min_samples=2, max_age=0.3)
+    for _ in range(3):
+        router.record("evaluate", mini, 1.0, ok=False)
+    assert router.candidates("evaluate") == [full, mini]
+
+    # Successes (e.g. calls that reached it after the backup failed) bring the error rate back down
+    for _ in range(3):
+        router.record("evaluate", mini, 1.0, ok=True)
+    assert router.candidates("evaluate") == [mini, full]
+
+    # Failures age out, so a demoted target is tried first again without any new calls
+    for _ in range(10):
+        router.record("evaluate", mini, 1.0, ok=False)
+    assert router.candidates("evaluate") == [full, mini]
+    time.sleep(0.4)
+    assert router.candidates("evaluate") == [mini, full]
+    assert router.snapshot()["evaluate/router-flaky"]["calls"] == 0
+    router.record("evaluate", mini, 1.0, ok=True)
+    assert router.candidates("evaluate") == [mini, full]
+
+
+def test_concurrent_record_and_read():
+    """测试多个线程同时记录与读取统计"""
+    a, b = Target("router-busy-a"), Target("router-busy-b")
+    router = Router({"generate": [a, b]}, default=a, strategy="balanced", max_age=0.01)
+    stop = threading.Event()
+    errors = []
+
+    def record(target):
+        while not stop.is_set():
+            router.record("generate", target, 0.1, ok=True)
+            router.record("generate", target, 0.2, ok=False)
+
+    def read():
+        try:
+            for _ in range(2000):
+                router.candidates("generate")
+                router.snapshot()
+        except Exception as e:
+            errors.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often enough to interleave with the readers' loops
+    try:
+        writers = [threading.Thread(target=record, args=(t,)) for t in (a, b, a)]
+        for t in writers:
+            t.start()
+        read()
+        stop.set()
+        for t in writers:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+
+
+def test_balanced_prefers_faster_target():
+    """测试 balanced 策略按 p50 延迟分流"""
+    slow, fast = Target("router-slow"), Target("router-fast")
+    router = Router({"generate": [slow, fast]}, default=slow, strategy="balanced")
+    for _ in range(10):
+        router.record("generate", slow, 30.0, ok=True)
+        router.record("generate", fast, 0.3, ok=True)
+    picks = [router.candidates("generate")[0] for _ in range(200)]
+    assert picks.count(fast) > 150
+    assert router.snapshot()["generate/router-slow"]["p95"] == 30.0
+
+
+def test_model_client_fails_over_on_throttling():
+    """测试 429 时立即切换到下一个部署"""
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+    from core.model_client import ModelClient
+
+    primary, backup = Target("router-primary"), Target("router-backup")
+    router = Router({"evaluate": [primary, backup]}, default=primary)
+    client = ModelClient(router=router)
+    client.cache = None
+    client.rate_limiter = None
+    calls = []
+
+    def create(model, **kwargs):
+        calls.append(model)
+        if model == "router-primary":
+            raise FakeAPIError(429)
+        message = types.SimpleNamespace(content="ok")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+    fake = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+    client._clients = {client.endpoint: fake}
+    assert client.generate("system", "user", stage="evaluate") == "ok"
+    assert calls == ["router-primary", "router-backup"]
+    assert router.stats("evaluate", primary).error_rate == 1.0
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 多部署路由测试")
+    test_parse_routes()
+    test_failover_demotes_unhealthy_targets()
+    test_recovered_target_is_promoted()
+    test_concurrent_record_and_read()
+    test_balanced_prefers_faster_target()
+    test_model_client_fails_over_on_throttling()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,105 @@
+# 测试脚本骨架
+# 1. 骨架生成的脚本总能通过 ScriptValidator 的完整性检查（管理员检查、Transcript、汇总）
+# 2. 模型重复输出的骨架代码被去掉；修正后的脚本只替换阶段主体，骨架保持不变
+# 3. 模型只生成阶段主体，输出 token 明显减少
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.mock_server import MockConfig, MockOpenAIServer, MockRule
+from core.router import Router, Target
+from core.script_skeleton import extract_body, render_script, replace_body, seam_issues, strip_boilerplate
+from core.script_validator import ScriptValidator
+from core.telemetry import get_telemetry
+from core.test_generator import TestScriptGenerator
+
+CASE = {
+    "test_case_id": "case-skeleton",
+    "test_scenario": "Install the agent and verify the service",
+    "steps": [{"step": 1, "action": "msiexec /i agent.msi /qn", "expected": "Service is running"}]
+}
+
+BODY = """$msiPath = "C:\\VMShare\\agent.msi"
+
+# ============================================================
+# PHASE 1: INSTALL
+# ============================================================
+try {
+    $proc = Start-Process msiexec.exe -ArgumentList "/i `"$msiPath`" /qn" -Wait -PassThru
+    Write-Result -Msg "MSI installed" -Success ($proc.ExitCode -eq 0)
+} catch {
+    Write-Result -Msg "MSI install - $($_.Exception.Message)" -Success $false
+}
+
+# ============================================================
+# PHASE 2: VERIFY
+# ============================================================
+$svc = Get-Service -Name "AgentService" -ErrorAction SilentlyContinue
+Write-Result -Msg "Service is running" -Success ($svc -and $svc.Status -eq "Running")"""
+
+COMPLETENESS = {"missing_admin_check", "no_transcript", "unclosed_transcript", "no_summary", "missing_stop_transcript"}
+
+
+def test_completeness_by_construction():
+    """测试骨架脚本的完整性检查"""
+    for body in ("", "Write-Host 'x'", BODY):
+        result = ScriptValidator().validate_script(render_script(CASE["test_case_id"], body))
+        assert not COMPLETENESS & {i["type"] for i in result["issues"]}, result["issues"]
+    script = render_script("case 1$x", BODY)
+    assert '"test_case_1_x_$timestamp.log"' in script  # ID made safe for the log file name
+    assert extract_body(script) == BODY
+    assert seam_issues(BODY) == []
+
+
+def test_strip_and_replace_body():
+    """测试去掉重复的骨架代码，修正时只替换阶段主体"""
+    repeated = "Start-Transcript -Path $logFile -Append\n$script:SuccessCount = 0\n" + BODY + \
+        "\nStop-Transcript\nWrite-Host \"Press any key to exit...\"\n$null = $Host.UI.RawUI.ReadKey('NoEcho,IncludeKeyDown')"
+    assert strip_boilerplate(repeated) == BODY
+
+    script = render_script(CASE["test_case_id"], BODY)
+    fixed_body = BODY.replace('"Running"', '"Stopped"')
+    assert replace_body(script, fixed_body) == render_script(CASE["test_case_id"], fixed_body)
+    assert replace_body(script, render_script("other", fixed_body)) == render_script(CASE["test_case_id"], fixed_body)
+    rewritten = "Start-Transcript -Path x\n" + fixed_body + "\nStop-Transcript"
+    assert replace_body(script, rewritten) == rewritten  # whole script without markers: kept as written
+
+
+def _generate(server, skeleton):
+    os.environ["AZURE_OPENAI_ENDPOINT"] = server.endpoint
+    from core.model_client import ModelClient
+    client = ModelClient(router=Router({}, default=Target("mock-skeleton")))
+    client.cache = None
+    client.hedge = None
+    client.predictor = None  # fixed max_tokens: a learned limit would cut the whole script short
+    generator = TestScriptGenerator(client, semantic_cache=None, skeleton=skeleton)
+    mark = get_telemetry().mark()
+    script = generator.generate_script(dict(CASE))
+    return script, get_telemetry().summary(mark)["total"]["completion_tokens"]
+
+
+def test_skeleton_cuts_output_tokens():
+    """测试只生成阶段主体时输出 token 减少"""
+    full_script = render_script(CASE["test_case_id"], BODY)
+    config = MockConfig(rules=[
+        MockRule(match="Write the test phases", content=f"```powershell\n{BODY}\n```"),
+        MockRule(content=f"```powershell\n{full_script}\n```"),
+    ])
+    with MockOpenAIServer(config) as server:
+        whole, whole_tokens = _generate(server, skeleton=False)
+        rendered, body_tokens = _generate(server, skeleton=True)
+
+    print(f"  output tokens: {whole_tokens} whole script → {body_tokens} with the skeleton")
+    assert rendered == full_script and whole == full_script.strip()
+    assert body_tokens < whole_tokens * 0.6
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 脚本骨架测试")
+    test_completeness_by_construction()
+    test_strip_and_replace_body()
+    test_skeleton_cuts_output_tokens()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,108 @@
+# 测试近似重复用例缓存
+# 1. 哈希向量 + 余弦相似度：几乎相同的用例相似度高，不同用例相似度低
+# 2. 按阈值决定 复用 / 草稿 / 未命中，并记录决策日志与命中率
+# 3. TestScriptGenerator 复用近似用例时不调用模型，草稿会附加到 prompt
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.semantic_cache import SemanticCache, SemanticMatch, cosine, vectorize
+from core.test_generator import TestScriptGenerator
+
+
+def _case(case_id, scenario, *actions):
+    return {
+        "test_case_id": case_id,
+        "test_scenario": scenario,
+        "steps": [{"step": i + 1, "action": a, "expected": ""} for i, a in enumerate(actions)]
+    }
+
+
+BASE = _case("case1test", "Check agent installation",
+             "Install the CMD agent MSI with SVCENV=Test",
+             "Open services.msc and verify the extension service is Running",
+             "Check C:\\ProgramData\\Microsoft\\CMDExtension\\Logs for errors")
+NEAR = _case("case1testclient", "Check agent installation",
+             "Install the CMD agent MSI with SVCENV=Test",
+             "Open services.msc and verify the extension service is Running",
+             "Check C:\\ProgramData\\Microsoft\\CMDExtension\\Logs for errors.")
+OTHER = _case("case9test", "Uninstall cleans the registry",
+              "Uninstall the agent from Programs and Features",
+              "Verify HKLM\\SOFTWARE\\Microsoft\\CloudManagementDesktop is removed")
+
+
+class FakeClient:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_with_context(self, messages, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        return "Write-Host 'generated'"
+
+
+def test_similarity():
+    """测试相似度计算"""
+    generator = TestScriptGenerator(semantic_cache=None)
+    base = vectorize(generator.similarity_text(BASE))
+    assert abs(cosine(base, base) - 1.0) < 1e-9
+    assert cosine(base, vectorize(generator.similarity_text(NEAR))) > 0.97
+    assert cosine(base, vectorize(generator.similarity_text(OTHER))) < 0.5
+
+
+def test_decisions_and_hit_rate():
+    """测试阈值决策与命中率日志"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SemanticCache(tmp, reuse_threshold=0.97, draft_threshold=0.5)
+        assert cache.lookup("a", "install agent and verify service").decision == "miss"
+        cache.add("a", "install agent and verify service", "script a")
+        assert cache.lookup("a", "install agent and verify service").decision == "miss"  # own entry ignored
+        match = cache.lookup("b", "install agent and verify service")
+        assert (match.decision, match.source_id, match.script) == ("reuse", "a", "script a")
+        assert cache.lookup("c", "install agent and verify the service status").decision == "draft"
+
+        stats = cache.stats()
+        assert (stats["reuse"], stats["draft"], stats["miss"]) == (1, 1, 2)
+        assert stats["hit_rate"] == 0.5
+        logged = [json.loads(l) for l in (Path(tmp) / "decisions.jsonl").read_text().splitlines()]
+        assert logged[-1]["decision"] == "draft" and logged[-1]["draft_threshold"] == 0.5
+        # A fresh process sees the persisted index
+        assert SemanticCache(tmp).lookup("d", "install agent and verify service").decision == "reuse"
+
+
+def test_generator_reuses_and_drafts():
+    """测试生成器复用与草稿"""
+    with tempfile.TemporaryDirectory() as tmp:
+        client = FakeClient()
+        generator = TestScriptGenerator(client, semantic_cache=SemanticCache(tmp, draft_threshold=0.3))
+        generator.generate_script(BASE)
+        assert len(client.prompts) == 1
+
+        # Near-duplicate: reused without a model call, with the case ID swapped
+        generator.semantic_cache.add("case1test", generator.similarity_text(BASE),
+                                     "Start-Transcript \"case1test.log\"")
+        script = generator.generate_script(NEAR)
+        assert len(client.prompts) == 1
+        assert script == "Start-Transcript \"case1testclient.log\""
+
+        # Whole IDs only: an ID that is a prefix of another ID is not rewritten inside it
+        match = SemanticMatch("case1", 0.99, "reuse",
+                              "$log = \"test_case1_$ts.log\"\n# see case10, case12 and case1.5; case1 done")
+        assert match.adapt("case7") == "$log = \"test_case7_$ts.log\"\n# see case10, case12 and case1.5; case7 done"
+
+        # Somewhat similar: generated, with the cached script offered as a draft
+        generator.generate_script(_case("case2test", "Check agent installation",
+                                        "Install the CMD agent MSI with SVCENV=Prod"))
+        assert len(client.prompts) == 2
+        assert "DRAFT FROM A SIMILAR TEST CASE" in client.prompts[-1]
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 近似重复用例缓存测试")
+    test_similarity()
+    test_decisions_and_hit_rate()
+    test_generator_reuses_and_drafts()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,111 @@
+# 测试相同请求合并
+# 1. 并发的相同请求只调用一次模型
+# 2. 跨进程锁文件：等待锁的一方复用已发布的结果
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.singleflight import SingleFlight
+from core.router import Router, Target
+
+
+def test_concurrent_identical_requests_share_one_call():
+    """测试 ModelClient 合并并发的相同请求"""
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+    from core.model_client import ModelClient
+
+    client = ModelClient(router=Router({}, default=Target("singleflight-test")))
+    client.cache = None
+    client.rate_limiter = None
+    client.hedge = None
+    client.single_flight = SingleFlight()
+    calls = []
+
+    def create(model, messages, **kwargs):
+        calls.append(messages[-1]["content"])
+        time.sleep(0.2)
+        message = types.SimpleNamespace(content=f"answer to {messages[-1]['content']}")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+    client._clients = {client.endpoint: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))}
+
+    results = []
+    threads = [threading.Thread(target=lambda p=p: results.append(client.generate("system", p)))
+               for p in ["case_a"] * 4 + ["case_b"]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(calls) == ["case_a", "case_b"]
+    assert results.count("answer to case_a") == 4
+    assert client.single_flight.coalesced == 3
+
+
+def test_errors_are_shared():
+    """测试领头调用失败时等待者收到同一异常"""
+    flight = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    def follower():
+        started.wait()
+        try:
+            flight.do("k", fail)
+        except ValueError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=follower)
+    t.start()
+    try:
+        flight.do("k", fail)
+    except ValueError as e:
+        errors.append(e)
+    t.join()
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_cross_process_lock_file():
+    """测试跨进程锁文件：等待者复用领头者发布的结果"""
+    with tempfile.TemporaryDirectory() as tmp:
+        process_a, process_b = SingleFlight(tmp), SingleFlight(tmp)
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append("a")
+            started.set()
+            time.sleep(0.2)
+            return "shared result"
+
+        results = {}
+        t = threading.Thread(target=lambda: results.setdefault("a", process_a.do("key", slow)))
+        t.start()
+        started.wait()
+        results["b"] = process_b.do("key", lambda: calls.append("b") or "second call")
+        t.join()
+
+        assert calls == ["a"]
+        assert results["a"] == ("shared result", False)
+        assert results["b"] == ("shared result", True)
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 相同请求合并测试")
+    test_concurrent_identical_requests_share_one_call()
+    test_errors_are_shared()
+    test_cross_process_lock_file()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,50 @@
+# 测试调用遥测
+# 按阶段汇总 Token / 延迟 / 重试，并写入 JSONL
+
+import json
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.telemetry import CallRecord, Telemetry, usage_fields
+
+
+def test_usage_fields_reads_cached_tokens():
+    """测试从 usage 中提取缓存命中的 prompt token"""
+    usage = types.SimpleNamespace(
+        prompt_tokens=1200, completion_tokens=300,
+        prompt_tokens_details=types.SimpleNamespace(cached_tokens=1024)
+    )
+    assert usage_fields(usage) == {"prompt_tokens": 1200, "completion_tokens": 300, "cached_tokens": 1024}
+    assert usage_fields(None) == {}
+
+
+def test_summary_by_stage_and_sink():
+    """测试按阶段汇总与 JSONL 输出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = Path(tmp) / "telemetry.jsonl"
+        telemetry = Telemetry(str(sink))
+        telemetry.record(CallRecord("generate", "gpt-4.1", 12.0, prompt_tokens=2000, completion_tokens=3000, retries=1))
+        mark = telemetry.mark()
+        telemetry.record(CallRecord("refine", "gpt-4.1", 4.0, prompt_tokens=3500, completion_tokens=50))
+        telemetry.record(CallRecord("refine", "gpt-4.1", 0.0, cache_hit=True))
+
+        summary = telemetry.summary()
+        assert summary["generate"]["retries"] == 1
+        assert summary["refine"]["calls"] == 2 and summary["refine"]["cache_hits"] == 1
+        assert summary["total"]["prompt_tokens"] == 5500
+        assert "generate" not in telemetry.summary(since=mark)
+
+        lines = sink.read_text(encoding="utf-8").splitlines()
+        assert [json.loads(l)["stage"] for l in lines] == ["generate", "refine", "refine"]
+        assert telemetry.format_summary().splitlines()[2].split()[0] == "generate"
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - 调用遥测测试")
+    test_usage_fields_reads_cached_tokens()
+    test_summary_by_stage_and_sink()
+    print("\n✅ 所有测试完成!")
@@ -0,0 +1,114 @@
+# 测试 max_tokens 自适应预测
+# 1. 无历史时按阶段先验（步骤数）预测，有历史后按观测输出长度校准，并加安全余量
+# 2. 输出因 max_tokens 被截断时自动发起续写调用并拼接结果
+# 3. 流式输出同样自动续写
+
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.router import Router, Target
+from core.token_predictor import CONTINUE_PROMPT, TokenPredictor
+
+
+def _client(predictor):
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+    from core.model_client import ModelClient
+
+    client = ModelClient(router=Router({}, default=Target("predictor-test")))
+    client.cache = None
+    client.rate_limiter = None
+    client.hedge = None
+    client.single_flight = None
+    client.predictor = predictor
+    return client
+
+
+def _install(client, create):
+    client._clients = {client.endpoint: types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))}
+
+
+def test_prediction_from_prior_and_history():
+    """测试先验预测与历史校准"""
+    with tempfile.TemporaryDirectory() as tmp:
+        history = Path(tmp) / "history.json"
+        predictor = TokenPredictor(str(history), margin=1.25, min_samples=3)
+        cold = predictor.predict("generate", size_hint=10)
+        assert cold == int((2500 + 300 * 10) * 1.25)
+        assert cold < 16000 / 2
+
+        # Scripts come out at about half the prior: predictions shrink accordingly
+        for steps in (4, 8, 12):
+            predictor.observe("generate", steps, int(predictor.prior("generate", steps) * 0.5))
+        assert predictor.predict("generate", size_hint=10) == int(5500 * 0.5 * 1.25)
+
+        # History persists across processes; limits stay within floor/ceiling
+        reloaded = TokenPredictor(str(history), min_samples=3)
+        assert reloaded.predict("generate", size_hint=10) == predictor.predict("generate", size_hint=10)
+        assert reloaded.predict("evaluate") >= reloaded.floor
+        assert reloaded.predict("generate", size_hint=500) == reloaded.ceiling
+
+
+def test_truncated_output_is_continued():
+    """测试截断后自动续写"""
+    predictor = TokenPredictor(None)
+    client = _client(predictor)
+    requests = []
+    replies = [("```powershell\nWrite-Host 'part one'\n", "length"), ("Write-Host 'part two'\n```", "stop")]
+
+    def create(model, messages, max_tokens, **kwargs):
+        requests.append((messages, max_tokens))
+        content, finish_reason = replies.pop(0)
+        choice = types.SimpleNamespace(message=types.SimpleNamespace(content=content), finish_reason=finish_reason)
+        usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=100, total_tokens=110,
+                                      prompt_tokens_details=None)
+        return types.SimpleNamespace(choices=[choice], usage=usage)
+
+    _install(client, create)
+    result = client.generate("system", "user", size_hint=3, use_cache=False)
+    assert result == "Write-Host 'part one'\nWrite-Host 'part two'"
+    assert len(requests) == 2
+    assert requests[0][1] == int((2500 + 300 * 3) * 1.25)  # predicted, not 16000
+    assert requests[1][1] == requests[0][1]
+    continuation = requests[1][0]
+    assert continuation[-2]["role"] == "assistant" and "part one" in continuation[-2]["content"]
+    assert continuation[-1]["content"] == CONTINUE_PROMPT
+    assert predictor._history["generate"] == [round(200 / 3400, 4)]  # both parts observed
+
+    # An explicit max_tokens is respected and not learned from
+    replies.append(("done", "stop"))
+    client.generate("system", "user", max_tokens=123, stage="evaluate", use_cache=False)
+    assert requests[-1][1] == 123
+    assert "evaluate" not in predictor._history
+
+
+def test_stream_is_continued():
+    """测试流式输出自动续写"""
+    client = _client(TokenPredictor(None))
+    replies = [(["Write-", "Host 'a'"], "length"), (["\nWrite-Host 'b'"], "stop")]
+
+    def create(model, messages, max_tokens, stream=False, **kwargs):
+        pieces, finish_reason = replies.pop(0)
+        chunks = [types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(
+            delta=types.SimpleNamespace(content=piece), finish_reason=None)]) for piece in pieces]
+        chunks.append(types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(
+            delta=types.SimpleNamespace(content=None), finish_reason=finish_reason)]))
+        return iter(chunks)
+
+    _install(client, create)
+    chunks = list(client.generate_stream("system", "user", use_cache=False))
+    assert "".join(chunks) == "Write-Host 'a'\nWrite-Host 'b'"
+    assert not replies
+
+
+if __name__ == '__main__':
+    print("\n🧪 Auto-Test V2 - max_tokens 自适应预测测试")
+    test_prediction_from_prior_and_history()
+    test_truncated_output_is_continued()
+    test_stream_is_continued()
+    print("\n✅ 所有测试完成!")
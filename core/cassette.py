@@ -0,0 +1,251 @@
+"""
+Record/Replay Cassettes
+录制模型请求/响应（含 usage 与延迟）到 cassette 文件，并可离线确定性回放
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+MODES = ("record", "replay")
+
+
+class CassetteMissError(RuntimeError):
+    """Replay found no recorded interaction for a request"""
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Stable hash of the request arguments (model, messages, temperature, stream)
+
+    max_tokens is left out: it is predicted from history and would otherwise
+    drift between recording and replay.
+    """
+    relevant = {k: request.get(k) for k in ("model", "messages", "temperature", "stream")}
+    payload = json.dumps(relevant, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _to_object(value):
+    """Turn recorded JSON back into attribute-style objects like the OpenAI response types"""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _to_object(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_to_object(v) for v in value]
+    return value
+
+
+def _dump(obj) -> Dict[str, Any]:
+    return obj.model_dump(mode="json") if hasattr(obj, "model_dump") else obj
+
+
+class Cassette:
+    """A JSON file of recorded chat-completion interactions
+
+    In record mode every completed request is appended and the file is
+    rewritten atomically. In replay mode requests are matched by
+    ``request_key``; identical requests are served in recorded order (the last
+    recording repeats once they run out). `latency_scale` re-injects the
+    recorded latency: 0 replays instantly, 1 reproduces the original timing.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency_scale: float = 0.0):
+        """
+        Args:
+            path: Cassette file
+            mode: "record" (start a new recording) or "replay"
+            latency_scale: Multiplier applied to recorded latency during replay
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}' (expected one of {', '.join(MODES)})")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.interactions: List[Dict[str, Any]] = []
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if mode == "replay":
+            if not self.path.exists():
+                raise FileNotFoundError(f"Cassette not found: {self.path}")
+            self.interactions = json.loads(self.path.read_text(encoding="utf-8"))["interactions"]
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        """MODEL_CASSETTE=<file> with MODEL_CASSETTE_MODE=record|replay; None when unset"""
+        path = os.getenv("MODEL_CASSETTE")
+        if not path:
+            return None
+        return cls(
+            path,
+            mode=os.getenv("MODEL_CASSETTE_MODE", "replay"),
+            latency_scale=float(os.getenv("MODEL_CASSETTE_LATENCY", "0"))
+        )
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    # ---------------------------------------------------------------- record
+
+    def record(self, request: Dict[str, Any], latency: float, response: Dict[str, Any] = None,
+               chunks: List[Dict[str, Any]] = None, first_token: float = None):
+        """Append one completed interaction and save the cassette"""
+        body = response or (chunks[-1] if chunks else {})
+        interaction = {
+            "key": request_key(request),
+            "request": {k: v for k, v in request.items() if k != "stream_options"},
+            "latency": round(latency, 4),
+            "usage": body.get("usage"),
+        }
+        if chunks is not None:
+            interaction["first_token"] = round(first_token if first_token is not None else latency, 4)
+            interaction["chunks"] = chunks
+        else:
+            interaction["response"] = response
+        with self._lock:
+            self.interactions.append(interaction)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_text(json.dumps({"version": 1, "interactions": self.interactions},
+                                      indent=1, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+    # ---------------------------------------------------------------- replay
+
+    def lookup(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Next recorded interaction for this request"""
+        key = request_key(request)
+        with self._lock:
+            matches = [i for i in self.interactions if i["key"] == key]
+            if not matches:
+                raise CassetteMissError(
+                    f"No recorded response in {self.path} for model={request.get('model')} "
+                    f"stream={bool(request.get('stream'))} (key {key[:12]})"
+                )
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return matches[min(index, len(matches) - 1)]
+
+    def wrap(self, client):
+        """Client whose chat.completions.create records (record mode) or replays (replay mode)"""
+        return SimpleNamespace(chat=SimpleNamespace(completions=_Completions(self, client)))
+
+    def wrap_async(self, client):
+        """Async counterpart of wrap() for AsyncAzureOpenAI clients"""
+        return SimpleNamespace(chat=SimpleNamespace(completions=_AsyncCompletions(self, client)))
+
+
+class _RecordingStream:
+    """Pass chunks through while collecting them; only fully consumed streams are recorded"""
+
+    def __init__(self, cassette: Cassette, request: Dict[str, Any], stream, started: float):
+        self.cassette = cassette
+        self.request = request
+        self.stream = stream
+        self.started = started
+
+    def __iter__(self):
+        chunks = []
+        first_token = None
+        for chunk in self.stream:
+            if first_token is None and chunk.choices and chunk.choices[0].delta.content:
+                first_token = time.perf_counter() - self.started
+            chunks.append(_dump(chunk))
+            yield chunk
+        self.cassette.record(self.request, time.perf_counter() - self.started, chunks=chunks, first_token=first_token)
+
+    def close(self):
+        self.stream.close()
+
+
+class _ReplayStream:
+    """Replay recorded chunks, optionally paced like the original stream"""
+
+    def __init__(self, interaction: Dict[str, Any], latency_scale: float):
+        self.interaction = interaction
+        self.latency_scale = latency_scale
+        self.closed = False
+
+    def __iter__(self):
+        chunks = self.interaction["chunks"]
+        scale = self.latency_scale
+        if scale:
+            time.sleep(self.interaction["first_token"] * scale)
+        gap = (self.interaction["latency"] - self.interaction["first_token"]) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if self.closed:
+                raise ConnectionError("stream closed")
+            if scale and i > 0:
+                time.sleep(gap * scale)
+            yield _to_object(chunk)
+
+    def close(self):
+        self.closed = True
+
+
+class _Completions:
+    def __init__(self, cassette: Cassette, client):
+        self.cassette = cassette
+        self.client = client
+
+    def create(self, **request):
+        if self.cassette.replaying:
+            interaction = self.cassette.lookup(request)
+            if "chunks" in interaction:
+                return _ReplayStream(interaction, self.cassette.latency_scale)
+            if self.cassette.latency_scale:
+                time.sleep(interaction["latency"] * self.cassette.latency_scale)
+            return _to_object(interaction["response"])
+
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(**request)
+        if request.get("stream"):
+            return _RecordingStream(self.cassette, request, response, started)
+        self.cassette.record(request, time.perf_counter() - started, response=_dump(response))
+        return response
+
+
+class _AsyncCompletions:
+    def __init__(self, cassette: Cassette, client):
+        self.cassette = cassette
+        self.client = client
+
+    async def create(self, **request):
+        if self.cassette.replaying:
+            interaction = self.cassette.lookup(request)
+            if self.cassette.latency_scale:
+                await asyncio.sleep(interaction["latency"] * self.cassette.latency_scale)
+            return _to_object(interaction["response"])
+
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(**request)
+        self.cassette.record(request, time.perf_counter() - started, response=_dump(response))
+        return response
+
+
+_cassette: Optional[Cassette] = None
+_cassette_loaded = False
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Process-wide cassette from MODEL_CASSETTE* (None when record/replay is off)"""
+    global _cassette, _cassette_loaded
+    with _cassette_lock:
+        if not _cassette_loaded:
+            _cassette = Cassette.from_env()
+            _cassette_loaded = True
+        return _cassette
+
+
+def set_cassette(cassette: Optional[Cassette]):
+    """Install a cassette for this process (None: record/replay off)"""
+    global _cassette, _cassette_loaded
+    with _cassette_lock:
+        _cassette = cassette
+        _cassette_loaded = True
@@ -1,61 +1,302 @@
+import asyncio
 import os
-from openai import AzureOpenAI
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
-from .retry import retry
+import time
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+from .retry import retry, async_retry, CircuitOpenError, DEFAULT_POLICY
+from .router import Router, Target, get_router
+from .cassette import get_cassette
+from .response_cache import ResponseCache
+from .rate_limiter import RateLimiter, estimate_tokens, get_rate_limiter
+from .telemetry import CallRecord, get_telemetry, usage_fields
+
+if TYPE_CHECKING:  # openai is imported lazily, on first use
+    from openai import AsyncAzureOpenAI, AzureOpenAI
+
+
+def _strip_code_fences(content: str) -> str:
+    content = content.strip()
+    if content.startswith("```"):
+        lines = content.splitlines()
+        if len(lines) >= 2 and lines[-1].startswith("```"):
+            return "\n".join(lines[1:-1]).strip()
+    return content
+
+
+def _record_call(deployment: str, stage: str, started: float, usage=None, attempts: list | None = None, **extra):
+    get_telemetry().record(CallRecord(
+        stage=stage,
+        deployment=deployment,
+        latency=time.perf_counter() - started,
+        retries=max(0, len(attempts or []) - 1),
+        **usage_fields(usage),
+        **extra
+    ))
+
+
+REPLAY_ENDPOINT = "https://cassette-replay.invalid/"
+TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+_token_provider = None
+
+
+def _token_provider_for(endpoint: str):
+    # local mock server: placeholder token, no Azure login needed and no real token sent to localhost
+    if urlparse(endpoint).hostname in LOCAL_HOSTS:
+        return lambda: "local-mock-token"
+    global _token_provider
+    if _token_provider is None:
+        # azure.identity is imported on first real request so --help and replays stay fast
+        from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+        _token_provider = get_bearer_token_provider(DefaultAzureCredential(), TOKEN_SCOPE)
+    return _token_provider
+
+
+def _can_fail_over(exc: BaseException) -> bool:
+    return isinstance(exc, CircuitOpenError) or DEFAULT_POLICY.is_retryable(exc)
+
+
+def _router_for(router: Router | None, deployment: str | None) -> Router:
+    if router is not None:
+        return router
+    return Router.from_env(deployment) if deployment else get_router()
+
+
+def _failover_order(router: Router, stage: str):
+    """Yield (target, is_last) in router order; a failing non-last target hands over after one attempt."""
+    candidates = router.candidates(stage)
+    for i, target in enumerate(candidates):
+        yield target, i == len(candidates) - 1
+
 
 class ModelClient:
-    def __init__(self):
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
-        self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4.1")
+    def __init__(self, cache: ResponseCache | None = None, rate_limiter: RateLimiter | None = None,
+                 deployment: str | None = None, router: Router | None = None):
+        # MODEL_CASSETTE: record calls to / replay them from a cassette file (replay needs no endpoint)
+        self.cassette = get_cassette()
+        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or (REPLAY_ENDPOINT if self._replaying else None)
+        self.api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
         
-        if not endpoint:
+        if not self.endpoint:
             raise RuntimeError("AZURE_OPENAI_ENDPOINT environment variable missing")
         
-        # 使用无密钥认证（Azure AD Token）
-        token_provider = get_bearer_token_provider(
-            DefaultAzureCredential(),
-            "https://cognitiveservices.azure.com/.default"
-        )
-        self._client = AzureOpenAI(
-            azure_endpoint=endpoint,
-            api_version=api_version,
-            azure_ad_token_provider=token_provider
-        )
-
-    def chat(self, system: str, user: str, max_tokens: int = 300, temperature: float = 0.0) -> str:
-        def _call():
-            resp = self._client.chat.completions.create(
-                model=self.deployment,
-                messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
-                temperature=temperature,
-                max_tokens=max_tokens
+        # Stage → deployment routing (MODEL_ROUTES); a pinned deployment disables it
+        self.router = _router_for(router, deployment)
+        self.deployment = self.router.default.name
+        
+        # 使用无密钥认证（Azure AD Token）；客户端在首次请求时创建
+        self._clients = {}
+        # Optional on-disk response cache (MODEL_CACHE=1)
+        self.cache = cache if cache is not None else ResponseCache.from_env()
+        # Process-wide RPM/TPM limiter (MODEL_RPM / MODEL_TPM)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+
+    def _client_for(self, target: Target) -> "AzureOpenAI":
+        endpoint = target.endpoint or self.endpoint
+        if endpoint not in self._clients:
+            from openai import AzureOpenAI  # ~0.7s import; only paid when a request is actually sent
+            self._clients[endpoint] = AzureOpenAI(
+                azure_endpoint=endpoint,
+                api_version=self.api_version,
+                azure_ad_token_provider=_token_provider_for(endpoint),
+                max_retries=0  # retries are handled by core.retry
             )
-            content = resp.choices[0].message.content.strip()
-            if content.startswith("```"):
-                lines = content.splitlines()
-                if len(lines) >= 2 and lines[-1].startswith("```"):
-                    return "\n".join(lines[1:-1]).strip()
-            return content
-        return retry(_call)
-
-    def chat_messages(self, messages, max_tokens: int = 300, temperature: float = 0.0) -> str:
+        return self._clients[endpoint]
+
+    @property
+    def _replaying(self) -> bool:
+        return self.cassette is not None and self.cassette.replaying
+
+    def _completions(self, target: Target):
+        if self.cassette is None:
+            return self._client_for(target).chat.completions
+        if self._replaying and (target.endpoint or self.endpoint) not in self._clients:
+            return self.cassette.wrap(None).chat.completions  # replay never touches the real client
+        return self.cassette.wrap(self._client_for(target)).chat.completions
+
+    def _complete(self, messages, max_tokens: int, temperature: float, use_cache: bool = True,
+                  stage: str = "chat") -> str:
+        started = time.perf_counter()
+        primary = self.router.targets(stage)[0].name
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = ResponseCache.make_key(primary, messages, temperature, max_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                _record_call(primary, stage, started, cache_hit=True)
+                return cached
+        attempts = []
+        last = {}
+
+        def _call(target: Target):
+            reserved = estimate_tokens(messages, max_tokens)
+            taken = self.rate_limiter.acquire(reserved) if self.rate_limiter is not None else 0
+            try:
+                resp = self._completions(target).create(
+                    model=target.name,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            except BaseException:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.settle(taken, 0)  # a failed attempt hands its whole reservation back
+                raise
+            if self.rate_limiter is not None and resp.usage is not None:
+                self.rate_limiter.settle(taken, resp.usage.total_tokens)
+            last["usage"] = resp.usage
+            return _strip_code_fences(resp.choices[0].message.content)
+        for target, is_last in _failover_order(self.router, stage):
+            tried = time.perf_counter()
+            try:
+                content = retry(lambda: _call(target), attempts=None if is_last else 1, key=target.key,
+                                breaker=True, on_attempt=attempts.append)
+                break
+            except Exception as e:
+                if _can_fail_over(e):
+                    self.router.record(stage, target, time.perf_counter() - tried, ok=False)
+                if is_last or not _can_fail_over(e):
+                    _record_call(target.name, stage, started, attempts=attempts, error=type(e).__name__,
+                                 max_tokens=max_tokens)
+                    raise
+                print(f"⚠️ {target.key} unavailable ({type(e).__name__}), failing over")
+        self.router.record(stage, target, time.perf_counter() - tried, ok=True)
+        _record_call(target.name, stage, started, last.get("usage"), attempts, max_tokens=max_tokens)
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+        return content
+
+    def chat(self, system: str, user: str, max_tokens: int = 300, temperature: float = 0.0, use_cache: bool = True,
+             stage: str = "chat") -> str:
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+        return self._complete(messages, max_tokens, temperature, use_cache, stage)
+
+    def chat_messages(self, messages, max_tokens: int = 300, temperature: float = 0.0, use_cache: bool = True,
+                      stage: str = "chat") -> str:
         """Generic chat interface allowing rich content (e.g., image_url).
 
         messages: list of dicts, each like {"role": "user"|"system"|"assistant", "content": <str|list>}
         If any content is a list (multi-part), it is passed through directly.
+        use_cache: set False to bypass the response cache for this call.
+        stage: label recorded in core.telemetry (e.g. "vision", "action").
         """
-        def _call():
-            resp = self._client.chat.completions.create(
-                model=self.deployment,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
+        return self._complete(messages, max_tokens, temperature, use_cache, stage)
+
+
+class AsyncModelClient:
+    """Async mirror of ModelClient; at most max_concurrency requests are in flight at once."""
+
+    def __init__(self, max_concurrency: int | None = None, cache: ResponseCache | None = None,
+                 rate_limiter: RateLimiter | None = None, deployment: str | None = None,
+                 router: Router | None = None):
+        # MODEL_CASSETTE: record calls to / replay them from a cassette file (replay needs no endpoint)
+        self.cassette = get_cassette()
+        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or (REPLAY_ENDPOINT if self._replaying else None)
+        self.api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
+
+        if not self.endpoint:
+            raise RuntimeError("AZURE_OPENAI_ENDPOINT environment variable missing")
+
+        self.router = _router_for(router, deployment)
+        self.deployment = self.router.default.name
+
+        self._clients = {}
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("MODEL_MAX_CONCURRENCY", "8"))
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.cache = cache if cache is not None else ResponseCache.from_env()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+
+    def _client_for(self, target: Target) -> "AsyncAzureOpenAI":
+        endpoint = target.endpoint or self.endpoint
+        if endpoint not in self._clients:
+            from openai import AsyncAzureOpenAI
+            self._clients[endpoint] = AsyncAzureOpenAI(
+                azure_endpoint=endpoint,
+                api_version=self.api_version,
+                azure_ad_token_provider=_token_provider_for(endpoint),
+                max_retries=0  # retries are handled by core.retry
             )
-            content = resp.choices[0].message.content.strip()
-            if content.startswith("```"):
-                lines = content.splitlines()
-                if len(lines) >= 2 and lines[-1].startswith("```"):
-                    return "\n".join(lines[1:-1]).strip()
-            return content
-        return retry(_call)
+        return self._clients[endpoint]
+
+    @property
+    def _replaying(self) -> bool:
+        return self.cassette is not None and self.cassette.replaying
+
+    def _completions(self, target: Target):
+        if self.cassette is None:
+            return self._client_for(target).chat.completions
+        if self._replaying and (target.endpoint or self.endpoint) not in self._clients:
+            return self.cassette.wrap_async(None).chat.completions
+        return self.cassette.wrap_async(self._client_for(target)).chat.completions
+
+    async def _complete(self, messages, max_tokens: int, temperature: float, use_cache: bool = True,
+                        stage: str = "chat") -> str:
+        started = time.perf_counter()
+        primary = self.router.targets(stage)[0].name
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = ResponseCache.make_key(primary, messages, temperature, max_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                _record_call(primary, stage, started, cache_hit=True)
+                return cached
+        attempts = []
+        last = {}
+
+        async def _call(target: Target):
+            reserved = estimate_tokens(messages, max_tokens)
+            taken = await self.rate_limiter.acquire_async(reserved) if self.rate_limiter is not None else 0
+            try:
+                # slot is held only while the request is in flight, not during retry backoff
+                async with self._semaphore:
+                    resp = await self._completions(target).create(
+                        model=target.name,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+            except BaseException:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.settle(taken, 0)
+                raise
+            if self.rate_limiter is not None and resp.usage is not None:
+                self.rate_limiter.settle(taken, resp.usage.total_tokens)
+            last["usage"] = resp.usage
+            return _strip_code_fences(resp.choices[0].message.content)
+        for target, is_last in _failover_order(self.router, stage):
+            tried = time.perf_counter()
+            try:
+                content = await async_retry(lambda: _call(target), attempts=None if is_last else 1, key=target.key,
+                                            breaker=True, on_attempt=attempts.append)
+                break
+            except Exception as e:
+                if _can_fail_over(e):
+                    self.router.record(stage, target, time.perf_counter() - tried, ok=False)
+                if is_last or not _can_fail_over(e):
+                    _record_call(target.name, stage, started, attempts=attempts, error=type(e).__name__,
+                                 max_tokens=max_tokens)
+                    raise
+                print(f"⚠️ {target.key} unavailable ({type(e).__name__}), failing over")
+        self.router.record(stage, target, time.perf_counter() - tried, ok=True)
+        _record_call(target.name, stage, started, last.get("usage"), attempts, max_tokens=max_tokens)
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+        return content
+
+    async def chat(self, system: str, user: str, max_tokens: int = 300, temperature: float = 0.0, use_cache: bool = True,
+                   stage: str = "chat") -> str:
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+        return await self._complete(messages, max_tokens, temperature, use_cache, stage)
+
+    async def chat_messages(self, messages, max_tokens: int = 300, temperature: float = 0.0, use_cache: bool = True,
+                            stage: str = "chat") -> str:
+        """Async version of ModelClient.chat_messages (rich content passed through)."""
+        return await self._complete(messages, max_tokens, temperature, use_cache, stage)
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.close()
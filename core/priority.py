@@ -0,0 +1,62 @@
+"""
+Priority Lanes
+请求优先级通道：交互式（GUI）请求优先于普通与后台批量请求，等待时间越长的请求优先级逐渐提升以防饿死
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+INTERACTIVE = "interactive"
+NORMAL = "normal"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, NORMAL, BACKGROUND)
+
+_lane: ContextVar[Optional[str]] = ContextVar("model_priority_lane", default=None)
+
+
+def _check(lane: str) -> str:
+    if lane not in LANES:
+        raise ValueError(f"Unknown priority lane '{lane}' (expected one of {', '.join(LANES)})")
+    return lane
+
+
+def current_lane() -> str:
+    """Lane of the calling thread/task; MODEL_PRIORITY_LANE sets the process default (normal)"""
+    return _lane.get() or _check(os.getenv("MODEL_PRIORITY_LANE", NORMAL))
+
+
+@contextmanager
+def priority_lane(lane: str):
+    """Send every model request made inside this block through `lane`
+
+    The lane is stored in a context variable, so it follows asyncio tasks but
+    not new threads; worker threads must enter the lane themselves.
+    """
+    token = _lane.set(_check(lane))
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def lane_rank(lane: str) -> int:
+    """0 for interactive, 1 for normal, 2 for background"""
+    return LANES.index(_check(lane))
+
+
+def aging_seconds() -> float:
+    """Seconds of waiting that promote a queued request by one lane (MODEL_PRIORITY_AGING, default 10)"""
+    return float(os.getenv("MODEL_PRIORITY_AGING", "10"))
+
+
+def quota_reserve(lane: str) -> float:
+    """Share of the RPM/TPM buckets background requests must leave for other lanes
+
+    MODEL_PRIORITY_RESERVE (default 0.2). Background work still proceeds, it
+    just stops draining the quota below the reserve, so an interactive request
+    in another process finds capacity without waiting for the batch to finish.
+    """
+    if lane != BACKGROUND:
+        return 0.0
+    return min(0.9, max(0.0, float(os.getenv("MODEL_PRIORITY_RESERVE", "0.2"))))
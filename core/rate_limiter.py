@@ -0,0 +1,220 @@
+"""
+Token-Bucket Rate Limiter
+基于令牌桶的请求/Token 速率限制器（可跨进程共享）
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .priority import current_lane, quota_reserve
+
+
+class _FileLock:
+    """Minimal cross-platform exclusive file lock (msvcrt on Windows, fcntl elsewhere)"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "a+b")
+        if os.name == "nt":
+            import msvcrt
+            self._fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+        else:
+            import fcntl
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == "nt":
+            import msvcrt
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        self._fh.close()
+        self._fh = None
+
+
+class RateLimiter:
+    """Requests-per-minute + tokens-per-minute token bucket
+
+    Both buckets start full, so short runs go at full speed; once a batch
+    drains them, callers wait just long enough for the quota to refill.
+    With state_file set, the buckets live in that file (guarded by a lock
+    file) and are shared by every process pointing at it. Background-lane
+    requests leave a reserve share of both buckets untouched so interactive
+    requests never queue behind a draining batch.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, state_file: Optional[str] = None):
+        """
+        Args:
+            rpm: Requests per minute quota (None = unlimited)
+            tpm: Tokens per minute quota (None = unlimited)
+            state_file: Optional JSON file for sharing the buckets across processes
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state_file = Path(state_file) if state_file else None
+        self._lock = threading.Lock()
+        self._state = {"requests": float(rpm or 0), "tokens": float(tpm or 0), "updated": time.time()}
+
+    @classmethod
+    def from_env(cls) -> Optional["RateLimiter"]:
+        """Build limiter from MODEL_RPM / MODEL_TPM / MODEL_RATE_LIMIT_FILE, or None if no quota is set"""
+        rpm = os.getenv("MODEL_RPM")
+        tpm = os.getenv("MODEL_TPM")
+        if not rpm and not tpm:
+            return None
+        return cls(
+            rpm=float(rpm) if rpm else None,
+            tpm=float(tpm) if tpm else None,
+            state_file=os.getenv("MODEL_RATE_LIMIT_FILE") or None
+        )
+
+    # ------------------------------------------------------------------ state
+
+    def _load(self) -> Dict[str, float]:
+        if self.state_file is None:
+            return self._state
+        try:
+            return json.loads(self.state_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {"requests": float(self.rpm or 0), "tokens": float(self.tpm or 0), "updated": time.time()}
+
+    def _save(self, state: Dict[str, float]):
+        if self.state_file is None:
+            self._state = state
+            return
+        tmp_path = self.state_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp_path, self.state_file)
+
+    def _locked(self):
+        if self.state_file is None:
+            return self._lock
+        return _FileLock(self.state_file.with_suffix(".lock"))
+
+    def _refill(self, state: Dict[str, float], now: float) -> Dict[str, float]:
+        elapsed = max(0.0, now - state["updated"])
+        if self.rpm:
+            state["requests"] = min(self.rpm, state["requests"] + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            state["tokens"] = min(self.tpm, state["tokens"] + elapsed * self.tpm / 60.0)
+        state["updated"] = now
+        return state
+
+    # ---------------------------------------------------------------- acquire
+
+    def try_acquire(self, tokens: int = 0, lane: Optional[str] = None) -> Tuple[float, int]:
+        """
+        Take one request and `tokens` tokens if available
+
+        Args:
+            tokens: Token reservation for the request
+            lane: Priority lane (default: the caller's current lane)
+
+        Returns:
+            (0.0, tokens taken) if granted, otherwise (seconds to wait before trying again, 0);
+            the tokens taken are what settle() must be given as `reserved`
+        """
+        reserve = quota_reserve(lane or current_lane())
+        if self.tpm:
+            # A single request larger than the usable quota could never fit
+            tokens = min(tokens, int(self.tpm * (1 - reserve)))
+        # Likewise the requests kept back may not leave less than one request usable (e.g. rpm=1)
+        needed = 1 + min(reserve * self.rpm, self.rpm - 1) if self.rpm and self.rpm > 1 else 1
+        with self._locked():
+            state = self._refill(self._load(), time.time())
+            wait = 0.0
+            if self.rpm and state["requests"] < needed:
+                wait = max(wait, (needed - state["requests"]) * 60.0 / self.rpm)
+            if self.tpm and state["tokens"] < tokens + reserve * self.tpm:
+                wait = max(wait, (tokens + reserve * self.tpm - state["tokens"]) * 60.0 / self.tpm)
+            if wait == 0.0:
+                if self.rpm:
+                    state["requests"] -= 1
+                if self.tpm:
+                    state["tokens"] -= tokens
+            self._save(state)
+        return wait, (tokens if wait == 0.0 else 0)
+
+    def acquire(self, tokens: int = 0, lane: Optional[str] = None) -> int:
+        """Block until the request fits the quota; returns the tokens taken (see try_acquire)"""
+        while True:
+            wait, taken = self.try_acquire(tokens, lane)
+            if wait == 0.0:
+                return taken
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0, lane: Optional[str] = None) -> int:
+        """Async version of acquire() that yields to the event loop while waiting"""
+        while True:
+            wait, taken = self.try_acquire(tokens, lane)
+            if wait == 0.0:
+                return taken
+            await asyncio.sleep(wait)
+
+    def settle(self, reserved: int, used: int):
+        """
+        Refund the difference between reserved and actually used tokens
+
+        Args:
+            reserved: Tokens taken by acquire()/try_acquire() for the request
+            used: Tokens the request actually used (0 for a request that failed or was cancelled)
+        """
+        if not self.tpm or reserved == used:
+            return
+        with self._locked():
+            state = self._refill(self._load(), time.time())
+            state["tokens"] = min(self.tpm, state["tokens"] + (reserved - used))
+            self._save(state)
+
+    def remaining(self) -> Dict[str, Optional[float]]:
+        """Currently available requests/tokens (None = unlimited)"""
+        with self._locked():
+            state = self._refill(self._load(), time.time())
+            self._save(state)
+        return {
+            "requests": state["requests"] if self.rpm else None,
+            "tokens": state["tokens"] if self.tpm else None
+        }
+
+
+def estimate_tokens(messages: list, max_tokens: int = 0) -> int:
+    """Rough quota cost of a request: ~4 chars per prompt token plus the max_tokens reservation"""
+    return len(json.dumps(messages, ensure_ascii=False)) // 4 + max_tokens
+
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Process-wide limiter built from environment variables (None when no quota is configured)"""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter.from_env()
+        return _shared_limiter
+
+
+def set_rate_limiter(limiter: Optional[RateLimiter]):
+    """Install an explicit process-wide limiter (e.g. from CLI flags)"""
+    global _shared_limiter
+    with _shared_lock:
+        _shared_limiter = limiter
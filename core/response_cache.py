@@ -0,0 +1,182 @@
+"""
+On-disk LLM Response Cache
+基于内容寻址的模型响应磁盘缓存
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / ".cache" / "llm"
+
+
+class ResponseCache:
+    """Content-addressed cache of chat completion results keyed on the full request"""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_bytes: int = 200 * 1024 * 1024,
+        max_age_seconds: float = 30 * 24 * 3600,
+        bypass: bool = False,
+        sweep_interval: float = 3600
+    ):
+        """
+        Initialize response cache
+
+        Args:
+            cache_dir: Directory for cache entries (default: <repo>/.cache/llm)
+            max_bytes: Total size limit; oldest entries are evicted beyond it
+            max_age_seconds: Entries older than this are treated as misses and removed
+            bypass: If True, lookups always miss (fresh responses are still stored)
+            sweep_interval: Seconds between full directory scans while the cache is under max_bytes
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.bypass = bypass
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Bytes on disk as of the last scan plus this process's writes since (None: not scanned yet)
+        self._size: Optional[int] = None
+        self._last_sweep = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """
+        Build cache from environment variables, or None if caching is disabled
+
+        MODEL_CACHE=1 enables the cache; MODEL_CACHE_DIR, MODEL_CACHE_MAX_MB,
+        MODEL_CACHE_MAX_AGE_DAYS and MODEL_CACHE_BYPASS tune it.
+        """
+        if os.getenv("MODEL_CACHE", "0").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            cache_dir=os.getenv("MODEL_CACHE_DIR") or None,
+            max_bytes=int(float(os.getenv("MODEL_CACHE_MAX_MB", "200")) * 1024 * 1024),
+            max_age_seconds=float(os.getenv("MODEL_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+            bypass=os.getenv("MODEL_CACHE_BYPASS", "0").lower() in ("1", "true", "yes")
+        )
+
+    @staticmethod
+    def make_key(deployment: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: int) -> str:
+        """Hash everything that influences the completion into a stable key"""
+        payload = json.dumps(
+            {
+                "deployment": deployment,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached content for key, or None on miss"""
+        path = self._path(key)
+        if self.bypass or not path.exists():
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age_seconds:
+                path.unlink()
+                with self._lock:
+                    self.misses += 1
+                return None
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            # Touch on hit so size-based eviction drops least recently used first
+            os.utime(path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return entry.get("content")
+
+    def put(self, key: str, content: str):
+        """
+        Store content for key and enforce size/age limits
+
+        The directory is only scanned (see evict) on the first write, when the
+        running size passes max_bytes, or every sweep_interval seconds, which
+        also picks up expired entries and writes from other processes.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"content": content, "created_at": time.time()}
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        try:
+            replaced = path.stat().st_size
+        except OSError:
+            replaced = 0
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data) - replaced
+            due = (self._size is None or self._size > self.max_bytes
+                   or time.monotonic() - self._last_sweep >= self.sweep_interval)
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Remove expired entries, then oldest entries until under max_bytes"""
+        if not self.cache_dir.exists():
+            return
+
+        now = time.time()
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        with self._lock:
+            self._size = total
+            self._last_sweep = time.monotonic()
+
+    def clear(self):
+        """Delete all cache entries"""
+        for path in self.cache_dir.glob("*/*.json"):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0
+        }
@@ -1,17 +1,248 @@
+import asyncio
+import random
+import threading
 import time
-from typing import Callable, TypeVar, Any
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar, Any
 
 T = TypeVar('T')
 
-def retry(fn: Callable[[], T], attempts: int = 3, backoff: float = 1.0, factor: float = 2.0) -> T:
-    last_exc: Exception | None = None
-    delay = backoff
-    for _ in range(attempts):
+# HTTP status codes worth retrying: timeout, conflict, throttling, server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Exception class names (openai / httpx / builtins) that indicate transient failures
+RETRYABLE_ERRORS = {
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "Timeout", "TimeoutException", "ConnectTimeout", "ReadTimeout", "ConnectError",
+    "RemoteProtocolError", "TimeoutError", "ConnectionError", "ConnectionResetError"
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a deployment whose circuit breaker is open."""
+
+
+@dataclass
+class AttemptRecord:
+    key: str
+    attempt: int
+    duration: float
+    error: Optional[str] = None
+    retryable: bool = False
+    sleep: float = 0.0
+
+
+def status_code_of(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after_of(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms / retry-after headers), if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3
+    backoff: float = 1.0
+    factor: float = 2.0
+    max_backoff: float = 60.0
+    jitter: bool = True
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, CircuitOpenError):
+            return False
+        code = status_code_of(exc)
+        if code is not None:
+            return code in RETRYABLE_STATUS
+        return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(exc).__mro__)
+
+    def delay(self, attempt: int, exc: BaseException) -> float:
+        """Full-jitter exponential backoff; a server Retry-After is honoured as the minimum."""
+        ceiling = min(self.max_backoff, self.backoff * (self.factor ** attempt))
+        delay = random.uniform(0, ceiling) if self.jitter else ceiling
+        retry_after = retry_after_of(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_backoff))
+        return delay
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive retryable failures; probes again after `reset_timeout`."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self, key: str = ""):
+        if self.state == "open":
+            remaining = self.reset_timeout - (time.time() - self.opened_at)
+            raise CircuitOpenError(f"circuit open for '{key}' ({remaining:.0f}s until retry)")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                # A failed half-open probe re-opens the circuit immediately
+                self.opened_at = time.time()
+
+
+class RetryMetrics:
+    """Thread-safe per-key aggregation of AttemptRecords."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, rec: AttemptRecord):
+        with self._lock:
+            m = self._data.setdefault(rec.key, {
+                "attempts": 0, "failures": 0, "retried": 0, "time": 0.0, "sleep": 0.0, "errors": {}
+            })
+            m["attempts"] += 1
+            m["time"] += rec.duration
+            m["sleep"] += rec.sleep
+            if rec.error:
+                m["failures"] += 1
+                m["errors"][rec.error] = m["errors"].get(rec.error, 0) + 1
+                if rec.retryable and rec.sleep:
+                    m["retried"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {k: {**v, "errors": dict(v["errors"])} for k, v in self._data.items()}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+retry_metrics = RetryMetrics()
+DEFAULT_POLICY = RetryPolicy()
+
+
+def get_circuit_breaker(key: str) -> CircuitBreaker:
+    with _breakers_lock:
+        return _breakers.setdefault(key, CircuitBreaker())
+
+
+def _after_failure(policy: RetryPolicy, breaker: Optional[CircuitBreaker], key: str, attempt: int,
+                   started: float, exc: Exception,
+                   on_attempt: Optional[Callable[[AttemptRecord], None]]) -> Optional[float]:
+    """Book-keeping for a failed attempt; returns the sleep before the next one, or None to give up."""
+    retryable = policy.is_retryable(exc)
+    if breaker is not None and retryable:
+        breaker.record_failure()
+    sleep = policy.delay(attempt, exc) if retryable and attempt + 1 < policy.attempts else None
+    rec = AttemptRecord(key, attempt + 1, time.perf_counter() - started, type(exc).__name__, retryable, sleep or 0.0)
+    retry_metrics.record(rec)
+    if on_attempt:
+        on_attempt(rec)
+    return sleep
+
+
+def _after_success(breaker: Optional[CircuitBreaker], key: str, attempt: int, started: float,
+                   on_attempt: Optional[Callable[[AttemptRecord], None]]):
+    if breaker is not None:
+        breaker.record_success()
+    rec = AttemptRecord(key, attempt + 1, time.perf_counter() - started)
+    retry_metrics.record(rec)
+    if on_attempt:
+        on_attempt(rec)
+
+
+def _resolve(attempts: Optional[int], backoff: Optional[float], factor: Optional[float],
+             policy: Optional[RetryPolicy]) -> RetryPolicy:
+    policy = policy or DEFAULT_POLICY
+    if attempts is None and backoff is None and factor is None:
+        return policy
+    return RetryPolicy(
+        attempts=policy.attempts if attempts is None else attempts,
+        backoff=policy.backoff if backoff is None else backoff,
+        factor=policy.factor if factor is None else factor,
+        max_backoff=policy.max_backoff,
+        jitter=policy.jitter
+    )
+
+
+def retry(fn: Callable[[], T], attempts: Optional[int] = None, backoff: Optional[float] = None,
+          factor: Optional[float] = None, policy: Optional[RetryPolicy] = None, key: str = "default",
+          breaker: bool = False, on_attempt: Optional[Callable[[AttemptRecord], None]] = None) -> T:
+    """Call fn, retrying only transient errors.
+
+    Fatal errors (auth, bad request, not found, ...) are raised on the first
+    attempt. With breaker=True, `key` (normally the deployment) gets a circuit
+    breaker that fails fast with CircuitOpenError after repeated failures.
+    Every attempt is timed and aggregated into `retry_metrics` under `key`.
+    """
+    policy = _resolve(attempts, backoff, factor, policy)
+    circuit = get_circuit_breaker(key) if breaker else None
+    for attempt in range(policy.attempts):
+        if circuit is not None:
+            circuit.before_call(key)
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            sleep = _after_failure(policy, circuit, key, attempt, started, e, on_attempt)
+            if sleep is None:
+                raise
+            time.sleep(sleep)
+            continue
+        _after_success(circuit, key, attempt, started, on_attempt)
+        return result
+    raise AssertionError("unreachable")  # pragma: no cover
+
+
+async def async_retry(fn: Callable[[], Awaitable[T]], attempts: Optional[int] = None, backoff: Optional[float] = None,
+                      factor: Optional[float] = None, policy: Optional[RetryPolicy] = None, key: str = "default",
+                      breaker: bool = False, on_attempt: Optional[Callable[[AttemptRecord], None]] = None) -> T:
+    """Coroutine counterpart of retry(); sleeps without blocking the event loop."""
+    policy = _resolve(attempts, backoff, factor, policy)
+    circuit = get_circuit_breaker(key) if breaker else None
+    for attempt in range(policy.attempts):
+        if circuit is not None:
+            circuit.before_call(key)
+        started = time.perf_counter()
         try:
-            return fn()
-        except Exception as e:  # pragma: no cover
-            last_exc = e
-            time.sleep(delay)
-            delay *= factor
-    assert last_exc is not None
-    raise last_exc
+            result = await fn()
+        except Exception as e:
+            sleep = _after_failure(policy, circuit, key, attempt, started, e, on_attempt)
+            if sleep is None:
+                raise
+            await asyncio.sleep(sleep)
+            continue
+        _after_success(circuit, key, attempt, started, on_attempt)
+        return result
+    raise AssertionError("unreachable")  # pragma: no cover
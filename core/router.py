@@ -0,0 +1,227 @@
+"""
+Multi-deployment Router
+按阶段选择部署：记录各部署的滚动 p50/p95 延迟与错误率，支持故障转移与负载均衡
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .retry import get_circuit_breaker
+
+
+STRATEGIES = ("failover", "balanced")
+
+
+@dataclass(frozen=True)
+class Target:
+    """One deployment on one Azure OpenAI endpoint"""
+    name: str
+    endpoint: Optional[str] = None  # None: AZURE_OPENAI_ENDPOINT
+
+    @property
+    def key(self) -> str:
+        """Key for circuit breakers, retry metrics and latency stats"""
+        if not self.endpoint:
+            return self.name
+        return f"{self.name}@{urlparse(self.endpoint).hostname or self.endpoint}"
+
+
+def parse_routes(spec: str) -> Dict[str, List[Target]]:
+    """
+    Parse MODEL_ROUTES, e.g.
+    "evaluate=gpt-4.1-mini,gpt-4.1;analyze=gpt-4.1-mini;generate=gpt-4.1,gpt-4.1@https://eu.openai.azure.com/"
+
+    Returns:
+        {stage: [Target, ...]} in preference order
+    """
+    routes = {}
+    for entry in spec.split(";"):
+        if not entry.strip():
+            continue
+        stage, _, targets = entry.partition("=")
+        if not targets.strip():
+            raise ValueError(f"MODEL_ROUTES entry '{entry.strip()}' has no deployments")
+        routes[stage.strip()] = [
+            Target(*[part.strip() for part in item.split("@", 1)])
+            for item in targets.split(",") if item.strip()
+        ]
+    return routes
+
+
+class LatencyStats:
+    """Rolling window of call outcomes for one stage on one deployment
+
+    Samples older than `max_age` seconds are dropped, so a deployment that
+    failed for a while is judged on fresh calls once it has recovered.
+    Recording and reading are guarded by `lock` (the router's, when the
+    stats belong to a Router), and readers work on a copy.
+    """
+
+    def __init__(self, window: int = 50, max_age: Optional[float] = None, lock: Optional[threading.RLock] = None):
+        self.max_age = max_age
+        self._entries: Deque[Tuple[float, float, bool]] = deque(maxlen=window)  # (recorded at, latency, ok)
+        self._lock = lock or threading.RLock()
+
+    def _expire(self):
+        """Drop entries older than max_age (lock held)"""
+        if self.max_age is not None:
+            cutoff = time.monotonic() - self.max_age
+            while self._entries and self._entries[0][0] < cutoff:
+                self._entries.popleft()
+
+    @property
+    def samples(self) -> List[Tuple[float, bool]]:
+        """(latency, ok) of the calls still inside the window, oldest first"""
+        with self._lock:
+            self._expire()
+            return [(latency, ok) for _, latency, ok in self._entries]
+
+    def add(self, latency: float, ok: bool):
+        with self._lock:
+            self._expire()
+            self._entries.append((time.monotonic(), latency, ok))
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile (0-100) over successful calls; None without data"""
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(q / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    @property
+    def error_rate(self) -> float:
+        samples = self.samples
+        if not samples:
+            return 0.0
+        return sum(1 for _, ok in samples if not ok) / len(samples)
+
+
+class Router:
+    """Choose deployments per stage and learn from call outcomes
+
+    Each stage maps to a preference-ordered list of targets; stages without a
+    route use the default deployment. ``candidates`` returns the order in which
+    a call should try targets:
+
+    - failover: preference order, with unhealthy targets (open circuit breaker
+      or error rate above `max_error_rate`) moved to the back; outcomes expire
+      after `max_age` seconds, so a demoted target is tried first again once
+      its failures have aged out
+    - balanced: one healthy target picked with probability proportional to
+      1 / p50 latency (targets without data are tried first), then the rest
+      in failover order
+    """
+
+    def __init__(self, routes: Dict[str, List[Target]], default: Target, strategy: str = "failover",
+                 max_error_rate: float = 0.5, min_samples: int = 4, window: int = 50,
+                 max_age: Optional[float] = 300.0):
+        """
+        Args:
+            routes: {stage: [Target, ...]} in preference order
+            default: Target for stages without a route
+            strategy: "failover" or "balanced"
+            max_error_rate: Error rate above which a target is treated as unhealthy
+            min_samples: Samples needed before the error rate is trusted
+            window: Calls kept per stage/target for percentiles and error rate
+            max_age: Seconds a call outcome counts (None: until pushed out of the window)
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown routing strategy '{strategy}' (expected one of {', '.join(STRATEGIES)})")
+        self.routes = routes
+        self.default = default
+        self.strategy = strategy
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.max_age = max_age
+        self._stats: Dict[Tuple[str, str], LatencyStats] = {}
+        self._lock = threading.RLock()  # also guards every LatencyStats of this router
+
+    @classmethod
+    def from_env(cls, deployment: Optional[str] = None) -> "Router":
+        """Build from MODEL_ROUTES / MODEL_ROUTING_STRATEGY / MODEL_ROUTE_MAX_AGE; a pinned deployment disables routing"""
+        default = Target(deployment or os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4.1"))
+        routes = {} if deployment else parse_routes(os.getenv("MODEL_ROUTES", ""))
+        return cls(routes, default, strategy=os.getenv("MODEL_ROUTING_STRATEGY", "failover"),
+                   max_age=float(os.getenv("MODEL_ROUTE_MAX_AGE", "300")))
+
+    def targets(self, stage: str) -> List[Target]:
+        """Configured targets for a stage in preference order"""
+        return self.routes.get(stage) or [self.default]
+
+    def stats(self, stage: str, target: Target) -> LatencyStats:
+        with self._lock:
+            return self._stats.setdefault((stage, target.key), LatencyStats(self.window, self.max_age, self._lock))
+
+    def healthy(self, stage: str, target: Target) -> bool:
+        if get_circuit_breaker(target.key).state == "open":
+            return False
+        stats = self.stats(stage, target)
+        return len(stats.samples) < self.min_samples or stats.error_rate <= self.max_error_rate
+
+    def candidates(self, stage: str) -> List[Target]:
+        """Targets to try for one call, best first"""
+        targets = self.targets(stage)
+        healthy = [t for t in targets if self.healthy(stage, t)]
+        ordered = healthy + [t for t in targets if t not in healthy]
+        if self.strategy == "balanced" and len(healthy) > 1:
+            p50s = [self.stats(stage, t).percentile(50) for t in healthy]
+            untried = [t for t, p in zip(healthy, p50s) if p is None]
+            if untried:
+                first = untried[0]
+            else:
+                first = random.choices(healthy, weights=[1.0 / max(p, 1e-3) for p in p50s])[0]
+            ordered.remove(first)
+            ordered.insert(0, first)
+        return ordered
+
+    def record(self, stage: str, target: Target, latency: float, ok: bool):
+        self.stats(stage, target).add(latency, ok)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """{"stage/deployment": {"calls", "p50", "p95", "error_rate"}}"""
+        with self._lock:
+            return {
+                f"{stage}/{key}": {
+                    "calls": len(stats.samples),
+                    "p50": stats.percentile(50),
+                    "p95": stats.percentile(95),
+                    "error_rate": stats.error_rate
+                }
+                for (stage, key), stats in list(self._stats.items())
+            }
+
+    def format_stats(self) -> str:
+        """Human-readable latency/error table per stage and deployment"""
+        lines = ["🧭 Deployment latency:"]
+        for name, s in sorted(self.snapshot().items()):
+            p50 = f"{s['p50']:.1f}s" if s["p50"] is not None else "-"
+            p95 = f"{s['p95']:.1f}s" if s["p95"] is not None else "-"
+            lines.append(f"   {name:<32} {s['calls']:>4} calls  p50 {p50:>7}  p95 {p95:>7}  errors {s['error_rate']:.0%}")
+        return "\n".join(lines)
+
+
+_router: Optional[Router] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Router:
+    """Process-wide router built from MODEL_ROUTES (every stage → AZURE_OPENAI_DEPLOYMENT when unset)"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = Router.from_env()
+        return _router
+
+
+def set_router(router: Optional[Router]):
+    """Replace the process-wide router (None: rebuild from the environment on next use)"""
+    global _router
+    with _router_lock:
+        _router = router
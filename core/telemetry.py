@@ -0,0 +1,139 @@
+"""
+Per-call LLM Telemetry
+记录每次模型调用的 Token 用量、延迟与重试次数（JSONL 输出 + 进程内汇总）
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+@dataclass
+class CallRecord:
+    """One model call as seen by the caller (all retry attempts included)"""
+    stage: str
+    deployment: str
+    latency: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    retries: int = 0
+    hedges: int = 0
+    cache_hit: bool = False
+    coalesced: bool = False
+    streamed: bool = False
+    max_tokens: int = 0
+    truncated: bool = False
+    error: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+def usage_fields(usage) -> Dict[str, int]:
+    """Extract prompt/completion/cached token counts from an OpenAI usage object"""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0
+    }
+
+
+def prefix_cache_rate(stage_summary: Dict[str, float]) -> float:
+    """Share of prompt tokens the provider served from its prompt-prefix cache"""
+    prompt = stage_summary.get("prompt_tokens", 0)
+    return stage_summary.get("cached_tokens", 0) / prompt if prompt else 0.0
+
+
+class Telemetry:
+    """Collects CallRecords, appends them to an optional JSONL sink and aggregates per stage"""
+
+    def __init__(self, sink_path: Optional[str] = None):
+        """
+        Args:
+            sink_path: Optional JSONL file; one line is appended per call
+        """
+        self.sink_path = Path(sink_path) if sink_path else None
+        self.records: List[CallRecord] = []
+        self._lock = threading.Lock()
+
+    def record(self, rec: CallRecord):
+        with self._lock:
+            self.records.append(rec)
+            if self.sink_path is not None:
+                self.sink_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.sink_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(asdict(rec), ensure_ascii=False) + "\n")
+
+    def mark(self) -> int:
+        """Position to pass as `since` to summarize only calls made afterwards"""
+        with self._lock:
+            return len(self.records)
+
+    def summary(self, since: int = 0) -> Dict[str, Dict[str, float]]:
+        """Totals per stage plus an overall "total" entry"""
+        with self._lock:
+            records = self.records[since:]
+
+        stages: Dict[str, Dict[str, float]] = {}
+        for rec in records:
+            for key in (rec.stage, "total"):
+                s = stages.setdefault(key, {
+                    "calls": 0, "cache_hits": 0, "coalesced": 0, "errors": 0, "retries": 0, "hedges": 0, "latency": 0.0,
+                    "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "max_tokens": 0, "truncated": 0
+                })
+                s["calls"] += 1
+                s["cache_hits"] += int(rec.cache_hit)
+                s["coalesced"] += int(rec.coalesced)
+                s["errors"] += int(rec.error is not None)
+                s["retries"] += rec.retries
+                s["hedges"] += rec.hedges
+                s["latency"] += rec.latency
+                s["prompt_tokens"] += rec.prompt_tokens
+                s["completion_tokens"] += rec.completion_tokens
+                s["cached_tokens"] += rec.cached_tokens
+                s["max_tokens"] += rec.max_tokens
+                s["truncated"] += int(rec.truncated)
+        return stages
+
+    def format_summary(self, since: int = 0) -> str:
+        """Human-readable per-stage table, sorted by total latency"""
+        stages = self.summary(since)
+        if not stages:
+            return "📈 LLM usage: no model calls"
+
+        lines = [
+            "📈 LLM usage by stage:",
+            f"   {'stage':<10} {'calls':>5} {'hits':>5} {'retry':>5} {'hedge':>5} {'prompt':>8} {'cached':>8} {'output':>8} {'reserved':>9} {'latency':>9}"
+        ]
+        total = stages.pop("total")
+        ordered = sorted(stages.items(), key=lambda kv: kv[1]["latency"], reverse=True)
+        for name, s in ordered + [("total", total)]:
+            lines.append(
+                f"   {name:<10} {s['calls']:>5} {s['cache_hits']:>5} {s['retries']:>5} {s['hedges']:>5} "
+                f"{s['prompt_tokens']:>8} {s['cached_tokens']:>8} {s['completion_tokens']:>8} {s['max_tokens']:>9} {s['latency']:>8.1f}s"
+            )
+        if total["prompt_tokens"]:
+            lines.append(f"   prompt prefix cache: {prefix_cache_rate(total):.0%} of prompt tokens served from cache")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+
+
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    """Process-wide telemetry; MODEL_TELEMETRY_FILE enables the JSONL sink"""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry(os.getenv("MODEL_TELEMETRY_FILE") or None)
+        return _telemetry
@@ -1,9 +1,11 @@
 import json
+import os
 import time
 from typing import Dict, Any, List
 
 from dotenv import load_dotenv
 from core.model_client import ModelClient
+from core.rate_limiter import RateLimiter, set_rate_limiter
 
 ACTION_PROMPT_TEMPLATE = (
     "You are an expert Windows automation engineer. Given a test step's action description, "
@@ -33,20 +35,23 @@ VERIFY_PROMPT_TEMPLATE = (
 def generate_scripts_for_step(client: ModelClient, action: str, expected: str) -> Dict[str, str]:
     """使用 ModelClient 生成 action 和 verify 脚本"""
     action_prompt = ACTION_PROMPT_TEMPLATE.format(action=action.strip())
-    action_script = client.chat("You output only raw PowerShell.", action_prompt, max_tokens=300)
+    action_script = client.chat("You output only raw PowerShell.", action_prompt, max_tokens=300, stage="action")
     
     result = {"action_script": action_script}
     
     if expected and expected.strip():
         verify_prompt = VERIFY_PROMPT_TEMPLATE.format(action=action.strip(), expected=expected.strip())
-        verify_script = client.chat("You output only raw PowerShell.", verify_prompt, max_tokens=300)
+        verify_script = client.chat("You output only raw PowerShell.", verify_prompt, max_tokens=300, stage="verify")
         result["verify_script"] = verify_script
     
     return result
 
 
-def enrich_test_case(input_path: str, output_path: str, rate_limit_sec: float = 1.0) -> Dict[str, Any]:
-    """读取测试用例 JSON，为每个步骤生成 PowerShell 脚本"""
+def enrich_test_case(input_path: str, output_path: str) -> Dict[str, Any]:
+    """读取测试用例 JSON，为每个步骤生成 PowerShell 脚本
+
+    限流由 ModelClient 内的共享令牌桶（core.rate_limiter）负责，步骤之间不再固定休眠。
+    """
     with open(input_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
@@ -71,8 +76,6 @@ def enrich_test_case(input_path: str, output_path: str, rate_limit_sec: float =
         if 'verify_script' in scripts:
             enriched['verify_script'] = scripts['verify_script']
         enriched_steps.append(enriched)
-        
-        time.sleep(rate_limit_sec)
 
     enriched_data = {
         "test_case_id": data.get("test_case_id"),
@@ -97,7 +100,9 @@ def main():
     )
     parser.add_argument('-i', '--input', required=True, help='输入的测试用例 JSON 文件路径')
     parser.add_argument('-o', '--output', help='输出的增强 JSON 文件路径（默认：输入文件名.enriched.json）')
-    parser.add_argument('--no-wait', action='store_true', help='不在 API 调用之间等待（可能触发限流）')
+    parser.add_argument('--rpm', type=float, help='部署配额：每分钟请求数（默认读取 MODEL_RPM，未设置则不限流）')
+    parser.add_argument('--tpm', type=float, help='部署配额：每分钟 Token 数（默认读取 MODEL_TPM）')
+    parser.add_argument('--rate-limit-file', help='多进程共享限流状态的文件路径（默认读取 MODEL_RATE_LIMIT_FILE）')
     args = parser.parse_args()
 
     # 自动生成输出文件名
@@ -105,13 +110,14 @@ def main():
         input_name = args.input.replace('.json', '')
         args.output = f"{input_name}.enriched.json"
     
-    wait = 0.0 if args.no_wait else 1.0
+    if args.rpm or args.tpm:
+        set_rate_limiter(RateLimiter(rpm=args.rpm, tpm=args.tpm, state_file=args.rate_limit_file or os.getenv('MODEL_RATE_LIMIT_FILE')))
     
     print(f"📖 读取输入: {args.input}")
     print(f"🔐 使用 Azure AD 无密钥认证")
-    print(f"⏱️  API 调用间隔: {wait}秒\n")
+    print(f"⏱️  限流配额: RPM={args.rpm or os.getenv('MODEL_RPM', '-')} TPM={args.tpm or os.getenv('MODEL_TPM', '-')}\n")
     
-    result = enrich_test_case(args.input, args.output, rate_limit_sec=wait)
+    result = enrich_test_case(args.input, args.output)
     
     print(f"\n✅ 完成！已写入 {args.output}")
     print(f"   生成了 {len(result.get('steps', []))} 个步骤的脚本")
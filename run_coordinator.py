@@ -3,11 +3,13 @@
 包含记忆、优化、反射等高级特性
 """
 import json
+import os
 import argparse
 from dotenv import load_dotenv
 from core.schemas import TestCase
 from core.memory import GlobalSummaryMemory
 from core.model_client import ModelClient
+from core.rate_limiter import RateLimiter, set_rate_limiter
 from agents.action_agent import ActionScriptAgent
 from agents.verify_agent import VerifyScriptAgent
 from agents.refiner_agent import RefinerAgent
@@ -23,7 +25,9 @@ def main():
     )
     parser.add_argument('-i', '--input', required=True, help='输入的测试用例 JSON 文件')
     parser.add_argument('-o', '--output', help='输出文件路径（默认：<input>.coordinator.json）')
-    parser.add_argument('--rate-limit', type=float, default=0.5, help='API 调用间隔秒数（默认 0.5）')
+    parser.add_argument('--rpm', type=float, help='部署配额：每分钟请求数（默认读取 MODEL_RPM，未设置则不限流）')
+    parser.add_argument('--tpm', type=float, help='部署配额：每分钟 Token 数（默认读取 MODEL_TPM）')
+    parser.add_argument('--rate-limit-file', help='多进程共享限流状态的文件路径（默认读取 MODEL_RATE_LIMIT_FILE）')
     args = parser.parse_args()
     
     # 读取测试用例（支持UTF-8和UTF-16编码）
@@ -45,8 +49,10 @@ def main():
     # 初始化系统
     print("🔐 使用 Azure AD 无密钥认证")
     print(f"📖 读取输入: {args.input}")
-    print(f"⏱️  API 调用间隔: {args.rate_limit}秒\n")
+    print(f"⏱️  限流配额: RPM={args.rpm or '-'} TPM={args.tpm or '-'}\n")
     
+    if args.rpm or args.tpm:
+        set_rate_limiter(RateLimiter(rpm=args.rpm, tpm=args.tpm, state_file=args.rate_limit_file or os.getenv('MODEL_RATE_LIMIT_FILE')))
     client = ModelClient()
     memory = GlobalSummaryMemory()
     
@@ -68,7 +74,8 @@ def main():
     
     # 运行
     print("🚀 开始生成增强测试用例...\n")
-    result = coordinator.run(test_case, args.output, rate_limit_sec=args.rate_limit)
+    # 限流由 ModelClient 的共享令牌桶负责，不再在步骤之间固定休眠
+    result = coordinator.run(test_case, args.output, rate_limit_sec=0.0)
     
     print(f"\n✅ 完成！已写入 {args.output}")
     print(f"   生成了 {len(result.steps)} 个步骤的脚本")
@@ -3,6 +3,7 @@ import json
 from dotenv import load_dotenv
 from core.schemas import TestCase
 from core.model_client import ModelClient
+from core.rate_limiter import RateLimiter, set_rate_limiter
 from core.memory import GlobalSummaryMemory
 from agents.action_agent import ActionScriptAgent
 from agents.verify_agent import VerifyScriptAgent
@@ -17,9 +18,14 @@ def main():
     parser = argparse.ArgumentParser(description="Multi-agent test step enrichment")
     parser.add_argument('-i', '--input', default='34717304.json')
     parser.add_argument('-o', '--output', default='outputs/34717304.enriched.json')
-    parser.add_argument('--rate', type=float, default=0.5, help='Sleep seconds between steps')
+    parser.add_argument('--rpm', type=float, help='Deployment requests-per-minute quota (default: MODEL_RPM, unlimited if unset)')
+    parser.add_argument('--tpm', type=float, help='Deployment tokens-per-minute quota (default: MODEL_TPM)')
+    parser.add_argument('--rate-limit-file', help='Shared limiter state file for multi-process runs (default: MODEL_RATE_LIMIT_FILE)')
     args = parser.parse_args()
 
+    if args.rpm or args.tpm:
+        set_rate_limiter(RateLimiter(rpm=args.rpm, tpm=args.tpm, state_file=args.rate_limit_file or os.getenv('MODEL_RATE_LIMIT_FILE')))
+
     with open(args.input, 'r', encoding='utf-8') as f:
         raw = json.load(f)
     test_case = TestCase(**raw)
@@ -32,7 +38,8 @@ def main():
     persistence = PersistenceAgent()
     coordinator = CoordinatorAgent(action_agent, verify_agent, refiner, persistence, memory, model_client.deployment)
 
-    enriched = coordinator.run(test_case, args.output, rate_limit_sec=args.rate)
+    # Throttling is handled by the shared token bucket inside ModelClient
+    enriched = coordinator.run(test_case, args.output, rate_limit_sec=0.0)
     print(f"Wrote {args.output} with {len(enriched.steps)} steps")
 
 
@@ -22,9 +22,8 @@ def _build_prompt(expected: str) -> str:
 
 
 def _call(img_b64: str, prompt: str, override: str | None) -> str:
-	model = ModelClient()
-	if override:
-		model.deployment = override
+	# an explicit override pins the deployment; otherwise MODEL_ROUTES decides for the 'vision' stage
+	model = ModelClient(deployment=override or None)
 	messages = [
 		{
 			'role': 'user',
@@ -34,7 +33,7 @@ def _call(img_b64: str, prompt: str, override: str | None) -> str:
 			]
 		}
 	]
-	return model.chat_messages(messages, temperature=0.0, max_tokens=300)
+	return model.chat_messages(messages, temperature=0.0, max_tokens=300, stage='vision')
 
 
 def _extract(raw: str) -> dict: